@@ -3,42 +3,58 @@
 import pulumi
 
 from pulumi import Output, export, get_stack
-from pulumi_aws import Provider, ecr, ecs, ec2, lb, get_availability_zones, autoscaling, iam, cloudwatch
-import pulumi_awsx as awsx
-import json
+from pulumi_aws import Provider, ecr, ecs, ec2, iam
 import os
 
+import profiling
+from egress import create_egress, uses_endpoints
+from images import ImageCache
+from load_balancing import LOAD_BALANCING_MODES, create_shared_load_balancer, rule_priorities
+from service import FargateWebService, load_service_specs
+from service_connect import create_service_connect, service_connect_settings
+from subnets import DEFAULT_RESERVED_AZS, DEFAULT_TIERS, plan_subnets
+from zones import DEFAULT_CACHE_TTL, resolve_availability_zones
+
+# Opt-in, see PULUMI_PROFILE in profiling.py
+profiling.install()
+
+config = pulumi.Config()
+region = pulumi.Config("aws").require("region")
+
 azs_state =  os.environ.get("AZS_STATE", "available")
 
-azs = get_availability_zones(state=azs_state)
+# Pinned, cached or looked up zones, see `availability_zones` in stack config
+az_settings = config.get_object("availability_zones") or {}
+azs = resolve_availability_zones(region=region,
+                                 state=azs_state,
+                                 count=az_settings.get("count", 2),
+                                 pinned=az_settings.get("pinned"),
+                                 cache_ttl=az_settings.get("cache_ttl", DEFAULT_CACHE_TTL))
 
 # Define shared tags
 stack_name = get_stack()
 tags = {
-    'environment': 'dev',
+    'environment': config.get("environment") or stack_name,
     'stack_name': stack_name,
 }
 
-# Create the ECR Repositories for web-api and web-ui
-web_ui_repo = awsx.ecr.Repository('web-ui-repo', tags=tags, force_delete=True)
-web_api_repo = awsx.ecr.Repository(
-    'web-api-repo', tags=tags, force_delete=True)
+# Subnet CIDRs per tier and AZ, sized from `subnets` in stack config
+subnet_settings = config.get_object("subnets") or {}
+vpc_cidr_block = subnet_settings.get("vpc_cidr", "10.3.0.0/16")
+subnet_plan = plan_subnets(vpc_cidr_block, len(azs),
+                           subnet_settings.get("tiers", DEFAULT_TIERS),
+                           reserved_azs=subnet_settings.get("reserved_azs", DEFAULT_RESERVED_AZS),
+                           start=subnet_settings.get("start"))
 
-# Build and publish the docker image
-web_ui_image = awsx.ecr.Image("web-ui-image",
-                              repository_url=web_ui_repo.url,
-                              dockerfile="../infra-team-test/infra-web/Dockerfile",
-                              path="../infra-team-test")
-
-# Build and publish the docker image
-web_api_image = awsx.ecr.Image("web-api-image",
-                               repository_url=web_api_repo.url,
-                               dockerfile="../infra-team-test/infra-api/Dockerfile",
-                               path="../infra-team-test")
+# How private subnets reach AWS APIs and the internet, see `egress` in stack config
+egress_settings = config.get_object("egress") or {}
 
 # Create a new VPC
-vpc = ec2.Vpc(stack_name+"-vpc", cidr_block="10.3.0.0/16",
-              enable_dns_support=True, tags=tags)
+vpc = ec2.Vpc(stack_name+"-vpc", cidr_block=vpc_cidr_block,
+              enable_dns_support=True,
+              # interface endpoints with private DNS need DNS hostnames
+              enable_dns_hostnames=True if uses_endpoints(egress_settings) else None,
+              tags=tags)
 
 igw = ec2.InternetGateway("igw", vpc_id=vpc.id, tags=tags)
 
@@ -49,11 +65,13 @@ public_subnet_ids = []
 public_subnet_cidr_blocks = []
 private_subnet_ids = []
 private_subnet_cidr_blocks = []
+isolated_subnet_ids = []
+if "isolated" in subnet_plan:
+    isolated_route_table = ec2.RouteTable("isolated-route-table", vpc_id=vpc.id, tags=tags)
+
 # Create a public subnet within the VPC
-for i, az in enumerate(azs.names, 1):
-    if i > 2:  # only create 2 subnets in 2 AZs
-        break
-    public_cidr_block = f"10.3.1.{i*64}/26"
+for i, az in enumerate(azs, 1):
+    public_cidr_block = subnet_plan["public"][i-1]
     public_subnet_cidr_blocks.append(public_cidr_block)
     # public subnet
     public_subnet = ec2.Subnet(f"public-subnet-{i}",
@@ -67,15 +85,8 @@ for i, az in enumerate(azs.names, 1):
     public_route_table_associaition = ec2.RouteTableAssociation(
         f"public-subnet-association-{i}", route_table_id=public_route_table.id, subnet_id=public_subnet.id)
 
-    eip = ec2.Eip(f'nat-eip-{i}')
-    nat_gateway = ec2.NatGateway(f"nat-gateway-{i}",
-                                 allocation_id=eip.id,
-                                 subnet_id=public_subnet.id,
-                                 tags=tags
-                                 )
-
     # private subnet
-    private_cidr_block = f"10.3.2.{i*64}/26"
+    private_cidr_block = subnet_plan["private"][i-1]
     private_subnet_cidr_blocks.append(private_cidr_block)
     private_subnet = ec2.Subnet(f"private-subnet-{i}",
                                 vpc_id=vpc.id,
@@ -84,12 +95,27 @@ for i, az in enumerate(azs.names, 1):
                                 tags=tags
                                 )
     private_subnet_ids.append(private_subnet.id)
-    private_route_table = ec2.RouteTable(f"private-route-table-{i}", vpc_id=vpc.id, routes=[
-                                         ec2.RouteTableRouteArgs(cidr_block="0.0.0.0/0", nat_gateway_id=nat_gateway.id)], tags=tags)
-
-    private_route_table_associaition = ec2.RouteTableAssociation(
-        f"private-subnet-association-{i}", route_table_id=private_route_table.id, subnet_id=private_subnet.id)
 
+    # isolated subnet, no route out of the VPC
+    if "isolated" in subnet_plan:
+        isolated_subnet = ec2.Subnet(f"isolated-subnet-{i}",
+                                     vpc_id=vpc.id,
+                                     cidr_block=subnet_plan["isolated"][i-1],
+                                     availability_zone=az,
+                                     tags=tags
+                                     )
+        isolated_subnet_ids.append(isolated_subnet.id)
+        ec2.RouteTableAssociation(
+            f"isolated-subnet-association-{i}", route_table_id=isolated_route_table.id, subnet_id=isolated_subnet.id)
+
+# NAT gateways, private route tables and VPC endpoints
+private_route_table_ids = create_egress(egress_settings,
+                                        region=region,
+                                        vpc_id=vpc.id,
+                                        vpc_cidr_block=vpc_cidr_block,
+                                        public_subnet_ids=public_subnet_ids,
+                                        private_subnet_ids=private_subnet_ids,
+                                        tags=tags)
 
 # # Security
 # # NACL
@@ -168,101 +194,6 @@ for i, az in enumerate(azs.names, 1):
 #                                          to_port=0)
 
 
-# SG
-web_ui_lb_sg = ec2.SecurityGroup('web-ui-lb-sg',
-                                 description='Allow inbound access from 80 for web-ui',
-                                 vpc_id=vpc.id,
-                                 ingress=[
-
-                                     ec2.SecurityGroupIngressArgs(
-                                         protocol='tcp',
-                                         from_port=80,
-                                         to_port=80,
-                                         cidr_blocks=['0.0.0.0/0'],
-                                     )
-                                 ],
-                                 egress=[
-                                     ec2.SecurityGroupEgressArgs(
-                                         protocol='-1',
-                                         from_port=0,
-                                         to_port=0,
-                                         cidr_blocks=['0.0.0.0/0'],
-                                     )
-                                 ],
-                                 tags=tags,
-                                 )
-
-web_ui_app_sg = ec2.SecurityGroup('web-ui-app-sg',
-                                  description='Allow inbound access from 5000 for web-ui',
-                                  vpc_id=vpc.id,
-                                  ingress=[
-
-                                      ec2.SecurityGroupIngressArgs(
-                                          protocol='tcp',
-                                          from_port=5000,
-                                          to_port=5000,
-                                          security_groups=[web_ui_lb_sg.id]
-                                      )
-                                  ],
-                                  egress=[
-                                      ec2.SecurityGroupEgressArgs(
-                                          protocol='-1',
-                                          from_port=0,
-                                          to_port=0,
-                                          cidr_blocks=['0.0.0.0/0'],
-                                      )
-                                  ],
-                                  tags=tags,
-                                  )
-
-web_api_lb_sg = ec2.SecurityGroup('web-api-lb-sg',
-                                  description='Allow inbound access from the public subnet',
-                                  vpc_id=vpc.id,
-                                  ingress=[
-                                      ec2.SecurityGroupIngressArgs(
-                                          protocol='tcp',
-                                          from_port=5000,
-                                          to_port=5000,
-                                        cidr_blocks=public_subnet_cidr_blocks
-                                        #   cidr_blocks=['0.0.0.0/0'],
-                                      )
-                                  ],
-                                  egress=[
-                                      ec2.SecurityGroupEgressArgs(
-                                          protocol="-1",
-                                          from_port=0,
-                                          to_port=0,
-                                          cidr_blocks=['0.0.0.0/0'],
-                                      )
-                                  ],
-                                  tags=tags,
-                                  )
-
-web_api_app_sg = ec2.SecurityGroup('web-api-app-sg',
-                                   description='Allow inbound access from the public subnet',
-                                   vpc_id=vpc.id,
-                                   ingress=[
-                                       ec2.SecurityGroupIngressArgs(
-                                           protocol='tcp',
-                                           from_port=5000,
-                                           to_port=5000,
-                                           #    cidr_blocks=public_subnet_cidr_blocks+private_subnet_cidr_blocks
-                                           security_groups=[web_api_lb_sg.id],
-                                       )
-                                   ],
-                                   egress=[
-                                       ec2.SecurityGroupEgressArgs(
-                                           protocol="-1",
-                                           from_port=0,
-                                           to_port=0,
-                                           cidr_blocks=['0.0.0.0/0'],
-                                       )
-                                   ],
-                                   tags=tags,
-                                   )
-
-
-
 # Create the ECS Cluster
 cluster_name = "web-cluster"
 cluster = ecs.Cluster(cluster_name,
@@ -275,34 +206,10 @@ cluster = ecs.Cluster(cluster_name,
 
                       )
 
-web_ui_target_group = lb.TargetGroup('web-ui-tg',
-                                     port=5000,
-                                     protocol='HTTP',
-                                     target_type='ip',
-                                     vpc_id=vpc.id,
-                                     health_check={
-                                         "enabled": True,
-                                         "path": "/",  # health check path
-                                         "interval": 30,
-                                         "protocol": "HTTP",
-                                         "matcher": "200"
-                                     },
-                                     tags=tags
-                                     )
-web_api_target_group = lb.TargetGroup('web-api-tg',
-                                      port=5000,
-                                      protocol='HTTP',
-                                      target_type='ip',
-                                      vpc_id=vpc.id,
-                                      health_check={
-                                          "enabled": True,
-                                          "path": "/WeatherForecast",  # health check path
-                                          "interval": 30,
-                                          "protocol": "HTTP",
-                                          "matcher": "200"
-                                      },
-                                      tags=tags
-                                      )
+# Let services run on Spot, see `capacity` in the service specs
+cluster_capacity_providers = ecs.ClusterCapacityProviders(f"{cluster_name}-capacity-providers",
+                                                          cluster_name=cluster.name,
+                                                          capacity_providers=["FARGATE", "FARGATE_SPOT"])
 
 # Create IAM role
 task_exec_role = iam.Role('task-exec-role',
@@ -339,7 +246,8 @@ iam.RolePolicyAttachment('ecs-ecr-role-attachment',
 
 # Create the CloudWatch policy
 cloudwatch_policy = iam.Policy('cloudwatchPolicy',
-                               name='cloudwatchPolicy',
+                               # IAM names are account-wide, every stack needs its own
+                               name=f'cloudwatchPolicy-{stack_name}',
                                description="A policy that allows a task to create and manage CloudWatch logs",
                                policy=pulumi.Output.all().apply(lambda _: {
                                    'Version': '2012-10-17',
@@ -362,162 +270,55 @@ iam.RolePolicyAttachment('ecs-cloudwatch-policy-attachment',
                          policy_arn=cloudwatch_policy.arn
                          )
 
-web_ui_lb = lb.LoadBalancer(
-    "web-ui-lb", security_groups=[web_ui_lb_sg.id], subnets=public_subnet_ids, internal=False, tags=tags)
-web_api_lb = lb.LoadBalancer(
-    "web-api-lb", security_groups=[web_api_lb_sg.id], subnets=private_subnet_ids, internal=True, tags=tags)
-
-
-web_ui_listener = lb.Listener("web-ui-listener",
-                              load_balancer_arn=web_ui_lb.arn,
-                              port=80,
-                              protocol="HTTP",
-                              default_actions=[lb.ListenerDefaultActionArgs(
-                                  type="forward",
-                                  target_group_arn=web_ui_target_group.arn,
-                              )], tags=tags)
-
-
-web_api_listener = lb.Listener("web-api-listener",
-                               load_balancer_arn=web_api_lb.arn,
-                               port=5000,
-                               protocol="HTTP",
-                               default_actions=[lb.ListenerDefaultActionArgs(
-                                   type="forward",
-                                   target_group_arn=web_api_target_group.arn,
-                               )], tags=tags)
-
-# Create a new CloudWatch LogGroup
-log_group = cloudwatch.LogGroup('containerLogGroup')
-
-# Create a new ECS Task Definition
-web_ui_container_definitions = pulumi.Output.all(web_ui_image.image_uri, web_api_lb.dns_name, log_group.name).apply(lambda args: json.dumps([{
-    "name": "web-ui-container",
-    "image": args[0],
-    "environment": [{
-        "name": "ApiAddress",
-        "value": f"http://{args[1]}:5000/WeatherForecast"
-    },
-        #     {
-        #     "name": "ASPNETCORE_ENVIRONMENT",
-        #     "value": "Development"
-        # }
-    ],
-    "cpu": 256,
-    "memory": 512,
-    "portMappings": [{
-        "containerPort": 5000,
-        "hostPort": 5000,
-        "protocol": "tcp"
-    }],
-    "logConfiguration": {
-        "logDriver": "awslogs",
-        "options": {
-            "awslogs-group": args[2],
-            "awslogs-region": "us-east-2",
-            "awslogs-stream-prefix": "web"
-        }
-    },
-}]))
-
-web_api_container_definitions = pulumi.Output.all(web_api_image.image_uri, log_group.name).apply(lambda args: json.dumps([{
-    "name": "web-api-container",
-    "image": args[0],
-    "environment": [
-        {
-            "name": "ASPNETCORE_ENVIRONMENT",
-            "value": "Development"
-        }
-    ],
-    "cpu": 256,
-    "memory": 512,
-    "portMappings": [{
-        "containerPort": 5000,
-        "hostPort": 5000,
-        "protocol": "tcp"
-    }],
-    "logConfiguration": {
-        "logDriver": "awslogs",
-        "options": {
-            "awslogs-group": args[1],
-            "awslogs-region": "us-east-2",
-            "awslogs-stream-prefix": "web"
-        }
-    },
-
-}]))
-
-web_ui_task_definition = ecs.TaskDefinition(
-    "web_ui-app-task",
-    family="fargate-task-definition",
-    cpu="512",
-    memory="1024",
-    network_mode="awsvpc",
-    requires_compatibilities=["FARGATE"],
-    execution_role_arn=task_exec_role.arn,
-    container_definitions=web_ui_container_definitions
-)
-web_api_task_definition = ecs.TaskDefinition(
-    "web_api-app-task",
-    family="fargate-task-definition",
-    cpu="512",
-    memory="1024",
-    network_mode="awsvpc",
-    requires_compatibilities=["FARGATE"],
-    execution_role_arn=task_exec_role.arn,
-    container_definitions=web_api_container_definitions
-)
-
-# Specify the ECS service
-web_ui_service = ecs.Service(
-    "web-ui-svc",
-    cluster=cluster.arn,
-    desired_count=2,
-    launch_type="FARGATE",
-    task_definition=web_ui_task_definition.arn,
-    network_configuration={
-        "assign_public_ip": "true",
-        "subnets": public_subnet_ids,
-        "security_groups": [web_ui_app_sg.id]
-    },
-    load_balancers=[{
-        "target_group_arn": web_ui_target_group.arn,
-        "container_name": "web-ui-container",
-        "container_port": 5000
-    }],
-    deployment_maximum_percent=200,
-    deployment_minimum_healthy_percent=50,
-    opts=pulumi.ResourceOptions(depends_on=[web_ui_listener]),
-    health_check_grace_period_seconds=10,
-    tags=tags
-)
-
-
-web_api_service = ecs.Service(
-    "web-api-svc",
-    cluster=cluster.arn,
-    desired_count=2,
-    launch_type="FARGATE",
-    task_definition=web_api_task_definition.arn,
-    network_configuration={
-        "subnets": private_subnet_ids,
-        "security_groups": [web_api_app_sg.id]
-    },
-    load_balancers=[{
-        "target_group_arn": web_api_target_group.arn,
-        "container_name": "web-api-container",
-        "container_port": 5000
-    }],
-     deployment_maximum_percent=200,
-    deployment_minimum_healthy_percent=50,
-    opts=pulumi.ResourceOptions(depends_on=[web_api_listener]),
-    health_check_grace_period_seconds=10,
-    tags=tags
-)
-
-
-pulumi.export("api-lb-url", pulumi.Output.concat(
-    "http://", web_api_lb.dns_name))
-
-pulumi.export("web-lb-url", pulumi.Output.concat(
-    "http://", web_ui_lb.dns_name))
+# Fingerprints of the last pushed images, see `images` in stack config
+image_settings = config.get_object("images") or {}
+image_cache = ImageCache(os.path.join(image_settings.get("cache_dir", ".image-cache"), f"{stack_name}.json"))
+
+# Create the services declared under `services` in stack config. A service can
+# reach the ones declared before it through `{name}` placeholders in its environment.
+service_specs = load_service_specs(config)
+
+# One ALB per service, or a single shared one, see `load_balancing` in stack config
+lb_settings = config.get_object("load_balancing") or {}
+lb_mode = lb_settings.get("mode", "per_service")
+if lb_mode not in LOAD_BALANCING_MODES:
+    raise ValueError(f"load_balancing.mode must be one of {LOAD_BALANCING_MODES}, got '{lb_mode}'")
+shared_lb = None
+rule_priority = {}
+if lb_mode == "shared":
+    shared_lb = create_shared_load_balancer(vpc.id, public_subnet_ids, tags)
+    rule_priority = rule_priorities(service_specs)
+
+# Internal services reached through Service Connect instead of their own ALB,
+# see `service_connect` in stack config
+service_connect = create_service_connect(service_connect_settings(config.get_object("service_connect")),
+                                         vpc_cidr_block, tags)
+
+# Dashboards and alarms for every service, notifying `monitoring.alarm_actions`
+monitoring_settings = config.get_object("monitoring") or {}
+
+services = {}
+for spec in service_specs:
+    services[spec.name] = FargateWebService(spec,
+                                            region=region,
+                                            cluster=cluster,
+                                            vpc_id=vpc.id,
+                                            public_subnet_ids=public_subnet_ids,
+                                            private_subnet_ids=private_subnet_ids,
+                                            internal_ingress_cidr_blocks=public_subnet_cidr_blocks,
+                                            execution_role=task_exec_role,
+                                            addresses={name: svc.address for name, svc in services.items()},
+                                            tags=tags,
+                                            image_cache=image_cache,
+                                            skip_unchanged_images=image_settings.get("skip_unchanged", True),
+                                            report_image_size=image_settings.get("report_sizes", False),
+                                            shared_lb=shared_lb,
+                                            rule_priority=rule_priority.get(spec.name),
+                                            capacity_providers=cluster_capacity_providers,
+                                            alarm_actions=monitoring_settings.get("alarm_actions"),
+                                            service_connect=service_connect)
+    pulumi.export(spec.url_output or f"{spec.name}-lb-url", services[spec.name].url)
+
+# Pushed image size per service in MiB, see `prewarm` in the service specs
+if image_settings.get("report_sizes", False):
+    pulumi.export("image-sizes", Output.all(**{name: svc.image_size for name, svc in services.items()}))
@@ -0,0 +1,77 @@
+"""Capacity-provider strategies for the services
+
+A service's `capacity` block picks a preset, or gives its own `strategy`:
+
+- `launch_type` (default): no strategy, the service keeps `launch_type=FARGATE`;
+- `on_demand`: everything on FARGATE;
+- `balanced`: `base` tasks on FARGATE, the rest split 1:3 FARGATE:FARGATE_SPOT;
+- `spot`: `base` tasks on FARGATE, everything above on FARGATE_SPOT.
+
+Fargate Spot only runs X86_64 tasks, so an ARM64 task (`task.cpu_architecture`)
+can't have FARGATE_SPOT in its strategy. Spot tasks get a two-minute warning (SIGTERM) before they are reclaimed, so
+services with Spot in their strategy default to the longest `stopTimeout` and
+a deregistration delay short enough for the ALB to drain them within the notice.
+"""
+
+CAPACITY_PROVIDERS = ("FARGATE", "FARGATE_SPOT")
+PRESETS = ("launch_type", "on_demand", "balanced", "spot")
+SPOT_INTERRUPTION_NOTICE = 120
+# ECS caps stopTimeout at 120s, the whole interruption notice
+SPOT_STOP_TIMEOUT = 120
+SPOT_DEREGISTRATION_DELAY = 30
+
+
+def capacity_provider_strategy(service_name, settings, task):
+    """The service's capacity-provider strategy as a list of
+    `{capacity_provider, base, weight}`, or None to keep the launch type.
+    `task` is the service's merged task settings."""
+    settings = settings or {}
+    if "strategy" in settings:
+        strategy = settings["strategy"]
+    else:
+        preset = settings.get("preset", "launch_type")
+        base = settings.get("base", 1)
+        if preset not in PRESETS:
+            raise ValueError(f"services.{service_name}.capacity.preset must be one of {PRESETS}, got '{preset}'")
+        strategy = {
+            "launch_type": None,
+            "on_demand": [{"capacity_provider": "FARGATE", "base": base, "weight": 1}],
+            "balanced": [{"capacity_provider": "FARGATE", "base": base, "weight": 1},
+                         {"capacity_provider": "FARGATE_SPOT", "weight": 3}],
+            "spot": [{"capacity_provider": "FARGATE", "base": base, "weight": 0},
+                     {"capacity_provider": "FARGATE_SPOT", "weight": 1}],
+        }[preset]
+    if strategy is None:
+        return None
+
+    for item in strategy:
+        if "capacity_provider" not in item:
+            raise ValueError(f"services.{service_name}.capacity.strategy: every entry needs a capacity_provider")
+        if item["capacity_provider"] not in CAPACITY_PROVIDERS:
+            raise ValueError(
+                f"services.{service_name}.capacity: unknown capacity provider '{item['capacity_provider']}'")
+    if sum(1 for item in strategy if item.get("base")) > 1:
+        raise ValueError(f"services.{service_name}.capacity: only one provider can have a base")
+    if not any(item.get("weight") for item in strategy):
+        raise ValueError(f"services.{service_name}.capacity: at least one provider needs a weight above 0")
+    if uses_spot(strategy) and task["cpu_architecture"] == "ARM64":
+        raise ValueError(f"services.{service_name}.capacity: FARGATE_SPOT doesn't run ARM64 tasks, "
+                         "use on_demand or an X86_64 task")
+    return strategy
+
+
+def uses_spot(strategy):
+    return any(item["capacity_provider"] == "FARGATE_SPOT" and item.get("weight") for item in strategy or [])
+
+
+def spot_interruption_settings(service_name, container, target_group):
+    """Fill in stopTimeout and deregistration delay for a Spot service and
+    check the target group drains before the task is reclaimed."""
+    container = {**container, "stop_timeout": container["stop_timeout"] or SPOT_STOP_TIMEOUT}
+    target_group = {**target_group,
+                    "deregistration_delay": target_group["deregistration_delay"] or SPOT_DEREGISTRATION_DELAY}
+    if target_group["deregistration_delay"] >= SPOT_INTERRUPTION_NOTICE:
+        raise ValueError(
+            f"services.{service_name}: deregistration_delay ({target_group['deregistration_delay']}s) must be "
+            f"shorter than the {SPOT_INTERRUPTION_NOTICE}s Spot interruption notice")
+    return container, target_group
@@ -0,0 +1,127 @@
+"""Optional CloudFront distribution in front of a public service's ALB
+
+A public service with a `cdn` block gets a distribution with its load
+balancer as origin. Requests matching `static_paths` are cached at the edge
+for `static_ttl` seconds; everything else passes through uncached with all
+headers, cookies and query strings. The load balancer's security group then
+only admits CloudFront's origin-facing address ranges, so clients can't
+bypass the edge.
+"""
+
+from pulumi import Output
+from pulumi_aws import cloudfront, ec2
+
+import profiling
+
+# AWS managed policies
+CACHING_DISABLED_POLICY = "4135ea2d-6df8-44a3-9df3-4b5a84be39ad"
+ALL_VIEWER_ORIGIN_REQUEST_POLICY = "216adef6-5c7f-47e4-b989-5492eafa07d3"
+CLOUDFRONT_PREFIX_LIST = "com.amazonaws.global.cloudfront.origin-facing"
+PRICE_CLASSES = ("PriceClass_100", "PriceClass_200", "PriceClass_All")
+ALL_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "POST", "PATCH", "DELETE"]
+
+DEFAULTS = {
+    "static_paths": [],
+    "static_ttl": 86400,
+    "compress": True,
+    "price_class": "PriceClass_100",
+    # seconds CloudFront keeps an idle connection to the ALB open (1-60)
+    "origin_keepalive_timeout": 60,
+    "origin_read_timeout": 30,
+}
+
+
+def cdn_settings(service_name, settings, public):
+    """Merge a service's `cdn` block with the defaults, or None without one."""
+    if settings is None:
+        return None
+    if not public:
+        raise ValueError(f"services.{service_name}.cdn: only public services can sit behind CloudFront")
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"services.{service_name}.cdn: unknown keys {sorted(unknown)}")
+    merged = {**DEFAULTS, **settings}
+    if merged["price_class"] not in PRICE_CLASSES:
+        raise ValueError(f"services.{service_name}.cdn.price_class must be one of {PRICE_CLASSES}")
+    if not 1 <= merged["origin_keepalive_timeout"] <= 60:
+        raise ValueError(f"services.{service_name}.cdn.origin_keepalive_timeout must be between 1 and 60 seconds")
+    return merged
+
+
+def cloudfront_prefix_list_id():
+    with profiling.span("invoke", "aws:ec2/getManagedPrefixList"):
+        return ec2.get_managed_prefix_list(name=CLOUDFRONT_PREFIX_LIST).id
+
+
+def create_distribution(name, load_balancer, settings, tags, opts=None):
+    origin_id = f"{name}-lb"
+    static_behaviors = []
+    if settings["static_paths"]:
+        static_cache_policy = cloudfront.CachePolicy(f"{name}-static-cache-policy",
+                                                     comment=f"Static assets of {name}",
+                                                     min_ttl=0,
+                                                     default_ttl=settings["static_ttl"],
+                                                     max_ttl=max(settings["static_ttl"], 31536000),
+                                                     parameters_in_cache_key_and_forwarded_to_origin=cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginArgs(
+                                                         cookies_config=cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginCookiesConfigArgs(
+                                                             cookie_behavior="none"),
+                                                         headers_config=cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginHeadersConfigArgs(
+                                                             header_behavior="none"),
+                                                         query_strings_config=cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginQueryStringsConfigArgs(
+                                                             query_string_behavior="none"),
+                                                         enable_accept_encoding_gzip=settings["compress"],
+                                                         enable_accept_encoding_brotli=settings["compress"],
+                                                     ),
+                                                     opts=opts)
+        static_behaviors = [cloudfront.DistributionOrderedCacheBehaviorArgs(
+            path_pattern=path,
+            target_origin_id=origin_id,
+            viewer_protocol_policy="redirect-to-https",
+            allowed_methods=["GET", "HEAD", "OPTIONS"],
+            cached_methods=["GET", "HEAD"],
+            cache_policy_id=static_cache_policy.id,
+            compress=settings["compress"],
+        ) for path in settings["static_paths"]]
+
+    return cloudfront.Distribution(f"{name}-cdn",
+                                   comment=f"{name} behind CloudFront",
+                                   enabled=True,
+                                   http_version="http2and3",
+                                   is_ipv6_enabled=True,
+                                   price_class=settings["price_class"],
+                                   origins=[cloudfront.DistributionOriginArgs(
+                                       origin_id=origin_id,
+                                       domain_name=load_balancer.dns_name,
+                                       custom_origin_config=cloudfront.DistributionOriginCustomOriginConfigArgs(
+                                           http_port=80,
+                                           https_port=443,
+                                           # the ALB only listens on HTTP
+                                           origin_protocol_policy="http-only",
+                                           origin_ssl_protocols=["TLSv1.2"],
+                                           origin_keepalive_timeout=settings["origin_keepalive_timeout"],
+                                           origin_read_timeout=settings["origin_read_timeout"],
+                                       ),
+                                   )],
+                                   # dynamic requests go to the service uncached, as they are
+                                   default_cache_behavior=cloudfront.DistributionDefaultCacheBehaviorArgs(
+                                       target_origin_id=origin_id,
+                                       viewer_protocol_policy="redirect-to-https",
+                                       allowed_methods=ALL_METHODS,
+                                       cached_methods=["GET", "HEAD"],
+                                       cache_policy_id=CACHING_DISABLED_POLICY,
+                                       origin_request_policy_id=ALL_VIEWER_ORIGIN_REQUEST_POLICY,
+                                       compress=settings["compress"],
+                                   ),
+                                   ordered_cache_behaviors=static_behaviors,
+                                   restrictions=cloudfront.DistributionRestrictionsArgs(
+                                       geo_restriction=cloudfront.DistributionRestrictionsGeoRestrictionArgs(
+                                           restriction_type="none"),
+                                   ),
+                                   viewer_certificate=cloudfront.DistributionViewerCertificateArgs(
+                                       cloudfront_default_certificate=True),
+                                   tags=tags,
+                                   opts=opts)
+
+
+def distribution_url(distribution):
+    return Output.concat("https://", distribution.domain_name)
@@ -0,0 +1,182 @@
+"""Typed ECS container definitions and Fargate task sizing
+
+Container definitions are rendered with sorted keys, explicit defaults and the
+environment sorted by name, so the JSON only changes when a setting does and
+unchanged services don't get a new task-definition revision (and redeploy).
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Fargate task memory (MiB) allowed for each task cpu (units)
+FARGATE_MEMORY = {
+    256: (512, 1024, 2048),
+    512: tuple(range(1024, 4096 + 1, 1024)),
+    1024: tuple(range(2048, 8192 + 1, 1024)),
+    2048: tuple(range(4096, 16384 + 1, 1024)),
+    4096: tuple(range(8192, 30720 + 1, 1024)),
+    8192: tuple(range(16384, 61440 + 1, 4096)),
+    16384: tuple(range(32768, 122880 + 1, 8192)),
+}
+CPU_ARCHITECTURES = ("X86_64", "ARM64")
+# docker build --platform for each architecture
+BUILD_PLATFORMS = {"X86_64": "linux/amd64", "ARM64": "linux/arm64"}
+
+TASK_DEFAULTS = {"cpu": 512, "memory": 1024, "cpu_architecture": "X86_64"}
+CONTAINER_DEFAULTS = {
+    "cpu": 256,
+    "memory": 512,
+    "memory_reservation": None,
+    "stop_timeout": None,
+    "ulimits": [],
+    "health_check": None,
+}
+
+
+def validate_task_size(cpu, memory):
+    """Raise ValueError unless (cpu, memory) is a Fargate task size."""
+    if cpu not in FARGATE_MEMORY:
+        raise ValueError(f"Fargate task cpu must be one of {sorted(FARGATE_MEMORY)}, got {cpu}")
+    if memory not in FARGATE_MEMORY[cpu]:
+        allowed = FARGATE_MEMORY[cpu]
+        if len(allowed) > 4:
+            allowed = f"{allowed[0]}-{allowed[-1]} in steps of {allowed[1] - allowed[0]}"
+        raise ValueError(f"Fargate task with cpu {cpu} takes memory {allowed}, got {memory}")
+
+
+def task_settings(service_name, task, container):
+    """Merge a service's `task` and `container` blocks with the defaults and
+    check the container fits in the task."""
+    task = {**TASK_DEFAULTS, **(task or {})}
+    container = {**CONTAINER_DEFAULTS, **(container or {})}
+    try:
+        validate_task_size(task["cpu"], task["memory"])
+    except ValueError as e:
+        raise ValueError(f"services.{service_name}.task: {e}") from None
+    if task["cpu_architecture"] not in CPU_ARCHITECTURES:
+        raise ValueError(f"services.{service_name}.task.cpu_architecture must be one of {CPU_ARCHITECTURES}")
+    if container["cpu"] > task["cpu"] or container["memory"] > task["memory"]:
+        raise ValueError(
+            f"services.{service_name}.container: cpu {container['cpu']} / memory {container['memory']} "
+            f"does not fit in the task's cpu {task['cpu']} / memory {task['memory']}")
+    if container["stop_timeout"] is not None and not 2 <= container["stop_timeout"] <= 120:
+        raise ValueError(f"services.{service_name}.container.stop_timeout must be between 2 and 120 seconds")
+    return task, container
+
+
+@dataclass
+class HealthCheck:
+    command: list
+    interval: int = 30
+    timeout: int = 5
+    retries: int = 3
+    start_period: int = 0
+
+    def to_dict(self):
+        return {
+            "command": self.command,
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "startPeriod": self.start_period,
+        }
+
+
+@dataclass
+class Ulimit:
+    name: str
+    soft_limit: int
+    hard_limit: int
+
+    def to_dict(self):
+        return {"name": self.name, "softLimit": self.soft_limit, "hardLimit": self.hard_limit}
+
+
+@dataclass
+class LogConfiguration:
+    driver: str
+    options: dict
+
+    def to_dict(self):
+        return {"logDriver": self.driver, "options": self.options}
+
+
+@dataclass
+class ContainerDefinition:
+    name: str
+    image: str
+    port: Optional[int]
+    log_configuration: LogConfiguration
+    # named ports can be published with Service Connect
+    port_name: Optional[str] = None
+    cpu: int = 256
+    memory: Optional[int] = 512
+    memory_reservation: Optional[int] = None
+    environment: list = field(default_factory=list)
+    ulimits: list = field(default_factory=list)
+    stop_timeout: Optional[int] = None
+    health_check: Optional[HealthCheck] = None
+    firelens_configuration: Optional[dict] = None
+    # containers that must be running before this one starts
+    depends_on: list = field(default_factory=list)
+    essential: bool = True
+
+    @classmethod
+    def from_settings(cls, name, image, port, log_configuration, environment, settings, depends_on=(),
+                      port_name=None):
+        """Build from the merged `container` settings, see `task_settings`."""
+        health_check = settings["health_check"]
+        return cls(name=name,
+                   image=image,
+                   port=port,
+                   log_configuration=log_configuration,
+                   port_name=port_name,
+                   cpu=settings["cpu"],
+                   memory=settings["memory"],
+                   memory_reservation=settings["memory_reservation"],
+                   environment=environment,
+                   ulimits=[Ulimit(**ulimit) for ulimit in settings["ulimits"]],
+                   stop_timeout=settings["stop_timeout"],
+                   health_check=HealthCheck(**health_check) if health_check else None,
+                   depends_on=list(depends_on))
+
+    def to_dict(self):
+        definition = {
+            "name": self.name,
+            "image": self.image,
+            "essential": self.essential,
+            "environment": sorted(self.environment, key=lambda variable: variable["name"]),
+            "cpu": self.cpu,
+            "portMappings": [{
+                "containerPort": self.port,
+                "hostPort": self.port,
+                "protocol": "tcp"
+            }] if self.port is not None else [],
+            "logConfiguration": self.log_configuration.to_dict(),
+            "mountPoints": [],
+            "volumesFrom": [],
+        }
+        if self.port_name is not None:
+            definition["portMappings"][0].update({"name": self.port_name, "appProtocol": "http"})
+        if self.memory is not None:
+            definition["memory"] = self.memory
+        if self.memory_reservation is not None:
+            definition["memoryReservation"] = self.memory_reservation
+        if self.ulimits:
+            definition["ulimits"] = [ulimit.to_dict() for ulimit in self.ulimits]
+        if self.stop_timeout is not None:
+            definition["stopTimeout"] = self.stop_timeout
+        if self.health_check is not None:
+            definition["healthCheck"] = self.health_check.to_dict()
+        if self.firelens_configuration is not None:
+            definition["firelensConfiguration"] = self.firelens_configuration
+        if self.depends_on:
+            definition["dependsOn"] = [{"containerName": name, "condition": "START"} for name in self.depends_on]
+        return definition
+
+
+def render_container_definitions(definitions):
+    """The `container_definitions` JSON for a task definition, byte-stable for
+    equal inputs."""
+    return json.dumps([definition.to_dict() for definition in definitions], sort_keys=True)
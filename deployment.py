@@ -0,0 +1,93 @@
+"""Rolling-deployment policy for the services
+
+A service's `deployment` block picks a preset and can override any of its
+settings:
+
+- `standard` (default): up to 200% of the tasks during a rollout, never below
+  50%, ALB health checks every 30s and the AWS default 300s deregistration delay;
+- `fast`: starts the whole new set next to the old one (200/100), checks health
+  every 5s, needs 2 passes and drains old tasks in 10s.
+
+Both turn on the deployment circuit breaker with rollback, so a deployment
+whose tasks keep failing to start or to pass health checks is stopped and
+rolled back to the last completed one instead of cycling tasks forever.
+
+The preset's target-group values are defaults only, the service's
+`target_group` block wins.
+"""
+
+import math
+
+PRESETS = {
+    "standard": {
+        "maximum_percent": 200,
+        "minimum_healthy_percent": 50,
+        "health_check_grace_period": 10,
+        "circuit_breaker": True,
+        "rollback": True,
+        "target_group": {
+            "deregistration_delay": None,
+            "health_check": {"interval": 30},
+        },
+    },
+    "fast": {
+        "maximum_percent": 200,
+        "minimum_healthy_percent": 100,
+        "health_check_grace_period": 10,
+        "circuit_breaker": True,
+        "rollback": True,
+        "target_group": {
+            "deregistration_delay": 10,
+            "health_check": {"interval": 5, "timeout": 2, "healthy_threshold": 2, "unhealthy_threshold": 2},
+        },
+    },
+}
+
+# What the estimates assume when the target group leaves a value to AWS
+ALB_HEALTHY_THRESHOLD = 5
+ALB_DEREGISTRATION_DELAY = 300
+# Rough time from placement to a running container: ENI, image pull, start
+TASK_START = 60
+
+
+def deployment_settings(service_name, settings):
+    """Merge a service's `deployment` block with its preset."""
+    settings = dict(settings or {})
+    preset = settings.pop("preset", "standard")
+    if preset not in PRESETS:
+        raise ValueError(f"services.{service_name}.deployment.preset must be one of {sorted(PRESETS)}, got '{preset}'")
+    unknown = set(settings) - set(PRESETS[preset])
+    if unknown:
+        raise ValueError(f"services.{service_name}.deployment: unknown keys {sorted(unknown)}")
+    merged = {**PRESETS[preset], **settings, "preset": preset}
+    if not 0 <= merged["minimum_healthy_percent"] <= 100:
+        raise ValueError(f"services.{service_name}.deployment.minimum_healthy_percent must be between 0 and 100")
+    if merged["minimum_healthy_percent"] == 100 and merged["maximum_percent"] <= 100:
+        raise ValueError(
+            f"services.{service_name}.deployment: maximum_percent must be above 100 "
+            "when minimum_healthy_percent is 100, or no task can be replaced")
+    if merged["rollback"] and not merged["circuit_breaker"]:
+        raise ValueError(f"services.{service_name}.deployment: rollback needs the circuit_breaker")
+    return merged
+
+
+def deployment_waves(desired_count, maximum_percent, minimum_healthy_percent):
+    """How many rounds of start-new/stop-old a rollout of `desired_count` tasks takes."""
+    if desired_count <= 0:
+        return 0
+    extra = math.floor(desired_count * maximum_percent / 100) - desired_count
+    stoppable = desired_count - math.ceil(desired_count * minimum_healthy_percent / 100)
+    return math.ceil(desired_count / max(extra, stoppable, 1))
+
+
+def convergence_estimate(settings, target_group, desired_count):
+    """Rough seconds for a healthy rollout to finish: per wave, start the new
+    tasks, pass the ALB health checks, drain the old tasks."""
+    health_check = target_group["health_check"]
+    healthy_threshold = health_check["healthy_threshold"] or ALB_HEALTHY_THRESHOLD
+    deregistration_delay = target_group["deregistration_delay"]
+    if deregistration_delay is None:
+        deregistration_delay = ALB_DEREGISTRATION_DELAY
+    wave = TASK_START + healthy_threshold * health_check["interval"] + deregistration_delay
+    waves = deployment_waves(desired_count, settings["maximum_percent"], settings["minimum_healthy_percent"])
+    return waves * wave
@@ -0,0 +1,96 @@
+"""Egress for the private subnets
+
+Three modes, chosen with `egress.mode` in stack config:
+
+- `per_az_nat`: one NAT gateway per AZ, each private subnet routes through the
+  one in its own zone;
+- `shared_nat`: a single NAT gateway in the first AZ for every private subnet,
+  cheaper but cross-AZ traffic and a single point of failure;
+- `endpoints`: no NAT at all. Tasks reach ECR, S3, CloudWatch Logs and STS
+  through VPC endpoints and have no other route out of the VPC.
+
+`vpc_endpoints: true` adds the endpoints to either NAT mode as well, so image
+pulls and log shipping skip the NAT hop and its per-GB processing charge.
+"""
+
+from pulumi_aws import ec2
+
+EGRESS_MODES = ("per_az_nat", "shared_nat", "endpoints")
+# What a Fargate task needs to start: pull from ECR, ship logs, assume roles
+INTERFACE_ENDPOINTS = ("ecr.api", "ecr.dkr", "logs", "sts")
+
+
+def uses_endpoints(settings):
+    return settings.get("mode", "per_az_nat") == "endpoints" or settings.get("vpc_endpoints", False)
+
+
+def create_egress(settings, region, vpc_id, vpc_cidr_block, public_subnet_ids, private_subnet_ids, tags):
+    """Create the NAT gateways, private route tables and VPC endpoints for
+    `settings` (the `egress` config block). Returns the private route table ids."""
+    mode = settings.get("mode", "per_az_nat")
+    if mode not in EGRESS_MODES:
+        raise ValueError(f"egress.mode must be one of {EGRESS_MODES}, got '{mode}'")
+
+    nat_gateway_ids = []
+    nat_count = {"per_az_nat": len(public_subnet_ids), "shared_nat": 1, "endpoints": 0}[mode]
+    for i, public_subnet_id in enumerate(public_subnet_ids[:nat_count], 1):
+        eip = ec2.Eip(f'nat-eip-{i}')
+        nat_gateway = ec2.NatGateway(f"nat-gateway-{i}",
+                                     allocation_id=eip.id,
+                                     subnet_id=public_subnet_id,
+                                     tags=tags
+                                     )
+        nat_gateway_ids.append(nat_gateway.id)
+
+    private_route_table_ids = []
+    for i, private_subnet_id in enumerate(private_subnet_ids, 1):
+        routes = []
+        if nat_gateway_ids:
+            # per AZ: the NAT in the same zone, shared: the only one
+            nat_gateway_id = nat_gateway_ids[min(i, len(nat_gateway_ids)) - 1]
+            routes.append(ec2.RouteTableRouteArgs(cidr_block="0.0.0.0/0", nat_gateway_id=nat_gateway_id))
+        private_route_table = ec2.RouteTable(f"private-route-table-{i}", vpc_id=vpc_id, routes=routes, tags=tags)
+        ec2.RouteTableAssociation(
+            f"private-subnet-association-{i}", route_table_id=private_route_table.id, subnet_id=private_subnet_id)
+        private_route_table_ids.append(private_route_table.id)
+
+    if uses_endpoints(settings):
+        create_vpc_endpoints(region, vpc_id, vpc_cidr_block, private_subnet_ids, private_route_table_ids, tags)
+
+    return private_route_table_ids
+
+
+def create_vpc_endpoints(region, vpc_id, vpc_cidr_block, private_subnet_ids, private_route_table_ids, tags):
+    # ECR stores image layers in S3, the gateway endpoint is free
+    ec2.VpcEndpoint("s3-endpoint",
+                    vpc_id=vpc_id,
+                    service_name=f"com.amazonaws.{region}.s3",
+                    vpc_endpoint_type="Gateway",
+                    route_table_ids=private_route_table_ids,
+                    tags=tags)
+
+    endpoint_sg = ec2.SecurityGroup('vpc-endpoint-sg',
+                                    description='Allow HTTPS from the VPC to the interface endpoints',
+                                    vpc_id=vpc_id,
+                                    ingress=[
+                                        ec2.SecurityGroupIngressArgs(
+                                            protocol='tcp',
+                                            from_port=443,
+                                            to_port=443,
+                                            cidr_blocks=[vpc_cidr_block],
+                                        )
+                                    ],
+                                    tags=tags,
+                                    )
+
+    endpoints = {}
+    for service in INTERFACE_ENDPOINTS:
+        endpoints[service] = ec2.VpcEndpoint(f"{service.replace('.', '-')}-endpoint",
+                                             vpc_id=vpc_id,
+                                             service_name=f"com.amazonaws.{region}.{service}",
+                                             vpc_endpoint_type="Interface",
+                                             private_dns_enabled=True,
+                                             subnet_ids=private_subnet_ids,
+                                             security_group_ids=[endpoint_sg.id],
+                                             tags=tags)
+    return endpoints
@@ -0,0 +1,182 @@
+"""Content-hash based skipping of docker image builds
+
+Every image is fingerprinted from its Dockerfile and build context. When the
+fingerprint matches the one recorded for the last pushed image, and ECR
+confirms that image is still there, the program reuses that image URI
+instead of declaring an `awsx.ecr.Image`, so unchanged images are neither
+rebuilt nor pushed.
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from pulumi_aws import ecr
+
+import profiling
+
+# Never part of the build context fingerprint, whatever .dockerignore says
+ALWAYS_IGNORED = (".git",)
+CHUNK_SIZE = 1 << 20
+
+
+def read_dockerignore(context):
+    path = Path(context) / ".dockerignore"
+    if not path.exists():
+        return []
+    patterns = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            patterns.append(line)
+    return patterns
+
+
+def is_ignored(relative_path, patterns):
+    """Apply .dockerignore patterns in order, later `!` patterns re-including
+    paths excluded earlier. A pattern matching a directory excludes its contents."""
+    parts = relative_path.split("/")
+    if parts[0] in ALWAYS_IGNORED:
+        return True
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith("!")
+        pattern = pattern.lstrip("!").strip("/")
+        prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        if any(fnmatch.fnmatchcase(prefix, pattern) for prefix in prefixes):
+            ignored = not negate
+    return ignored
+
+
+def context_files(context):
+    """Relative paths of the files docker would send as build context, sorted."""
+    context = Path(context)
+    patterns = read_dockerignore(context)
+    files = []
+    for root, dirs, names in os.walk(context):
+        rel_root = Path(root).relative_to(context).as_posix()
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if d not in ALWAYS_IGNORED]
+        for name in names:
+            rel = name if rel_root == "." else f"{rel_root}/{name}"
+            if not is_ignored(rel, patterns):
+                files.append(rel)
+    return sorted(files)
+
+
+def hash_build_context(context, dockerfile, build_args=None, platform=None, target=None):
+    """sha256 over the target platform, the Dockerfile, the build args, the
+    build target and every context file (path, mode and contents)."""
+    digest = hashlib.sha256()
+    digest.update(f"platform:{platform or ''}\0".encode())
+    digest.update(Path(dockerfile).read_bytes())
+    for key, value in sorted((build_args or {}).items()):
+        digest.update(f"\0arg:{key}={value}".encode())
+    if target:
+        digest.update(f"\0target:{target}".encode())
+    for rel in context_files(context):
+        path = Path(context) / rel
+        digest.update(f"\0file:{rel}:{path.stat().st_mode & 0o111:o}\0".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """Maps image name to the fingerprint and URI of the last pushed image,
+    persisted as JSON (one file per stack)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def get(self, name):
+        return self._entries.get(name)
+
+    def lookup(self, name, fingerprint):
+        """Image URI pushed for `fingerprint`, or None if it has to be built."""
+        entry = self._entries.get(name)
+        if entry and entry["fingerprint"] == fingerprint:
+            return entry["image_uri"]
+        return None
+
+    def record(self, name, fingerprint, image_uri):
+        # image builds finish concurrently, serialize the read-modify-write
+        with self._lock:
+            self._entries[name] = {"fingerprint": fingerprint, "image_uri": image_uri}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._entries, indent=2, sort_keys=True))
+            tmp.replace(self.path)
+
+
+@dataclass
+class ImagePlan:
+    name: str
+    fingerprint: Optional[str]
+    cached_uri: Optional[str]
+    previous_uri: Optional[str]
+
+    @property
+    def skip(self):
+        return self.cached_uri is not None
+
+
+def plan_image(name, context, dockerfile, cache, build_args=None, platform=None, target=None):
+    """Decide whether image `name` needs a build. `previous_uri` is the last
+    pushed image whatever its fingerprint, useful as a BuildKit cache source.
+    Without a local build context (e.g. evaluating under mocks) there is
+    nothing to fingerprint and the image is always built."""
+    entry = cache.get(name) if cache else None
+    if not (Path(context).is_dir() and Path(dockerfile).is_file()):
+        return ImagePlan(name=name, fingerprint=None, cached_uri=None,
+                         previous_uri=entry["image_uri"] if entry else None)
+    fingerprint = hash_build_context(context, dockerfile, build_args, platform, target)
+    return ImagePlan(name=name,
+                     fingerprint=fingerprint,
+                     cached_uri=cache.lookup(name, fingerprint) if cache else None,
+                     previous_uri=entry["image_uri"] if entry else None)
+
+
+def image_reference(image_uri):
+    """Split a pushed image URI (`host/repo:tag` or `host/repo@sha256:...`)
+    into the `ecr.get_image` arguments that find it."""
+    path = image_uri.split("/", 1)[1]
+    if "@" in path:
+        repository, digest = path.split("@", 1)
+        return {"repository_name": repository, "image_digest": digest}
+    repository, _, tag = path.partition(":")
+    return {"repository_name": repository, "image_tag": tag or "latest"}
+
+
+def pushed_image_exists(image_uri, invoke=None):
+    """Whether ECR still holds `image_uri`. The cache is a local file, the
+    repository may have been emptied or replaced since it was written."""
+    try:
+        with profiling.span("invoke", "aws:ecr/getImage"):
+            (invoke or ecr.get_image)(**image_reference(image_uri))
+    except Exception:
+        return False
+    return True
+
+
+def pushed_image_size(image_uri, invoke=None):
+    """Compressed size of the pushed `image_uri` in MiB."""
+    with profiling.span("invoke", "aws:ecr/getImage"):
+        image = (invoke or ecr.get_image)(**image_reference(image_uri))
+    return round(image.image_size_in_bytes / 2 ** 20, 1)
+
+
+def in_repository(image_uri, repository_url):
+    """`image_uri` if it was pushed to `repository_url`, else ValueError."""
+    if not (image_uri.startswith(f"{repository_url}:") or image_uri.startswith(f"{repository_url}@")):
+        raise ValueError(f"cached image {image_uri} is not in {repository_url}, "
+                         "remove its entry from the image cache to rebuild it")
+    return image_uri
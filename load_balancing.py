@@ -0,0 +1,151 @@
+"""Target group tuning and the optional shared ALB
+
+With `load_balancing.mode: shared` every service sits behind one public ALB
+and a listener rule per service routes to its target group by path and/or
+host, instead of each service owning a load balancer and listener.
+"""
+
+from dataclasses import dataclass
+
+from pulumi_aws import ec2, lb
+
+LOAD_BALANCING_MODES = ("per_service", "shared")
+ALGORITHMS = ("round_robin", "least_outstanding_requests")
+# Lowest precedence, for the service routing everything no other rule matches
+CATCH_ALL_PRIORITY = 50000
+
+# Target group settings left as None keep the AWS default
+TARGET_GROUP_DEFAULTS = {
+    "deregistration_delay": None,
+    "slow_start": None,
+    "algorithm": None,
+    "health_check": {
+        "interval": 30,
+        "timeout": None,
+        "healthy_threshold": None,
+        "unhealthy_threshold": None,
+        "matcher": "200",
+    },
+}
+
+
+def target_group_settings(service_name, settings, defaults=None):
+    """Merge a service's `target_group` block with `defaults` (e.g. from its
+    deployment preset) and TARGET_GROUP_DEFAULTS, and check the combination
+    is one the ALB accepts."""
+    settings = settings or {}
+    defaults = defaults or {}
+    merged = {**TARGET_GROUP_DEFAULTS, **defaults, **settings,
+              "health_check": {**TARGET_GROUP_DEFAULTS["health_check"], **defaults.get("health_check", {}),
+                               **settings.get("health_check", {})}}
+    if merged["algorithm"] is not None and merged["algorithm"] not in ALGORITHMS:
+        raise ValueError(f"services.{service_name}.target_group.algorithm must be one of {ALGORITHMS}")
+    if merged["algorithm"] == "least_outstanding_requests" and merged["slow_start"]:
+        raise ValueError(
+            f"services.{service_name}.target_group: slow_start is not supported with least_outstanding_requests")
+    health_check = merged["health_check"]
+    if health_check["timeout"] is not None and health_check["timeout"] >= health_check["interval"]:
+        raise ValueError(
+            f"services.{service_name}.target_group.health_check: timeout must be lower than interval")
+    return merged
+
+
+def health_check_args(path, health_check):
+    args = {
+        "enabled": True,
+        "path": path,
+        "interval": health_check["interval"],
+        "timeout": health_check["timeout"],
+        "healthy_threshold": health_check["healthy_threshold"],
+        "unhealthy_threshold": health_check["unhealthy_threshold"],
+        "protocol": "HTTP",
+        "matcher": health_check["matcher"],
+    }
+    return {key: value for key, value in args.items() if value is not None}
+
+
+def rule_conditions(service_name, routing):
+    """Listener rule conditions from a service's `routing` block. A service
+    without path or host patterns is the catch-all."""
+    conditions = []
+    if routing.get("path_patterns"):
+        conditions.append(lb.ListenerRuleConditionArgs(
+            path_pattern=lb.ListenerRuleConditionPathPatternArgs(values=routing["path_patterns"])))
+    if routing.get("host_headers"):
+        conditions.append(lb.ListenerRuleConditionArgs(
+            host_header=lb.ListenerRuleConditionHostHeaderArgs(values=routing["host_headers"])))
+    if not conditions:
+        conditions.append(lb.ListenerRuleConditionArgs(
+            path_pattern=lb.ListenerRuleConditionPathPatternArgs(values=["/*"])))
+    if sum(len(routing.get(key) or []) for key in ("path_patterns", "host_headers")) > 5:
+        raise ValueError(f"services.{service_name}.routing: a listener rule takes at most 5 patterns")
+    return conditions
+
+
+def rule_priorities(specs):
+    """Listener rule priority per service: `routing.priority` when set, else by
+    position in the list, with catch-all services last."""
+    priorities = {}
+    for i, spec in enumerate(specs, 1):
+        routing = spec.routing or {}
+        if routing.get("priority"):
+            priorities[spec.name] = routing["priority"]
+        elif routing.get("path_patterns") or routing.get("host_headers"):
+            priorities[spec.name] = 100 * i
+        else:
+            priorities[spec.name] = CATCH_ALL_PRIORITY - i
+    if len(set(priorities.values())) != len(priorities):
+        raise ValueError(f"services: listener rule priorities must be unique, got {priorities}")
+    return priorities
+
+
+@dataclass
+class SharedLoadBalancer:
+    security_group: ec2.SecurityGroup
+    load_balancer: lb.LoadBalancer
+    listener: lb.Listener
+    port: int
+
+
+def create_shared_load_balancer(vpc_id, subnet_ids, tags, port=80):
+    security_group = ec2.SecurityGroup('web-alb-sg',
+                                       description=f'Allow inbound access from {port} for the shared ALB',
+                                       vpc_id=vpc_id,
+                                       ingress=[
+                                           ec2.SecurityGroupIngressArgs(
+                                               protocol='tcp',
+                                               from_port=port,
+                                               to_port=port,
+                                               cidr_blocks=['0.0.0.0/0'],
+                                           )
+                                       ],
+                                       egress=[
+                                           ec2.SecurityGroupEgressArgs(
+                                               protocol='-1',
+                                               from_port=0,
+                                               to_port=0,
+                                               cidr_blocks=['0.0.0.0/0'],
+                                           )
+                                       ],
+                                       tags=tags,
+                                       )
+
+    load_balancer = lb.LoadBalancer("web-alb", security_groups=[security_group.id],
+                                    subnets=subnet_ids, internal=False, tags=tags)
+
+    # Requests no service rule matches
+    listener = lb.Listener("web-alb-listener",
+                           load_balancer_arn=load_balancer.arn,
+                           port=port,
+                           protocol="HTTP",
+                           default_actions=[lb.ListenerDefaultActionArgs(
+                               type="fixed-response",
+                               fixed_response=lb.ListenerDefaultActionFixedResponseArgs(
+                                   content_type="text/plain",
+                                   message_body="Not Found",
+                                   status_code="404",
+                               ),
+                           )], tags=tags)
+
+    return SharedLoadBalancer(security_group=security_group, load_balancer=load_balancer,
+                              listener=listener, port=port)
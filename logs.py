@@ -0,0 +1,143 @@
+"""Log groups and log routing for the service containers
+
+Each service logs to its own CloudWatch log group, with the retention from its
+`logging` block. By default the container uses the `awslogs` driver in
+non-blocking mode: log lines go through an in-memory buffer of
+`max_buffer_size`, so a slow CloudWatch API drops lines once the buffer is
+full instead of blocking the app's writes to stdout. Use `mode: blocking` for
+services that must not lose a line.
+
+With `firelens` set, a Fluent Bit sidecar (`log_router`) receives the app's
+logs and ships them to the same group in batches. It calls CloudWatch Logs
+with the task role, so the service gets a role that can only write to its
+own log group.
+"""
+
+import re
+
+from pulumi_aws import iam
+
+from containers import ContainerDefinition, LogConfiguration
+
+# Retention periods CloudWatch Logs accepts, 0 never expires
+RETENTION_DAYS = (0, 1, 3, 5, 7, 14, 30, 60, 90, 120, 150, 180, 365, 400, 545, 731, 1096, 1827, 2192, 2557,
+                  2922, 3288, 3653)
+LOG_MODES = ("blocking", "non-blocking")
+BUFFER_SIZE = re.compile(r"^[1-9][0-9]*[kmg]?$")
+LOG_ROUTER_NAME = "log_router"
+
+DEFAULTS = {
+    "retention_days": 30,
+    "mode": "non-blocking",
+    "max_buffer_size": "25m",
+    "stream_prefix": "web",
+    "firelens": None,
+}
+FIRELENS_DEFAULTS = {
+    "image": "public.ecr.aws/aws-observability/aws-for-fluent-bit:stable",
+    "memory_reservation": 50,
+}
+
+
+def logging_settings(service_name, settings, task, container):
+    """Merge a service's `logging` block with the defaults. `task` and
+    `container` are the merged task settings, to check the sidecar fits."""
+    settings = settings or {}
+    merged = {**DEFAULTS, **settings}
+    if merged["firelens"] not in (None, False):
+        # `firelens: true` or a block overriding the defaults
+        overrides = merged["firelens"] if isinstance(merged["firelens"], dict) else {}
+        merged["firelens"] = {**FIRELENS_DEFAULTS, **overrides}
+    if merged["retention_days"] not in RETENTION_DAYS:
+        raise ValueError(f"services.{service_name}.logging.retention_days must be one of {RETENTION_DAYS}")
+    if merged["mode"] not in LOG_MODES:
+        raise ValueError(f"services.{service_name}.logging.mode must be one of {LOG_MODES}")
+    if not BUFFER_SIZE.match(str(merged["max_buffer_size"])):
+        raise ValueError(
+            f"services.{service_name}.logging.max_buffer_size must be a size like 25m, got '{merged['max_buffer_size']}'")
+    firelens = merged["firelens"]
+    if firelens and container["memory"] + firelens["memory_reservation"] > task["memory"]:
+        raise ValueError(
+            f"services.{service_name}.logging.firelens: the log router's {firelens['memory_reservation']} MiB "
+            f"does not fit next to the container's {container['memory']} MiB in the task's {task['memory']} MiB")
+    return merged
+
+
+def buffer_options(settings):
+    """Docker log driver options for the buffering mode."""
+    if settings["mode"] == "blocking":
+        return {"mode": "blocking"}
+    return {"mode": "non-blocking", "max-buffer-size": str(settings["max_buffer_size"])}
+
+
+def awslogs_configuration(log_group, region, stream_prefix, settings):
+    return LogConfiguration(driver="awslogs", options={
+        "awslogs-group": log_group,
+        "awslogs-region": region,
+        "awslogs-stream-prefix": stream_prefix,
+        **buffer_options(settings),
+    })
+
+
+def app_log_configuration(log_group, region, settings):
+    """Where the app container's stdout goes: straight to CloudWatch, or
+    through the FireLens log router."""
+    if not settings["firelens"]:
+        return awslogs_configuration(log_group, region, settings["stream_prefix"], settings)
+    return LogConfiguration(driver="awsfirelens", options={
+        "Name": "cloudwatch_logs",
+        "region": region,
+        "log_group_name": log_group,
+        "log_stream_prefix": f"{settings['stream_prefix']}/",
+        "auto_create_group": "false",
+        **buffer_options(settings),
+    })
+
+
+def log_router_definition(log_group, region, settings):
+    """The Fluent Bit sidecar, or None without `firelens`. Its own output goes
+    to the log group directly, under the `firelens` prefix."""
+    firelens = settings["firelens"]
+    if not firelens:
+        return None
+    return ContainerDefinition(name=LOG_ROUTER_NAME,
+                               image=firelens["image"],
+                               port=None,
+                               log_configuration=awslogs_configuration(log_group, region, "firelens", settings),
+                               cpu=0,
+                               memory=None,
+                               memory_reservation=firelens["memory_reservation"],
+                               firelens_configuration={
+                                   "type": "fluentbit",
+                                   "options": {"enable-ecs-log-metadata": "true"},
+                               })
+
+
+def create_log_router_role(name, log_group, tags, opts=None):
+    """Task role for the Fluent Bit sidecar, limited to writing to `log_group`.
+    Returns the role and its policy, which the tasks need in place before they start."""
+    role = iam.Role(f"{name}-log-router-role",
+                    assume_role_policy={
+                        "Version": "2012-10-17",
+                        "Statement": [{
+                            "Action": "sts:AssumeRole",
+                            "Principal": {"Service": "ecs-tasks.amazonaws.com"},
+                            "Effect": "Allow",
+                        }],
+                    },
+                    tags=tags,
+                    opts=opts)
+    policy = iam.RolePolicy(f"{name}-log-router-policy",
+                            role=role.id,
+                            policy=log_group.arn.apply(lambda arn: {
+                                "Version": "2012-10-17",
+                                "Statement": [{
+                                    "Effect": "Allow",
+                                    "Action": ["logs:CreateLogStream", "logs:PutLogEvents",
+                                               "logs:DescribeLogStreams"],
+                                    # the group itself and its streams
+                                    "Resource": [arn, f"{arn}:*"],
+                                }],
+                            }),
+                            opts=opts)
+    return role, policy
@@ -0,0 +1,140 @@
+"""CloudWatch dashboard and alarms for each service
+
+The dashboard shows the ALB latency percentiles, request and 5XX counts,
+healthy/unhealthy targets and the service's CPU and memory from Container
+Insights. Alarms fire on the thresholds in the service's `alarms` block; a
+threshold set to None has no alarm. `pulumi-python:monitoring.alarm_actions`
+(e.g. an SNS topic ARN) is notified on every alarm and on recovery.
+"""
+
+import json
+
+import pulumi
+from pulumi import Output
+from pulumi_aws import cloudwatch
+
+from profiling import traced
+
+# Thresholds per service, latency in seconds, 5XX in responses per period
+DEFAULTS = {
+    "response_time_p50": None,
+    "response_time_p90": None,
+    "response_time_p99": 1.0,
+    "target_5xx": 10,
+    "requests_per_target": None,
+    "cpu": 85,
+    "memory": 85,
+    "unhealthy_hosts": 0,
+    "period": 60,
+    "evaluation_periods": 3,
+}
+
+
+def alarm_settings(service_name, settings):
+    """Merge a service's `alarms` block with the defaults."""
+    settings = settings or {}
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"services.{service_name}.alarms: unknown keys {sorted(unknown)}")
+    merged = {**DEFAULTS, **settings}
+    if merged["period"] % 60:
+        raise ValueError(f"services.{service_name}.alarms.period must be a multiple of 60 seconds")
+    return merged
+
+
+def alarm_metrics(settings, load_balancer, target_group, cluster, service):
+    """`{key: (namespace, metric, statistic, dimensions, threshold)}` for each
+    alarm with a threshold. Services without a load balancer only get the ECS ones."""
+    ecs_dimensions = {"ClusterName": cluster.name, "ServiceName": service.name}
+    metrics = {
+        "cpu": ("AWS/ECS", "CPUUtilization", "Average", ecs_dimensions, settings["cpu"]),
+        "memory": ("AWS/ECS", "MemoryUtilization", "Average", ecs_dimensions, settings["memory"]),
+    }
+    if load_balancer is not None:
+        lb_dimensions = {"LoadBalancer": load_balancer.arn_suffix, "TargetGroup": target_group.arn_suffix}
+        metrics.update({
+            "response-time-p50": ("AWS/ApplicationELB", "TargetResponseTime", "p50", lb_dimensions,
+                                  settings["response_time_p50"]),
+            "response-time-p90": ("AWS/ApplicationELB", "TargetResponseTime", "p90", lb_dimensions,
+                                  settings["response_time_p90"]),
+            "response-time-p99": ("AWS/ApplicationELB", "TargetResponseTime", "p99", lb_dimensions,
+                                  settings["response_time_p99"]),
+            "target-5xx": ("AWS/ApplicationELB", "HTTPCode_Target_5XX_Count", "Sum", lb_dimensions,
+                           settings["target_5xx"]),
+            "requests-per-target": ("AWS/ApplicationELB", "RequestCountPerTarget", "Sum",
+                                    {"TargetGroup": target_group.arn_suffix}, settings["requests_per_target"]),
+            "unhealthy-hosts": ("AWS/ApplicationELB", "UnHealthyHostCount", "Maximum", lb_dimensions,
+                                settings["unhealthy_hosts"]),
+        })
+    return {key: metric for key, metric in metrics.items() if metric[-1] is not None}
+
+
+def create_service_alarms(name, settings, load_balancer, target_group, cluster, service, alarm_actions=None,
+                          opts=None):
+    alarms = {}
+    for key, (namespace, metric, statistic, dimensions, threshold) in alarm_metrics(
+            settings, load_balancer, target_group, cluster, service).items():
+        percentile = statistic.startswith("p")
+        alarms[key] = cloudwatch.MetricAlarm(f"{name}-{key}-alarm",
+                                             alarm_description=f"{name}: {metric} {statistic} above {threshold}",
+                                             namespace=namespace,
+                                             metric_name=metric,
+                                             dimensions=dimensions,
+                                             statistic=None if percentile else statistic,
+                                             extended_statistic=statistic if percentile else None,
+                                             period=settings["period"],
+                                             evaluation_periods=settings["evaluation_periods"],
+                                             threshold=threshold,
+                                             comparison_operator="GreaterThanThreshold",
+                                             # no traffic, no data: not an outage
+                                             treat_missing_data="notBreaching",
+                                             alarm_actions=alarm_actions,
+                                             ok_actions=alarm_actions,
+                                             opts=opts)
+    return alarms
+
+
+def dashboard_body(name, region, period, cluster_name, service_name, lb_suffix=None, tg_suffix=None):
+    lb_dimensions = ["LoadBalancer", lb_suffix, "TargetGroup", tg_suffix]
+
+    def widget(title, metrics, x, y, stat="Sum"):
+        return {"type": "metric", "x": x, "y": y, "width": 12, "height": 6, "properties": {
+            "title": title, "region": region, "period": period, "stat": stat, "view": "timeSeries",
+            "metrics": metrics,
+        }}
+
+    widgets = []
+    if lb_suffix is not None:
+        widgets += [
+            widget(f"{name} response time", [
+                ["AWS/ApplicationELB", "TargetResponseTime", *lb_dimensions, {"stat": stat, "label": stat}]
+                for stat in ("p50", "p90", "p99")
+            ], 0, 0, stat="p99"),
+            widget(f"{name} requests and 5XX", [
+                ["AWS/ApplicationELB", "RequestCount", *lb_dimensions],
+                ["AWS/ApplicationELB", "HTTPCode_Target_5XX_Count", *lb_dimensions],
+                ["AWS/ApplicationELB", "RequestCountPerTarget", "TargetGroup", tg_suffix],
+            ], 12, 0),
+            widget(f"{name} targets", [
+                ["AWS/ApplicationELB", "HealthyHostCount", *lb_dimensions],
+                ["AWS/ApplicationELB", "UnHealthyHostCount", *lb_dimensions],
+            ], 0, 6, stat="Maximum"),
+        ]
+    x, y = (12, 6) if widgets else (0, 0)
+    widgets.append(widget(f"{name} CPU and memory", [
+        ["AWS/ECS", "CPUUtilization", "ClusterName", cluster_name, "ServiceName", service_name],
+        ["AWS/ECS", "MemoryUtilization", "ClusterName", cluster_name, "ServiceName", service_name],
+        ["ECS/ContainerInsights", "RunningTaskCount", "ClusterName", cluster_name, "ServiceName", service_name,
+         {"yAxis": "right"}],
+    ], x, y, stat="Average"))
+    return json.dumps({"widgets": widgets}, sort_keys=True)
+
+
+def create_service_dashboard(name, region, settings, load_balancer, target_group, cluster, service, opts=None):
+    suffixes = [load_balancer.arn_suffix, target_group.arn_suffix] if load_balancer is not None else []
+    body = Output.all(cluster.name, service.name, *suffixes).apply(
+        traced(f"{name}:dashboard-body", lambda args: dashboard_body(name, region, settings["period"], *args)))
+    return cloudwatch.Dashboard(f"{name}-dashboard",
+                                dashboard_name=f"{pulumi.get_stack()}-{name}",
+                                dashboard_body=body,
+                                opts=opts)
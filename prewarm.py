@@ -0,0 +1,79 @@
+"""Pre-warming ahead of known traffic peaks
+
+A cold Fargate task pulls its image, boots the app and then has to pass the
+ALB health checks before it takes traffic, which can take minutes for a
+.NET service. A service's `prewarm` block:
+
+- `lead_minutes`: run the scheduled scale-ups in `scaling.scheduled` (the
+  actions raising `min_capacity` above the service's own) this many minutes
+  early, so the tasks are warm when the peak starts;
+- `slow_start`: seconds over which the ALB ramps a new target up to its full
+  share of requests (the target group's `slow_start`, round-robin only).
+
+Smaller images start faster: `build_target` in the service spec picks a
+slimmer stage of the Dockerfile, and with `images.report_sizes` set the
+pushed image sizes are exported as the `image-sizes` stack output to keep an
+eye on.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+DEFAULTS = {
+    "lead_minutes": 0,
+    "slow_start": None,
+}
+# The ALB accepts slow start between 30s and 15 min
+SLOW_START_RANGE = (30, 900)
+CRON = re.compile(r"^cron\((\d+) (\d+) (.+)\)$")
+AT = re.compile(r"^at\((.+)\)$")
+
+
+def prewarm_settings(service_name, settings):
+    """Merge a service's `prewarm` block with the defaults."""
+    settings = settings or {}
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"services.{service_name}.prewarm: unknown keys {sorted(unknown)}")
+    merged = {**DEFAULTS, **settings}
+    slow_start = merged["slow_start"]
+    if slow_start is not None and not SLOW_START_RANGE[0] <= slow_start <= SLOW_START_RANGE[1]:
+        raise ValueError(f"services.{service_name}.prewarm.slow_start must be between "
+                         f"{SLOW_START_RANGE[0]} and {SLOW_START_RANGE[1]} seconds")
+    if merged["lead_minutes"] < 0:
+        raise ValueError(f"services.{service_name}.prewarm.lead_minutes can't be negative")
+    return merged
+
+
+def shift_schedule(schedule, minutes):
+    """`schedule` moved `minutes` earlier. Works for `at(...)` and for
+    `cron(...)` with a fixed minute and hour, as long as it stays on the same day."""
+    if not minutes:
+        return schedule
+    match = AT.match(schedule)
+    if match:
+        at = datetime.fromisoformat(match.group(1)) - timedelta(minutes=minutes)
+        return f"at({at.isoformat(timespec='seconds')})"
+    match = CRON.match(schedule)
+    if not match:
+        raise ValueError(f"can only pre-warm at() schedules and cron() with a fixed minute and hour, got '{schedule}'")
+    start = int(match.group(2)) * 60 + int(match.group(1)) - minutes
+    if start < 0:
+        raise ValueError(f"pre-warming '{schedule}' by {minutes} minutes moves it to the day before, "
+                         "write the earlier schedule out instead")
+    return f"cron({start % 60} {start // 60} {match.group(3)})"
+
+
+def prewarmed_scaling(service_name, scaling, settings):
+    """`scaling` (merged settings) with its scale-ups moved `lead_minutes` earlier."""
+    if not scaling or not settings["lead_minutes"]:
+        return scaling
+    scheduled = []
+    for action in scaling["scheduled"]:
+        if (action.get("min_capacity") or 0) > scaling["min_capacity"]:
+            try:
+                action = {**action, "schedule": shift_schedule(action["schedule"], settings["lead_minutes"])}
+            except ValueError as e:
+                raise ValueError(f"services.{service_name}.prewarm: {e}") from None
+        scheduled.append(action)
+    return {**scaling, "scheduled": scheduled}
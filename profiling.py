@@ -0,0 +1,141 @@
+"""Opt-in profiling of program evaluation
+
+    PULUMI_PROFILE=profile.json pulumi preview
+
+When `PULUMI_PROFILE` is set, every resource registration (from construction
+until the engine hands back its URN, so including the wait on its inputs),
+every traced apply callback and every invoke wrapped in `span` is timed. At
+exit a Chrome trace is written to the given path (open it in chrome://tracing
+or https://ui.perfetto.dev) and the slowest spans are printed to stderr.
+`PULUMI_PROFILE_TOP` sets how many.
+Works the same under `pulumi.runtime.set_mocks`.
+"""
+
+import asyncio
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pulumi
+
+ENV_VAR = "PULUMI_PROFILE"
+TOP_ENV_VAR = "PULUMI_PROFILE_TOP"
+
+
+class Profiler:
+    def __init__(self, path, top=15):
+        self.path = path
+        self.top = top
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def now(self):
+        return time.perf_counter()
+
+    def add(self, category, name, start, end, **args):
+        with self._lock:
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+
+    @contextmanager
+    def span(self, category, name, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(category, name, start, self.now(), **args)
+
+    def traced(self, name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.span("apply", name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def on_register(self, args):
+        """Stack transformation: runs while the resource is being constructed,
+        the span closes once its URN resolves."""
+        start = self.now()
+        resource, label = args.resource, f"{args.type_}::{args.name}"
+
+        def watch():
+            # the URN output only exists once the constructor has returned
+            resource.urn.apply(lambda _: self.add("register", label, start, self.now(), type=args.type_))
+
+        asyncio.get_event_loop().call_soon(watch)
+        return None
+
+    def summary(self):
+        totals = defaultdict(lambda: [0, 0.0])
+        for event in self.events:
+            totals[event["cat"]][0] += 1
+            totals[event["cat"]][1] += event["dur"] / 1000
+        slowest = sorted(self.events, key=lambda e: e["dur"], reverse=True)[:self.top]
+        wall = max((e["ts"] + e["dur"] for e in self.events), default=0) / 1000
+        return {
+            "wall_ms": round(wall, 1),
+            "categories": {cat: {"count": count, "total_ms": round(ms, 1)}
+                           for cat, (count, ms) in sorted(totals.items())},
+            "slowest": [{"cat": e["cat"], "name": e["name"], "ms": round(e["dur"] / 1000, 1)}
+                        for e in slowest],
+        }
+
+    def write(self):
+        summary = self.summary()
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "otherData": summary}, f)
+        lines = [f"profile written to {self.path} ({summary['wall_ms']} ms wall)"]
+        for cat, stats in summary["categories"].items():
+            lines.append(f"  {cat:<10} {stats['count']:>5} spans {stats['total_ms']:>10.1f} ms")
+        lines.append(f"  top {len(summary['slowest'])}:")
+        for entry in summary["slowest"]:
+            lines.append(f"  {entry['ms']:>10.1f} ms  {entry['cat']:<10} {entry['name']}")
+        print("\n".join(lines), file=sys.stderr)
+
+
+profiler = None
+
+
+def install():
+    """Enable profiling if `PULUMI_PROFILE` is set. Call once at the top of the program."""
+    global profiler
+    path = os.environ.get(ENV_VAR)
+    if not path or profiler is not None:
+        return profiler
+    profiler = Profiler(path, top=int(os.environ.get(TOP_ENV_VAR, "15")))
+    pulumi.runtime.register_stack_transformation(profiler.on_register)
+    atexit.register(profiler.write)
+    return profiler
+
+
+@contextmanager
+def span(category, name, **args):
+    """Time a block, e.g. an invoke. A no-op when profiling is off."""
+    if profiler is None:
+        yield
+        return
+    with profiler.span(category, name, **args):
+        yield
+
+
+def traced(name, fn):
+    """Wrap an apply callback so its run time is recorded under `name`."""
+    if profiler is None:
+        return fn
+    return profiler.traced(name, fn)
@@ -0,0 +1,92 @@
+"""Application Auto Scaling for the ECS services"""
+
+from pulumi import Output
+from pulumi_aws import appautoscaling
+
+# Defaults applied to every service spec that has a `scaling` block
+DEFAULTS = {
+    "min_capacity": 2,
+    "max_capacity": 4,
+    "cpu_target": 60,
+    "memory_target": None,
+    "requests_per_target": None,
+    "scale_in_cooldown": 300,
+    "scale_out_cooldown": 60,
+    "scheduled": [],
+}
+
+
+def scaling_settings(service_name, settings):
+    """Merge a service's `scaling` block from stack config with the defaults,
+    or return None when the service is not configured for autoscaling."""
+    if settings is None:
+        return None
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"scaling.{service_name}: unknown keys {sorted(unknown)}")
+    merged = {**DEFAULTS, **settings}
+    if merged["min_capacity"] > merged["max_capacity"]:
+        raise ValueError(
+            f"scaling.{service_name}: min_capacity ({merged['min_capacity']}) "
+            f"is greater than max_capacity ({merged['max_capacity']})")
+    return merged
+
+
+def create_service_scaling(name, cluster, service, settings, load_balancer=None, target_group=None, opts=None):
+    """Register `service` as a scalable target and attach target-tracking
+    policies on CPU, memory and ALB requests per target, plus any scheduled
+    actions. Policies whose target is unset are skipped."""
+    target = appautoscaling.Target(f"{name}-scaling-target",
+                                   service_namespace="ecs",
+                                   scalable_dimension="ecs:service:DesiredCount",
+                                   resource_id=Output.concat(
+                                       "service/", cluster.name, "/", service.name),
+                                   min_capacity=settings["min_capacity"],
+                                   max_capacity=settings["max_capacity"],
+                                   opts=opts,
+                                   )
+
+    metrics = {
+        "cpu": ("ECSServiceAverageCPUUtilization", settings["cpu_target"], None),
+        "memory": ("ECSServiceAverageMemoryUtilization", settings["memory_target"], None),
+    }
+    if load_balancer is not None and target_group is not None:
+        metrics["requests"] = ("ALBRequestCountPerTarget", settings["requests_per_target"],
+                               Output.concat(load_balancer.arn_suffix, "/", target_group.arn_suffix))
+
+    policies = {}
+    for key, (metric_type, target_value, resource_label) in metrics.items():
+        if target_value is None:
+            continue
+        policies[key] = appautoscaling.Policy(f"{name}-{key}-scaling",
+                                              policy_type="TargetTrackingScaling",
+                                              service_namespace=target.service_namespace,
+                                              scalable_dimension=target.scalable_dimension,
+                                              resource_id=target.resource_id,
+                                              target_tracking_scaling_policy_configuration=appautoscaling.PolicyTargetTrackingScalingPolicyConfigurationArgs(
+                                                  target_value=target_value,
+                                                  scale_in_cooldown=settings["scale_in_cooldown"],
+                                                  scale_out_cooldown=settings["scale_out_cooldown"],
+                                                  predefined_metric_specification=appautoscaling.PolicyTargetTrackingScalingPolicyConfigurationPredefinedMetricSpecificationArgs(
+                                                      predefined_metric_type=metric_type,
+                                                      resource_label=resource_label,
+                                                  ),
+                                              ),
+                                              opts=opts,
+                                              )
+
+    for action in settings["scheduled"]:
+        appautoscaling.ScheduledAction(f"{name}-{action['name']}",
+                                       service_namespace=target.service_namespace,
+                                       scalable_dimension=target.scalable_dimension,
+                                       resource_id=target.resource_id,
+                                       schedule=action["schedule"],
+                                       timezone=action.get("timezone"),
+                                       scalable_target_action=appautoscaling.ScheduledActionScalableTargetActionArgs(
+                                           min_capacity=action.get("min_capacity"),
+                                           max_capacity=action.get("max_capacity"),
+                                       ),
+                                       opts=opts,
+                                       )
+
+    return target, policies
@@ -0,0 +1,410 @@
+"""FargateWebService: one load-balanced Fargate service built from a spec in stack config"""
+
+import re
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+import pulumi
+
+from pulumi import Output
+from pulumi_aws import cloudwatch, ecs, ec2, lb
+import pulumi_awsx as awsx
+
+from capacity import capacity_provider_strategy, spot_interruption_settings, uses_spot
+from cdn import cdn_settings, cloudfront_prefix_list_id, create_distribution, distribution_url
+from containers import BUILD_PLATFORMS, ContainerDefinition, render_container_definitions, task_settings
+from deployment import convergence_estimate, deployment_settings
+from images import in_repository, plan_image, pushed_image_exists, pushed_image_size
+from load_balancing import health_check_args, rule_conditions, target_group_settings
+from logs import (app_log_configuration, awslogs_configuration, create_log_router_role, log_router_definition,
+                  logging_settings)
+from monitoring import alarm_settings, create_service_alarms, create_service_dashboard
+from prewarm import prewarm_settings, prewarmed_scaling
+from profiling import traced
+from scaling import create_service_scaling, scaling_settings
+from service_connect import PORT_NAME, publishes, service_connect_address, service_connect_configuration
+
+# `{web-api}` inside an environment value is replaced by that service's address
+LINK_PATTERN = re.compile(r"\{([a-z0-9-]+)\}")
+
+
+@dataclass
+class ServiceSpec:
+    name: str
+    dockerfile: str
+    context: str
+    public: bool = False
+    container_port: int = 5000
+    listener_port: Optional[int] = None
+    health_check_path: str = "/"
+    desired_count: int = 2
+    environment: dict = field(default_factory=dict)
+    build_args: dict = field(default_factory=dict)
+    # Dockerfile stage to build, e.g. a slimmer runtime stage
+    build_target: Optional[str] = None
+    target_group: dict = field(default_factory=dict)
+    routing: dict = field(default_factory=dict)
+    task: dict = field(default_factory=dict)
+    container: dict = field(default_factory=dict)
+    capacity: dict = field(default_factory=dict)
+    deployment: dict = field(default_factory=dict)
+    logging: dict = field(default_factory=dict)
+    alarms: dict = field(default_factory=dict)
+    cdn: Optional[dict] = None
+    prewarm: dict = field(default_factory=dict)
+    scaling: Optional[dict] = None
+    url_output: Optional[str] = None
+
+    def __post_init__(self):
+        if self.listener_port is None:
+            self.listener_port = 80 if self.public else self.container_port
+
+    @classmethod
+    def from_config(cls, raw):
+        known = {f.name for f in fields(cls)}
+        unknown = set(raw) - known
+        if unknown:
+            raise ValueError(
+                f"services.{raw.get('name', '?')}: unknown keys {sorted(unknown)}")
+        return cls(**raw)
+
+    def links(self):
+        """Names of the other services this one references in its environment."""
+        return {name for value in self.environment.values() for name in LINK_PATTERN.findall(str(value))}
+
+
+def load_service_specs(config):
+    """Parse the `services` list from stack config, checking that each service
+    only links to services declared before it."""
+    specs = [ServiceSpec.from_config(raw) for raw in config.require_object("services")]
+    seen = set()
+    for spec in specs:
+        if spec.name in seen:
+            raise ValueError(f"services: duplicate service name '{spec.name}'")
+        missing = spec.links() - seen
+        if missing:
+            raise ValueError(
+                f"services.{spec.name}: environment references {sorted(missing)} "
+                "which must be declared earlier in the list")
+        seen.add(spec.name)
+    return specs
+
+
+def resolve_environment(environment, addresses):
+    """Turn the spec environment into an Output of ECS `environment` entries,
+    substituting `{service}` placeholders with the linked service address."""
+    names = sorted({name for value in environment.values() for name in LINK_PATTERN.findall(str(value))})
+
+    def render(resolved):
+        lookup = dict(zip(names, resolved))
+        return [{"name": key, "value": LINK_PATTERN.sub(lambda m: lookup[m.group(1)], str(value))}
+                for key, value in environment.items()]
+
+    return Output.all(*[addresses[name] for name in names]).apply(traced("resolve-environment", render))
+
+
+class FargateWebService(pulumi.ComponentResource):
+    def __init__(self, spec, region, cluster, vpc_id, public_subnet_ids, private_subnet_ids,
+                 internal_ingress_cidr_blocks, execution_role, addresses, tags,
+                 image_cache=None, skip_unchanged_images=True, report_image_size=False, shared_lb=None, rule_priority=None,
+                 capacity_providers=None, alarm_actions=None, service_connect=None, opts=None):
+        super().__init__("pulumi-python:ecs:FargateWebService", spec.name, None, opts)
+        name = spec.name
+        # Children used to live at the stack root, keep their URNs stable
+        child = pulumi.ResourceOptions(parent=self, aliases=[
+                                       pulumi.Alias(parent=pulumi.ROOT_STACK_RESOURCE)])
+        subnet_ids = public_subnet_ids if spec.public else private_subnet_ids
+        published = publishes(spec, service_connect)
+        cdn = cdn_settings(name, spec.cdn, spec.public)
+        if cdn and shared_lb:
+            # the shared ALB also carries the internal services, it can't only admit CloudFront
+            pulumi.log.warn(f"services.{name}.cdn: skipped, the shared load balancer can't sit behind CloudFront",
+                            resource=self)
+            cdn = None
+        task, container = task_settings(name, spec.task, spec.container)
+        logging = logging_settings(name, spec.logging, task, container)
+        deployment = deployment_settings(name, spec.deployment)
+        prewarm = prewarm_settings(name, spec.prewarm)
+        target_group = target_group_settings(name, spec.target_group,
+                                             {**deployment["target_group"], "slow_start": prewarm["slow_start"]})
+        strategy = capacity_provider_strategy(name, spec.capacity, task)
+        if uses_spot(strategy):
+            container, target_group = spot_interruption_settings(name, container, target_group)
+        platform = BUILD_PLATFORMS[task["cpu_architecture"]]
+
+        self.repo = awsx.ecr.Repository(f"{name}-repo", tags=tags, force_delete=True, opts=child)
+
+        # Build and publish the docker image, unless this build context was already pushed
+        plan = plan_image(name, spec.context, spec.dockerfile, image_cache, spec.build_args, platform,
+                          spec.build_target)
+        reuse = plan.skip and skip_unchanged_images
+        if reuse and not pushed_image_exists(plan.cached_uri):
+            pulumi.log.info(f"build context unchanged but {plan.cached_uri} is gone from ECR, rebuilding",
+                            resource=self)
+            reuse = False
+        if reuse:
+            pulumi.log.info(f"build context unchanged, reusing {plan.cached_uri}", resource=self)
+            self.image = None
+            image_uri = self.repo.url.apply(lambda url: in_repository(plan.cached_uri, url))
+        else:
+            self.image = awsx.ecr.Image(f"{name}-image",
+                                        repository_url=self.repo.url,
+                                        dockerfile=spec.dockerfile,
+                                        path=spec.context,
+                                        # BuildKit with inline cache metadata, so the next build
+                                        # can reuse layers straight from the last pushed image
+                                        env={"DOCKER_BUILDKIT": "1"},
+                                        args={**spec.build_args, "BUILDKIT_INLINE_CACHE": "1"},
+                                        cache_from=[self.repo.url] + ([plan.previous_uri] if plan.previous_uri else []),
+                                        extra_options=["--platform", platform],
+                                        target=spec.build_target,
+                                        opts=child)
+            image_uri = self.image.image_uri
+            if image_cache and plan.fingerprint and not pulumi.runtime.is_dry_run():
+                image_uri.apply(traced(f"{name}:record-image",
+                                       lambda uri: image_cache.record(name, plan.fingerprint, uri)))
+
+        if published:
+            # Reached through Service Connect, no load balancer in front
+            self.lb_sg = None
+        elif shared_lb:
+            # Behind the shared ALB: no load balancer of our own, just a listener rule
+            self.lb_sg = shared_lb.security_group
+            if not spec.public:
+                pulumi.log.warn(f"{name} is not public, but the shared load balancer is internet-facing: "
+                                "its routing rules are reachable from anywhere", resource=self)
+        else:
+            self.lb_sg = ec2.SecurityGroup(f"{name}-lb-sg",
+                                           description=(f"Allow inbound access from {spec.listener_port} for {name}"
+                                                        if spec.public else "Allow inbound access from the public subnet"),
+                                           vpc_id=vpc_id,
+                                           ingress=[
+                                               ec2.SecurityGroupIngressArgs(
+                                                   protocol='tcp',
+                                                   from_port=spec.listener_port,
+                                                   to_port=spec.listener_port,
+                                                   cidr_blocks=None if cdn else (['0.0.0.0/0'] if spec.public
+                                                                                 else internal_ingress_cidr_blocks),
+                                                   # behind CloudFront, only its origin-facing ranges
+                                                   prefix_list_ids=[cloudfront_prefix_list_id()] if cdn else None,
+                                               )
+                                           ],
+                                           egress=[
+                                               ec2.SecurityGroupEgressArgs(
+                                                   protocol='-1',
+                                                   from_port=0,
+                                                   to_port=0,
+                                                   cidr_blocks=['0.0.0.0/0'],
+                                               )
+                                           ],
+                                           tags=tags,
+                                           opts=child,
+                                           )
+
+        self.app_sg = ec2.SecurityGroup(f"{name}-app-sg",
+                                        description=(f"Allow inbound access from {spec.container_port} for {name}"
+                                                     if spec.public else "Allow inbound access from the public subnet"),
+                                        vpc_id=vpc_id,
+                                        ingress=[
+                                            ec2.SecurityGroupIngressArgs(
+                                                protocol='tcp',
+                                                from_port=spec.container_port,
+                                                to_port=spec.container_port,
+                                                security_groups=None if published else [self.lb_sg.id],
+                                                cidr_blocks=service_connect.ingress_cidr_blocks if published else None,
+                                            )
+                                        ],
+                                        egress=[
+                                            ec2.SecurityGroupEgressArgs(
+                                                protocol='-1',
+                                                from_port=0,
+                                                to_port=0,
+                                                cidr_blocks=['0.0.0.0/0'],
+                                            )
+                                        ],
+                                        tags=tags,
+                                        opts=child,
+                                        )
+
+        # Address other services use to reach this one, see `resolve_environment`.
+        # A Service Connect service's is set once its ECS service is declared
+        if published:
+            self.target_group = None
+            self.load_balancer = None
+            self.listener = None
+        else:
+            self.target_group = lb.TargetGroup(f"{name}-tg",
+                                               port=spec.container_port,
+                                               protocol='HTTP',
+                                               target_type='ip',
+                                               vpc_id=vpc_id,
+                                               deregistration_delay=target_group["deregistration_delay"],
+                                               slow_start=target_group["slow_start"],
+                                               load_balancing_algorithm_type=target_group["algorithm"],
+                                               health_check=health_check_args(spec.health_check_path,
+                                                                              target_group["health_check"]),
+                                               tags=tags,
+                                               opts=child,
+                                               )
+
+            if shared_lb:
+                self.load_balancer = shared_lb.load_balancer
+                self.listener = lb.ListenerRule(f"{name}-rule",
+                                                listener_arn=shared_lb.listener.arn,
+                                                priority=rule_priority,
+                                                conditions=rule_conditions(name, spec.routing),
+                                                actions=[lb.ListenerRuleActionArgs(
+                                                    type="forward",
+                                                    target_group_arn=self.target_group.arn,
+                                                )], tags=tags, opts=child)
+                listener_port = shared_lb.port
+            else:
+                self.load_balancer = lb.LoadBalancer(f"{name}-lb",
+                                                     security_groups=[self.lb_sg.id],
+                                                     subnets=subnet_ids,
+                                                     internal=not spec.public,
+                                                     tags=tags,
+                                                     opts=child)
+
+                self.listener = lb.Listener(f"{name}-listener",
+                                            load_balancer_arn=self.load_balancer.arn,
+                                            port=spec.listener_port,
+                                            protocol="HTTP",
+                                            default_actions=[lb.ListenerDefaultActionArgs(
+                                                type="forward",
+                                                target_group_arn=self.target_group.arn,
+                                            )], tags=tags, opts=child)
+                listener_port = spec.listener_port
+
+            self.address = Output.concat(self.load_balancer.dns_name, ":", str(listener_port))
+            self.url = Output.concat("http://", self.load_balancer.dns_name)
+
+        self.distribution = None
+        if cdn:
+            self.distribution = create_distribution(name, self.load_balancer, cdn, tags, opts=child)
+            self.url = distribution_url(self.distribution)
+
+        # Compressed size of the pushed image in MiB, smaller images start faster. Opt-in,
+        # it costs an ECR call on every update
+        self.image_size = None
+        if report_image_size:
+            self.image_size = image_uri.apply(traced(f"{name}:image-size", pushed_image_size))
+
+        # Each service logs to its own group, see `logging` in the service specs
+        self.log_group = cloudwatch.LogGroup(f"{name}-log-group",
+                                             retention_in_days=logging["retention_days"],
+                                             tags=tags,
+                                             opts=child)
+        self.task_role, task_role_policy = None, None
+        if logging["firelens"]:
+            self.task_role, task_role_policy = create_log_router_role(name, self.log_group, tags, opts=child)
+
+        container_name = f"{name}-container"
+
+        def definitions(args):
+            image, environment, log_group_name = args
+            log_router = log_router_definition(log_group_name, region, logging)
+            app = ContainerDefinition.from_settings(name=container_name,
+                                                    image=image,
+                                                    port=spec.container_port,
+                                                    log_configuration=app_log_configuration(log_group_name, region,
+                                                                                            logging),
+                                                    environment=environment,
+                                                    settings=container,
+                                                    depends_on=[log_router.name] if log_router else (),
+                                                    port_name=PORT_NAME if published else None)
+            return render_container_definitions([app] + ([log_router] if log_router else []))
+
+        container_definitions = Output.all(image_uri,
+                                           resolve_environment(spec.environment, addresses),
+                                           self.log_group.name).apply(traced(f"{name}:container-definitions",
+                                                                             definitions))
+
+        self.task_definition = ecs.TaskDefinition(f"{name.replace('-', '_')}-app-task",
+                                                  family=f"{name}-task",
+                                                  cpu=str(task["cpu"]),
+                                                  memory=str(task["memory"]),
+                                                  network_mode="awsvpc",
+                                                  requires_compatibilities=["FARGATE"],
+                                                  runtime_platform=ecs.TaskDefinitionRuntimePlatformArgs(
+                                                      operating_system_family="LINUX",
+                                                      cpu_architecture=task["cpu_architecture"],
+                                                  ),
+                                                  execution_role_arn=execution_role.arn,
+                                                  # Fluent Bit calls CloudWatch Logs with the task role
+                                                  task_role_arn=self.task_role.arn if self.task_role else None,
+                                                  container_definitions=container_definitions,
+                                                  opts=pulumi.ResourceOptions.merge(child, pulumi.ResourceOptions(
+                                                      depends_on=[task_role_policy] if task_role_policy else [])))
+
+        scaling = prewarmed_scaling(name, scaling_settings(name, spec.scaling), prewarm)
+        if published and scaling and scaling["requests_per_target"]:
+            # like its ALB alarms, the request-count policy has no load balancer to follow
+            pulumi.log.warn(f"scaling.{name}: requests_per_target needs a load balancer, the service is reached "
+                            "through Service Connect and scales on CPU and memory only", resource=self)
+            scaling = {**scaling, "requests_per_target": None}
+        desired_count = scaling["min_capacity"] if scaling else spec.desired_count
+        pulumi.log.debug(f"deployment preset {deployment['preset']}: a rollout converges in about "
+                         f"{convergence_estimate(deployment, target_group, desired_count)}s", resource=self)
+        network_configuration = {
+            "subnets": subnet_ids,
+            "security_groups": [self.app_sg.id]
+        }
+        if spec.public:
+            network_configuration["assign_public_ip"] = "true"
+
+        self.service = ecs.Service(f"{name}-svc",
+                                   cluster=cluster.arn,
+                                   desired_count=desired_count,
+                                   launch_type=None if strategy else "FARGATE",
+                                   capacity_provider_strategies=strategy,
+                                   task_definition=self.task_definition.arn,
+                                   network_configuration=network_configuration,
+                                   load_balancers=[] if published else [{
+                                       "target_group_arn": self.target_group.arn,
+                                       "container_name": container_name,
+                                       "container_port": spec.container_port
+                                   }],
+                                   service_connect_configuration=service_connect_configuration(
+                                       spec, service_connect,
+                                       awslogs_configuration(self.log_group.name, region, "service-connect", logging),
+                                   ) if service_connect else None,
+                                   deployment_maximum_percent=deployment["maximum_percent"],
+                                   deployment_minimum_healthy_percent=deployment["minimum_healthy_percent"],
+                                   # stop and roll back a rollout whose tasks keep failing
+                                   deployment_circuit_breaker=ecs.ServiceDeploymentCircuitBreakerArgs(
+                                       enable=deployment["circuit_breaker"],
+                                       rollback=deployment["rollback"],
+                                   ),
+                                   opts=pulumi.ResourceOptions.merge(child, pulumi.ResourceOptions(
+                                       depends_on=([self.listener] if self.listener else []) + ([capacity_providers] if strategy and capacity_providers else []),
+                                       # the scaling policies own the task count once enabled
+                                       ignore_changes=["desired_count"] if scaling else None)),
+                                   # only valid with a load balancer
+                                   health_check_grace_period_seconds=None if published else deployment["health_check_grace_period"],
+                                   tags=tags
+                                   )
+
+        if published:
+            # Clients only resolve the endpoints that exist when their tasks start,
+            # going through the service makes them deploy after it
+            self.address = self.service.id.apply(lambda _: service_connect_address(spec))
+            self.url = Output.concat("http://", self.address)
+
+        if scaling:
+            create_service_scaling(f"{name}-svc", cluster, self.service, scaling,
+                                   load_balancer=self.load_balancer, target_group=self.target_group,
+                                   opts=child)
+
+        # What on-call looks at after a deploy, see `alarms` in the service specs
+        alarms = alarm_settings(name, spec.alarms)
+        self.alarms = create_service_alarms(name, alarms, self.load_balancer, self.target_group, cluster,
+                                            self.service, alarm_actions=alarm_actions, opts=child)
+        self.dashboard = create_service_dashboard(name, region, alarms, self.load_balancer, self.target_group,
+                                                  cluster, self.service, opts=child)
+
+        self.register_outputs({
+            "url": self.url,
+            "address": self.address,
+            "image_size": self.image_size,
+        })
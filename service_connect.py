@@ -0,0 +1,78 @@
+"""ECS Service Connect between the services
+
+With `pulumi-python:service_connect` enabled, every service joins one Cloud Map
+namespace. Internal (non-public) services publish their container port under
+their own name and get no load balancer: a caller reaches
+`http://web-api:5000` through the Service Connect proxy in its own task, which
+balances over the healthy tasks, retries failed connections and ejects tasks
+that keep failing. Public services stay behind their ALB and are Service
+Connect clients only.
+"""
+
+from dataclasses import dataclass
+
+from pulumi_aws import ecs, servicediscovery
+
+DEFAULTS = {"enabled": False, "namespace": "web.internal"}
+# Port mapping name the published services use
+PORT_NAME = "http"
+
+
+@dataclass
+class ServiceConnect:
+    namespace: servicediscovery.HttpNamespace
+    # who may call the published services, the whole VPC
+    ingress_cidr_blocks: list
+
+
+def service_connect_settings(settings):
+    settings = settings or {}
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"service_connect: unknown keys {sorted(unknown)}")
+    return {**DEFAULTS, **settings}
+
+
+def create_service_connect(settings, vpc_cidr_block, tags):
+    """The namespace for `settings` (the `service_connect` config block), or
+    None when Service Connect is off."""
+    if not settings["enabled"]:
+        return None
+    namespace = servicediscovery.HttpNamespace("service-connect-namespace",
+                                               name=settings["namespace"],
+                                               description="Service Connect namespace of the web services",
+                                               tags=tags)
+    return ServiceConnect(namespace=namespace, ingress_cidr_blocks=[vpc_cidr_block])
+
+
+def publishes(spec, service_connect):
+    """Whether the service is reached through Service Connect instead of a load balancer."""
+    return service_connect is not None and not spec.public
+
+
+def service_connect_address(spec):
+    return f"{spec.name}:{spec.container_port}"
+
+
+def service_connect_configuration(spec, service_connect, log_configuration):
+    """The `service_connect_configuration` of the ECS service: a client of the
+    namespace, and for internal services also a published endpoint."""
+    services = None
+    if publishes(spec, service_connect):
+        services = [ecs.ServiceServiceConnectConfigurationServiceArgs(
+            port_name=PORT_NAME,
+            discovery_name=spec.name,
+            client_alias=[ecs.ServiceServiceConnectConfigurationServiceClientAliasArgs(
+                port=spec.container_port,
+                dns_name=spec.name,
+            )],
+        )]
+    return ecs.ServiceServiceConnectConfigurationArgs(
+        enabled=True,
+        namespace=service_connect.namespace.arn,
+        services=services,
+        log_configuration=ecs.ServiceServiceConnectConfigurationLogConfigurationArgs(
+            log_driver=log_configuration.driver,
+            options=log_configuration.options,
+        ),
+    )
@@ -0,0 +1,94 @@
+"""Subnet layout planner
+
+Splits the VPC CIDR into one block per tier (public, private, optionally
+isolated) and each tier block into one subnet per availability zone. Subnets
+are sized from the task density they must hold, since every Fargate task in
+`awsvpc` mode takes an ENI, hence an address, in its subnet.
+
+Every tier reserves room for `reserved_azs` subnets, so growing the AZ count
+up to that number only adds subnets and never moves existing ones. `start`
+leaves the VPC below an address alone, e.g. subnets created before the
+planner, which the new ones must not overlap while both exist.
+"""
+
+import ipaddress
+import math
+
+TIERS = ("public", "private", "isolated")
+# AWS keeps the first four and the last address of every subnet
+AWS_RESERVED_ADDRESSES = 5
+MIN_PREFIX = 28
+DEFAULT_SURGE = 2.0
+DEFAULT_RESERVED_AZS = 4
+DEFAULT_TIERS = {
+    "public": {"tasks_per_az": 250},
+    "private": {"tasks_per_az": 500},
+}
+
+
+def prefix_for_tasks(tasks_per_az, surge=DEFAULT_SURGE):
+    """Smallest subnet prefix that fits `tasks_per_az` tasks while a rolling
+    deployment runs `surge` times as many."""
+    if tasks_per_az < 1:
+        raise ValueError(f"tasks_per_az must be at least 1, got {tasks_per_az}")
+    addresses = math.ceil(tasks_per_az * surge) + AWS_RESERVED_ADDRESSES
+    return min(MIN_PREFIX, 32 - math.ceil(math.log2(addresses)))
+
+
+def tier_prefix(tier, sizing):
+    if "prefix" in sizing and "tasks_per_az" in sizing:
+        raise ValueError(f"subnets.{tier}: set either prefix or tasks_per_az, not both")
+    if "prefix" in sizing:
+        prefix = sizing["prefix"]
+    elif "tasks_per_az" in sizing:
+        prefix = prefix_for_tasks(sizing["tasks_per_az"], sizing.get("surge", DEFAULT_SURGE))
+    else:
+        raise ValueError(f"subnets.{tier}: prefix or tasks_per_az is required")
+    if not 16 <= prefix <= MIN_PREFIX:
+        raise ValueError(f"subnets.{tier}: prefix /{prefix} is outside the /16-/{MIN_PREFIX} AWS allows")
+    return prefix
+
+
+def plan_subnets(vpc_cidr, az_count, tiers, reserved_azs=DEFAULT_RESERVED_AZS, start=None):
+    """Return `{tier: [cidr per AZ]}` for the tiers present in `tiers`.
+
+    `tiers` maps a tier name to its sizing, either `{"prefix": 22}` or
+    `{"tasks_per_az": 500, "surge": 2.0}`. Tier blocks are laid out largest
+    first so every block stays aligned and nothing overlaps, from `start`
+    (an address in the VPC, default its first). Raises ValueError when the
+    layout does not fit in `vpc_cidr`.
+    """
+    vpc = ipaddress.ip_network(vpc_cidr)
+    first = ipaddress.ip_address(start) if start else vpc.network_address
+    if first not in vpc:
+        raise ValueError(f"subnets: start {first} is outside {vpc}")
+    if az_count < 1:
+        raise ValueError(f"az_count must be at least 1, got {az_count}")
+    unknown = set(tiers) - set(TIERS)
+    if unknown:
+        raise ValueError(f"subnets: unknown tiers {sorted(unknown)}, expected some of {TIERS}")
+    if "public" not in tiers or "private" not in tiers:
+        raise ValueError("subnets: public and private tiers are required")
+
+    slots = max(az_count, reserved_azs or 0)
+    slot_bits = math.ceil(math.log2(slots)) if slots > 1 else 0
+    prefixes = {tier: tier_prefix(tier, tiers[tier]) for tier in TIERS if tier in tiers}
+
+    # a tier block holds `slots` subnets, rounded up to a power of two
+    blocks = sorted(prefixes, key=lambda tier: (prefixes[tier] - slot_bits, TIERS.index(tier)))
+    layout = {}
+    cursor = int(first)
+    for tier in blocks:
+        block_prefix = prefixes[tier] - slot_bits
+        if block_prefix < vpc.prefixlen:
+            raise ValueError(
+                f"subnets.{tier}: {slots} subnets of /{prefixes[tier]} do not fit in {vpc}")
+        size = 1 << (vpc.max_prefixlen - block_prefix)
+        cursor = -(-cursor // size) * size  # align up, past `start` only the first block moves
+        block = ipaddress.ip_network((cursor, block_prefix))
+        if not block.subnet_of(vpc):
+            raise ValueError(f"subnets: the {', '.join(blocks)} tiers do not fit in {vpc}")
+        subnets = list(block.subnets(new_prefix=prefixes[tier]))
+        layout[tier] = [str(subnet) for subnet in subnets[:az_count]]
+        cursor += size
+    return {tier: layout[tier] for tier in TIERS if tier in layout}
@@ -0,0 +1,18 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# the program's modules and `tools` live at the repository root
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from tools.mocks import load_stack_config  # noqa: E402
+
+
+@pytest.fixture
+def dev_services():
+    """A fresh copy of the dev stack's `services` list, to edit for a test."""
+    return json.loads(load_stack_config("dev")["pulumi-python:services"])
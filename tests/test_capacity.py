@@ -0,0 +1,106 @@
+"""Capacity-provider presets, evaluated under mocks"""
+
+import json
+
+import pytest
+
+from capacity import capacity_provider_strategy, spot_interruption_settings, uses_spot
+from tools.mocks import evaluate
+
+SERVICE = "aws:ecs/service:Service"
+X86 = {"cpu_architecture": "X86_64"}
+
+EXPECTED = {
+    "launch_type": None,
+    "on_demand": [{"capacityProvider": "FARGATE", "base": 2, "weight": 1}],
+    "balanced": [{"capacityProvider": "FARGATE", "base": 2, "weight": 1},
+                 {"capacityProvider": "FARGATE_SPOT", "weight": 3}],
+    "spot": [{"capacityProvider": "FARGATE", "base": 2, "weight": 0},
+             {"capacityProvider": "FARGATE_SPOT", "weight": 1}],
+}
+
+
+def evaluate_api(dev_services, capacity):
+    api = dev_services[0]
+    api["capacity"] = capacity
+    # Spot only runs X86_64 tasks
+    api["task"]["cpu_architecture"] = "X86_64"
+    # leave the deregistration delay to the Spot defaults
+    api["deployment"] = {"preset": "standard"}
+    api["target_group"].pop("deregistration_delay")
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services})
+    [container] = json.loads(mocks.find("aws:ecs/taskDefinition:TaskDefinition", "web_api-app-task")
+                             ["containerDefinitions"])
+    return mocks.find(SERVICE, "web-api-svc"), container, mocks.find("aws:lb/targetGroup:TargetGroup", "web-api-tg")
+
+
+@pytest.mark.parametrize("preset", EXPECTED)
+def test_presets(dev_services, preset):
+    service, container, target_group = evaluate_api(dev_services, {"preset": preset, "base": 2})
+    if EXPECTED[preset] is None:
+        assert service["launchType"] == "FARGATE"
+        assert "capacityProviderStrategies" not in service
+    else:
+        assert "launchType" not in service
+        assert service["capacityProviderStrategies"] == EXPECTED[preset]
+
+    if preset in ("balanced", "spot"):
+        # drained and stopped within the two-minute interruption notice
+        assert container["stopTimeout"] == 120
+        assert target_group["deregistrationDelay"] == 30
+    else:
+        assert "stopTimeout" not in container
+        assert "deregistrationDelay" not in target_group
+
+
+def test_default_is_the_launch_type(dev_services):
+    service, _, _ = evaluate_api(dev_services, {})
+    assert service["launchType"] == "FARGATE"
+
+
+def test_cluster_offers_both_providers():
+    mocks, _ = evaluate()
+    providers = mocks.find("aws:ecs/clusterCapacityProviders:ClusterCapacityProviders",
+                           "web-cluster-capacity-providers")
+    assert providers["capacityProviders"] == ["FARGATE", "FARGATE_SPOT"]
+
+
+def test_custom_strategy():
+    strategy = [{"capacity_provider": "FARGATE_SPOT", "weight": 2}, {"capacity_provider": "FARGATE", "base": 1}]
+    assert capacity_provider_strategy("api", {"strategy": strategy}, X86) == strategy
+    assert uses_spot(strategy)
+    assert not uses_spot([{"capacity_provider": "FARGATE_SPOT", "weight": 0}, {"capacity_provider": "FARGATE", "weight": 1}])
+
+
+@pytest.mark.parametrize("capacity, message", [
+    ({"preset": "reserved"}, "preset must be one of"),
+    ({"strategy": [{"weight": 1}]}, "needs a capacity_provider"),
+    ({"strategy": [{"capacity_provider": "EC2", "weight": 1}]}, "unknown capacity provider"),
+    ({"strategy": [{"capacity_provider": "FARGATE", "base": 1, "weight": 1},
+                   {"capacity_provider": "FARGATE_SPOT", "base": 1, "weight": 1}]}, "only one provider"),
+    ({"strategy": [{"capacity_provider": "FARGATE", "base": 1}]}, "weight above 0"),
+])
+def test_invalid_capacity(capacity, message):
+    with pytest.raises(ValueError, match=message):
+        capacity_provider_strategy("api", capacity, X86)
+
+
+@pytest.mark.parametrize("capacity", [{"preset": "balanced"}, {"preset": "spot"},
+                                      {"strategy": [{"capacity_provider": "FARGATE_SPOT", "weight": 1}]}])
+def test_spot_rejects_arm64(capacity):
+    with pytest.raises(ValueError, match="FARGATE_SPOT doesn't run ARM64"):
+        capacity_provider_strategy("api", capacity, {"cpu_architecture": "ARM64"})
+
+
+def test_arm64_runs_on_demand(dev_services):
+    assert capacity_provider_strategy("api", {"preset": "on_demand"}, {"cpu_architecture": "ARM64"})
+    dev_services[0]["capacity"] = {"preset": "balanced"}
+    with pytest.raises(ValueError, match="ARM64"):
+        evaluate(config={"pulumi-python:services": dev_services})
+
+
+def test_spot_deregistration_must_beat_the_notice():
+    container, target_group = spot_interruption_settings("api", {"stop_timeout": 60}, {"deregistration_delay": None})
+    assert (container["stop_timeout"], target_group["deregistration_delay"]) == (60, 30)
+    with pytest.raises(ValueError, match="interruption notice"):
+        spot_interruption_settings("api", {"stop_timeout": None}, {"deregistration_delay": 120})
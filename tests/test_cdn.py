@@ -0,0 +1,57 @@
+"""The CloudFront distribution and the load balancer lockdown, evaluated under mocks"""
+
+import pytest
+
+from cdn import CACHING_DISABLED_POLICY, cdn_settings
+from tools.mocks import evaluate
+
+DISTRIBUTION = "aws:cloudfront/distribution:Distribution"
+SECURITY_GROUP = "aws:ec2/securityGroup:SecurityGroup"
+
+
+@pytest.fixture(scope="module")
+def dev():
+    mocks, _ = evaluate()
+    return mocks
+
+
+def test_load_balancer_is_the_origin(dev):
+    distribution = dev.find(DISTRIBUTION, "web-ui-cdn")
+    [origin] = distribution["origins"]
+    assert origin["domainName"] == "web-ui-lb.us-east-2.elb.amazonaws.com"
+    assert origin["customOriginConfig"]["originProtocolPolicy"] == "http-only"
+    assert dev.outputs["web-lb-url"] == "https://web-ui-cdn.cloudfront.net"
+
+
+def test_static_paths_are_cached_and_the_rest_passes_through(dev):
+    distribution = dev.find(DISTRIBUTION, "web-ui-cdn")
+    behaviors = distribution["orderedCacheBehaviors"]
+    assert [behavior["pathPattern"] for behavior in behaviors] == ["/css/*", "/js/*", "/lib/*", "/favicon.ico"]
+    assert {behavior["cachePolicyId"] for behavior in behaviors} == {"web-ui-static-cache-policy-id"}
+    assert distribution["defaultCacheBehavior"]["cachePolicyId"] == CACHING_DISABLED_POLICY
+
+
+def test_load_balancer_only_admits_cloudfront(dev):
+    [rule] = dev.find(SECURITY_GROUP, "web-ui-lb-sg")["ingress"]
+    assert rule["prefixListIds"] == ["pl-00000000"]
+    assert "cidrBlocks" not in rule
+    # web-api has no cdn block and stays reachable directly
+    [rule] = dev.find(SECURITY_GROUP, "web-api-lb-sg")["ingress"]
+    assert "prefixListIds" not in rule
+
+
+def test_shared_load_balancer_skips_the_distribution():
+    mocks, _ = evaluate(config={"pulumi-python:load_balancing": {"mode": "shared"}})
+    assert not mocks.of_type(DISTRIBUTION)
+    assert mocks.outputs["web-lb-url"].startswith("http://web-alb.")
+
+
+def test_settings():
+    assert cdn_settings("web-ui", None, public=True) is None
+    assert cdn_settings("web-ui", {"static_ttl": 60}, public=True)["static_ttl"] == 60
+    with pytest.raises(ValueError, match="only public services"):
+        cdn_settings("web-api", {}, public=False)
+    with pytest.raises(ValueError, match="unknown keys"):
+        cdn_settings("web-ui", {"ttl": 60}, public=True)
+    with pytest.raises(ValueError, match="origin_keepalive_timeout"):
+        cdn_settings("web-ui", {"origin_keepalive_timeout": 90}, public=True)
@@ -0,0 +1,98 @@
+"""Fargate task sizing and the rendered container definitions"""
+
+import json
+import random
+
+import pytest
+
+from containers import (BUILD_PLATFORMS, ContainerDefinition, HealthCheck, LogConfiguration,
+                        render_container_definitions, task_settings, validate_task_size)
+
+LOGS = LogConfiguration(driver="awslogs", options={"awslogs-group": "web-api-log-group"})
+
+
+@pytest.mark.parametrize("cpu, memory", [(256, 512), (512, 4096), (1024, 2048), (4096, 30720), (16384, 122880)])
+def test_fargate_sizes(cpu, memory):
+    validate_task_size(cpu, memory)
+
+
+@pytest.mark.parametrize("cpu, memory, message", [
+    (300, 512, "cpu must be one of"),
+    (256, 4096, r"takes memory \(512, 1024, 2048\)"),
+    (1024, 1024, "2048-8192 in steps of 1024"),
+    (8192, 18432, "16384-61440 in steps of 4096"),
+])
+def test_invalid_fargate_sizes(cpu, memory, message):
+    with pytest.raises(ValueError, match=message):
+        validate_task_size(cpu, memory)
+
+
+def test_task_settings_defaults():
+    task, container = task_settings("web-api", None, None)
+    assert task == {"cpu": 512, "memory": 1024, "cpu_architecture": "X86_64"}
+    assert (container["cpu"], container["memory"], container["stop_timeout"]) == (256, 512, None)
+    assert BUILD_PLATFORMS[task_settings("web-api", {"cpu_architecture": "ARM64"}, None)[0]["cpu_architecture"]] \
+        == "linux/arm64"
+
+
+@pytest.mark.parametrize("task, container, message", [
+    ({"cpu": 256, "memory": 4096}, None, r"services.web-api.task: Fargate task with cpu 256"),
+    ({"cpu_architecture": "ARM"}, None, "cpu_architecture must be one of"),
+    ({"cpu": 256, "memory": 512}, {"cpu": 512}, "does not fit in the task's cpu 256"),
+    (None, {"memory": 2048}, "does not fit"),
+    (None, {"stop_timeout": 1}, "stop_timeout must be between 2 and 120"),
+    (None, {"stop_timeout": 121}, "stop_timeout must be between 2 and 120"),
+])
+def test_invalid_task_settings(task, container, message):
+    with pytest.raises(ValueError, match=message):
+        task_settings("web-api", task, container)
+
+
+def test_stop_timeout_bounds_are_inclusive():
+    for stop_timeout in (2, 120):
+        assert task_settings("web-api", None, {"stop_timeout": stop_timeout})[1]["stop_timeout"] == stop_timeout
+
+
+def definition(environment, **overrides):
+    return ContainerDefinition(name="web-api-container", image="repo:abc", port=5000, log_configuration=LOGS,
+                               environment=environment, **overrides)
+
+
+def test_rendering_ignores_environment_order():
+    environment = [{"name": f"VAR_{i}", "value": str(i)} for i in range(20)]
+    rendered = render_container_definitions([definition(environment)])
+    for seed in range(5):
+        shuffled = environment[:]
+        random.Random(seed).shuffle(shuffled)
+        assert render_container_definitions([definition(shuffled)]) == rendered
+    [app] = json.loads(rendered)
+    assert [variable["name"] for variable in app["environment"]] == sorted(f"VAR_{i}" for i in range(20))
+
+
+def test_rendering_only_changes_with_a_setting():
+    base = render_container_definitions([definition([])])
+    assert render_container_definitions([definition([])]) == base
+    assert render_container_definitions([definition([], stop_timeout=30)]) != base
+
+
+def test_optional_fields_are_left_out():
+    [app] = json.loads(render_container_definitions([definition([], memory=None)]))
+    assert not {"memory", "memoryReservation", "ulimits", "stopTimeout", "healthCheck", "dependsOn"} & set(app)
+    assert app["portMappings"] == [{"containerPort": 5000, "hostPort": 5000, "protocol": "tcp"}]
+
+
+def test_from_settings():
+    _, settings = task_settings("web-api", None, {
+        "stop_timeout": 30,
+        "ulimits": [{"name": "nofile", "soft_limit": 4096, "hard_limit": 8192}],
+        "health_check": {"command": ["CMD-SHELL", "curl -f localhost:5000/ || exit 1"], "retries": 5},
+    })
+    app = ContainerDefinition.from_settings("web-api-container", "repo:abc", 5000, LOGS, [], settings,
+                                            depends_on=["log_router"], port_name="http").to_dict()
+    assert app["stopTimeout"] == 30
+    assert app["ulimits"] == [{"name": "nofile", "softLimit": 4096, "hardLimit": 8192}]
+    assert app["healthCheck"] == HealthCheck(command=["CMD-SHELL", "curl -f localhost:5000/ || exit 1"],
+                                             retries=5).to_dict()
+    assert app["healthCheck"]["startPeriod"] == 0
+    assert app["dependsOn"] == [{"containerName": "log_router", "condition": "START"}]
+    assert app["portMappings"][0]["name"] == "http"
@@ -0,0 +1,101 @@
+"""Stack config handling and the fan-out of tools/deploy.py"""
+
+import functools
+import shutil
+
+import pytest
+import yaml
+
+from tools.deploy import (Target, copy_stack_config, evaluate_target, prepare_targets, run_all, run_target,
+                          run_target_offline)
+from tools.mocks import ProgramMocks, load_stack_config
+
+PROGRAM = """\
+import pulumi
+import pulumi_aws as aws
+
+bucket = aws.s3.BucketV2("assets")
+pulumi.export("region", aws.config.region)
+"""
+
+
+@pytest.fixture
+def program(tmp_path):
+    (tmp_path / "Pulumi.yaml").write_text("name: deploy-test\nruntime: python\n")
+    (tmp_path / "__main__.py").write_text(PROGRAM)
+    (tmp_path / "Pulumi.dev.yaml").write_text("config:\n  aws:region: us-east-2\n  deploy-test:size: 2\n")
+    return tmp_path
+
+
+def test_copy_sets_the_region(program):
+    assert copy_stack_config("prod-eu", "dev", program, region="eu-west-1")
+    assert load_stack_config("prod-eu", program) == {"aws:region": "eu-west-1", "deploy-test:size": "2"}
+    # an existing file is left alone
+    assert not copy_stack_config("prod-eu", "dev", program, region="us-west-2")
+    assert load_stack_config("prod-eu", program)["aws:region"] == "eu-west-1"
+
+
+def test_prepare_creates_missing_stacks_only(program):
+    before = (program / "Pulumi.dev.yaml").read_text()
+    created = prepare_targets([Target.parse("dev:us-east-2"), Target.parse("staging:us-west-2")], "dev", program)
+    assert created == ["staging"]
+    assert load_stack_config("staging", program)["aws:region"] == "us-west-2"
+    assert (program / "Pulumi.dev.yaml").read_text() == before
+
+
+def test_prepare_refuses_another_region_for_an_existing_stack(program):
+    targets = [Target.parse("staging"), Target.parse("dev:us-west-2")]
+    with pytest.raises(ValueError, match="deploys to us-east-2, not us-west-2"):
+        prepare_targets(targets, "dev", program)
+    # nothing is created when a target is refused
+    assert not (program / "Pulumi.staging.yaml").exists()
+
+
+def test_prepare_needs_config_from_for_missing_stacks(program):
+    with pytest.raises(ValueError, match="pass --config-from"):
+        prepare_targets([Target.parse("staging")], None, program)
+
+
+def test_offline_check_writes_no_files(program):
+    targets = [Target.parse("dev"), Target.parse("staging:us-west-2")]
+    assert prepare_targets(targets, "dev", program, create=False) == ["staging"]
+    assert not (program / "Pulumi.staging.yaml").exists()
+    runner = functools.partial(run_target_offline, program_dir=program, config_from="dev")
+    results, _ = run_all(targets, "preview", workers=2, runner=runner)
+    assert all(result.ok for result in results)
+    assert sorted(path.name for path in program.glob("Pulumi.*.yaml")) == ["Pulumi.dev.yaml"]
+
+
+def test_offline_config_is_the_copy_it_would_write(program, monkeypatch):
+    seen = {}
+
+    def evaluate(stack, config, program_dir):
+        seen[stack] = config
+        return ProgramMocks(), 0.0
+
+    monkeypatch.setattr("tools.deploy.evaluate", evaluate)
+    evaluate_target(Target.parse("staging:us-west-2"), program, "dev")
+    evaluate_target(Target.parse("dev"), program, "dev")
+    assert seen == {"staging": {"aws:region": "us-west-2", "deploy-test:size": "2"}, "dev": None}
+
+
+def test_offline_fan_out(program):
+    copy_stack_config("staging", "dev", program, region="us-west-2")
+    targets = [Target.parse("dev"), Target.parse("staging")]
+    runner = functools.partial(run_target_offline, program_dir=program)
+    results, _ = run_all(targets, "preview", workers=2, runner=runner)
+    assert [result.target for result in results] == targets
+    assert all(result.ok for result in results)
+    assert results[0].summary == "1 resources"
+
+
+@pytest.mark.skipif(shutil.which("pulumi") is None, reason="needs the Pulumi CLI")
+def test_preview_with_a_file_backend(program, tmp_path_factory, monkeypatch):
+    monkeypatch.setenv("PULUMI_CONFIG_PASSPHRASE", "")
+    backend = f"file://{tmp_path_factory.mktemp('state')}"
+    config = (program / "Pulumi.dev.yaml").read_text()
+    result = run_target(Target.parse("dev"), "preview", backend=backend, program_dir=program)
+    assert result.ok, result.summary
+    assert "create" in result.summary
+    # the passphrase provider may add its salt, the config itself is untouched
+    assert yaml.safe_load((program / "Pulumi.dev.yaml").read_text())["config"] == yaml.safe_load(config)["config"]
@@ -0,0 +1,86 @@
+"""Deployment presets and rollout estimates"""
+
+import pytest
+
+from deployment import PRESETS, convergence_estimate, deployment_settings, deployment_waves
+from load_balancing import target_group_settings
+from tools.mocks import evaluate
+
+
+def evaluate_ui(dev_services, deployment):
+    ui = dev_services[1]
+    ui["deployment"] = deployment
+    # leave the target group to the preset, without Spot's shorter draining
+    ui.pop("target_group")
+    ui["capacity"] = {"preset": "launch_type"}
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services})
+    return mocks.find("aws:ecs/service:Service", "web-ui-svc"), mocks.find("aws:lb/targetGroup:TargetGroup", "web-ui-tg")
+
+
+@pytest.mark.parametrize("preset, percents, health_check, deregistration_delay", [
+    ("standard", (200, 50), {"interval": 30}, None),
+    ("fast", (200, 100), {"interval": 5, "timeout": 2, "healthyThreshold": 2, "unhealthyThreshold": 2}, 10),
+])
+def test_presets(dev_services, preset, percents, health_check, deregistration_delay):
+    service, target_group = evaluate_ui(dev_services, {"preset": preset})
+    assert (service["deploymentMaximumPercent"], service["deploymentMinimumHealthyPercent"]) == percents
+    assert service["deploymentCircuitBreaker"] == {"enable": True, "rollback": True}
+    assert service["healthCheckGracePeriodSeconds"] == 10
+    assert {key: target_group["healthCheck"].get(key) for key in health_check} == health_check
+    assert target_group.get("deregistrationDelay") == deregistration_delay
+
+
+def test_service_settings_override_the_preset(dev_services):
+    service, target_group = evaluate_ui(dev_services, {"preset": "fast", "minimum_healthy_percent": 50,
+                                                       "health_check_grace_period": 90})
+    assert service["deploymentMinimumHealthyPercent"] == 50
+    assert service["healthCheckGracePeriodSeconds"] == 90
+    assert target_group["healthCheck"]["interval"] == 5
+
+
+@pytest.mark.parametrize("desired_count, maximum_percent, minimum_healthy_percent, waves", [
+    (0, 200, 100, 0),
+    (2, 200, 50, 1),
+    (2, 200, 100, 1),
+    (4, 150, 100, 2),
+    (3, 100, 50, 3),
+    (10, 120, 90, 5),
+])
+def test_deployment_waves(desired_count, maximum_percent, minimum_healthy_percent, waves):
+    assert deployment_waves(desired_count, maximum_percent, minimum_healthy_percent) == waves
+
+
+@pytest.mark.parametrize("preset, seconds", [
+    # start 60s + 5 AWS-default healthy checks every 30s + 300s AWS-default draining
+    ("standard", 60 + 5 * 30 + 300),
+    # start 60s + 2 healthy checks every 5s + 10s draining
+    ("fast", 60 + 2 * 5 + 10),
+])
+def test_convergence_estimate(preset, seconds):
+    settings = deployment_settings("web", {"preset": preset})
+    target_group = target_group_settings("web", {}, settings["target_group"])
+    assert convergence_estimate(settings, target_group, 2) == seconds
+    # one wave whatever the task count, both presets can double the service
+    assert convergence_estimate(settings, target_group, 20) == seconds
+
+
+def test_convergence_counts_every_wave():
+    settings = deployment_settings("web", {"preset": "fast", "maximum_percent": 150})
+    target_group = target_group_settings("web", {}, settings["target_group"])
+    assert convergence_estimate(settings, target_group, 4) == 2 * 80
+
+
+@pytest.mark.parametrize("deployment, message", [
+    ({"preset": "yolo"}, "preset must be one of"),
+    ({"batch_size": 2}, "unknown keys"),
+    ({"minimum_healthy_percent": 120}, "between 0 and 100"),
+    ({"minimum_healthy_percent": 100, "maximum_percent": 100}, "maximum_percent must be above 100"),
+    ({"circuit_breaker": False}, "rollback needs the circuit_breaker"),
+])
+def test_invalid_deployment(deployment, message):
+    with pytest.raises(ValueError, match=message):
+        deployment_settings("web", deployment)
+
+
+def test_default_preset_is_standard():
+    assert deployment_settings("web", None) == {**PRESETS["standard"], "preset": "standard"}
@@ -0,0 +1,93 @@
+"""NAT gateways, private route tables and VPC endpoints for each egress mode"""
+
+import pytest
+
+from tools.mocks import evaluate
+
+NAT = "aws:ec2/natGateway:NatGateway"
+EIP = "aws:ec2/eip:Eip"
+ROUTE_TABLE = "aws:ec2/routeTable:RouteTable"
+ASSOCIATION = "aws:ec2/routeTableAssociation:RouteTableAssociation"
+ENDPOINT = "aws:ec2/vpcEndpoint:VpcEndpoint"
+INTERFACE_ENDPOINTS = ["ecr-api-endpoint", "ecr-dkr-endpoint", "logs-endpoint", "sts-endpoint"]
+
+
+def evaluate_egress(egress, zones=3):
+    mocks, _ = evaluate(config={"pulumi-python:egress": egress,
+                                "pulumi-python:availability_zones": {"count": zones}})
+    return mocks
+
+
+def private_routes(mocks, zones):
+    """NAT gateway id each private route table sends 0.0.0.0/0 to, None without a default route."""
+    tables = mocks.of_type(ROUTE_TABLE)
+    routes = []
+    for i in range(1, zones + 1):
+        default = [route for route in tables[f"private-route-table-{i}"].get("routes", [])
+                   if route["cidrBlock"] == "0.0.0.0/0"]
+        routes.append(default[0]["natGatewayId"] if default else None)
+    return routes
+
+
+def test_per_az_nat():
+    mocks = evaluate_egress({"mode": "per_az_nat"})
+    nats = mocks.of_type(NAT)
+    assert sorted(nats) == ["nat-gateway-1", "nat-gateway-2", "nat-gateway-3"]
+    assert [nats[f"nat-gateway-{i}"]["subnetId"] for i in (1, 2, 3)] == \
+        ["public-subnet-1-id", "public-subnet-2-id", "public-subnet-3-id"]
+    assert len(mocks.of_type(EIP)) == 3
+    # every zone leaves through its own NAT
+    assert private_routes(mocks, 3) == ["nat-gateway-1-id", "nat-gateway-2-id", "nat-gateway-3-id"]
+    assert not mocks.of_type(ENDPOINT)
+
+
+def test_shared_nat():
+    mocks = evaluate_egress({"mode": "shared_nat"})
+    assert list(mocks.of_type(NAT)) == ["nat-gateway-1"]
+    assert mocks.find(NAT, "nat-gateway-1")["subnetId"] == "public-subnet-1-id"
+    assert private_routes(mocks, 3) == ["nat-gateway-1-id"] * 3
+    assert not mocks.of_type(ENDPOINT)
+
+
+def test_endpoints_only():
+    mocks = evaluate_egress({"mode": "endpoints"})
+    assert not mocks.of_type(NAT) and not mocks.of_type(EIP)
+    assert private_routes(mocks, 3) == [None] * 3
+
+    endpoints = mocks.of_type(ENDPOINT)
+    assert sorted(endpoints) == sorted(INTERFACE_ENDPOINTS + ["s3-endpoint"])
+    s3 = endpoints["s3-endpoint"]
+    assert (s3["serviceName"], s3["vpcEndpointType"]) == ("com.amazonaws.us-east-2.s3", "Gateway")
+    assert s3["routeTableIds"] == [f"private-route-table-{i}-id" for i in (1, 2, 3)]
+    for name in INTERFACE_ENDPOINTS:
+        endpoint = endpoints[name]
+        assert endpoint["vpcEndpointType"] == "Interface" and endpoint["privateDnsEnabled"]
+        assert endpoint["subnetIds"] == [f"private-subnet-{i}-id" for i in (1, 2, 3)]
+        assert endpoint["securityGroupIds"] == ["vpc-endpoint-sg-id"]
+    assert endpoints["ecr-dkr-endpoint"]["serviceName"] == "com.amazonaws.us-east-2.ecr.dkr"
+
+    ingress = mocks.find("aws:ec2/securityGroup:SecurityGroup", "vpc-endpoint-sg")["ingress"]
+    assert [(rule["fromPort"], rule["cidrBlocks"]) for rule in ingress] == [(443, ["10.3.0.0/16"])]
+    # private DNS on the interface endpoints needs DNS hostnames
+    assert mocks.find("aws:ec2/vpc:Vpc", "dev-vpc")["enableDnsHostnames"] is True
+
+
+@pytest.mark.parametrize("mode", ["per_az_nat", "shared_nat"])
+def test_nat_modes_can_add_endpoints(mode):
+    mocks = evaluate_egress({"mode": mode, "vpc_endpoints": True}, zones=2)
+    assert private_routes(mocks, 2)[0] == "nat-gateway-1-id"
+    assert sorted(mocks.of_type(ENDPOINT)) == sorted(INTERFACE_ENDPOINTS + ["s3-endpoint"])
+
+
+def test_every_private_subnet_gets_its_route_table():
+    mocks = evaluate_egress({"mode": "shared_nat"}, zones=2)
+    associations = mocks.of_type(ASSOCIATION)
+    for i in (1, 2):
+        association = associations[f"private-subnet-association-{i}"]
+        assert (association["subnetId"], association["routeTableId"]) == \
+            (f"private-subnet-{i}-id", f"private-route-table-{i}-id")
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match="egress.mode"):
+        evaluate_egress({"mode": "transit_gateway"})
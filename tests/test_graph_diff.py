@@ -0,0 +1,50 @@
+"""Graph diffs and the markdown report of tools/graph_diff.py"""
+
+from tools.graph_diff import diff_graphs, forces_replacement, render_report
+from tools.snapshot import evaluate_graph
+
+TASK = "aws:ecs/taskDefinition:TaskDefinition"
+SUBNET = "aws:ec2/subnet:Subnet"
+SERVICE = "pulumi-python:ecs:FargateWebService"
+
+
+def resource(parent=None, **inputs):
+    return {"parent": parent, "dependencies": [], "inputs": inputs}
+
+
+def test_replacements():
+    assert forces_replacement(SUBNET, ["cidrBlock", "tags"]) == ["cidrBlock"]
+    assert forces_replacement(TASK, ["cpu", "memory"]) == ["cpu", "memory"]
+    assert forces_replacement("aws:ecs/service:Service", ["desiredCount"]) == []
+    # moving under a component is an alias, not a replacement, even where any input replaces
+    assert forces_replacement(TASK, ["(parent)"]) == []
+
+
+def test_diff_graphs():
+    task = f"{TASK}::web_api-app-task"
+    subnet = f"{SUBNET}::private-subnet-1"
+    base = {task: resource(cpu=256), subnet: resource(cidrBlock="10.3.0.0/22"),
+            f"{SUBNET}::public-subnet-1": resource()}
+    head = {task: resource(parent=f"{SERVICE}::web-api", cpu=256), subnet: resource(cidrBlock="10.3.16.0/22"),
+            f"{SUBNET}::private-subnet-3": resource()}
+    assert diff_graphs(base, head) == [
+        ("replace", subnet, SUBNET, ["cidrBlock"], ["cidrBlock"]),
+        ("create", f"{SUBNET}::private-subnet-3", SUBNET, [], []),
+        ("delete", f"{SUBNET}::public-subnet-1", SUBNET, [], []),
+        ("update", task, TASK, ["(parent)"], []),
+    ]
+
+
+def test_report():
+    task = f"{TASK}::web_api-app-task"
+    head = {task: resource(cpu=512)}
+    changes = diff_graphs({task: resource(cpu=256)}, head)
+    report = render_report("dev", changes, {}, head, {"api-lb-url": "http://a"}, {"api-lb-url": "http://b"})
+    assert "1 to replace" in report
+    assert "| `+-` | web_api-app-task | ecs:TaskDefinition | **cpu** |" in report
+    assert "| api-lb-url | http://a | http://b |" in report
+
+
+def test_graph_follows_the_stack_region():
+    graph, _ = evaluate_graph(config={"aws:region": "eu-west-1"})
+    assert graph[f"{SUBNET}::private-subnet-1"]["inputs"]["availabilityZone"] == "eu-west-1a"
@@ -0,0 +1,157 @@
+"""Build-context fingerprints and the skip decision, on tests/fixtures/build-context"""
+
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from images import (ImageCache, context_files, hash_build_context, image_reference, in_repository, plan_image,
+                    pushed_image_exists, pushed_image_size)
+from tools.mocks import ProgramMocks, evaluate
+
+FIXTURE = Path(__file__).parent / "fixtures" / "build-context"
+REPOSITORY = "000000000000.dkr.ecr.us-east-2.amazonaws.com/web-api-repo"
+
+
+@pytest.fixture
+def context(tmp_path):
+    """A copy of the fixture context, safe to edit."""
+    path = tmp_path / "context"
+    shutil.copytree(FIXTURE, path)
+    return path
+
+
+def fingerprint(context, **kwargs):
+    return hash_build_context(context, context / "Dockerfile", **kwargs)
+
+
+def test_context_files_honour_dockerignore(context):
+    (context / ".git").mkdir()
+    (context / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    assert context_files(context) == [".dockerignore", "Dockerfile", "build/keep.txt", "src/index.html"]
+
+
+def test_fingerprint_is_stable(context):
+    assert fingerprint(context) == fingerprint(context) == fingerprint(FIXTURE)
+
+
+def test_ignored_files_do_not_change_the_fingerprint(context):
+    before = fingerprint(context)
+    (context / "build" / "out.txt").write_text("rebuilt\n")
+    (context / "README.md").write_text("# changed\n")
+    assert fingerprint(context) == before
+
+
+@pytest.mark.parametrize("change", ["source", "dockerfile", "mode", "new file"])
+def test_context_changes_change_the_fingerprint(context, change):
+    before = fingerprint(context)
+    if change == "source":
+        (context / "src" / "index.html").write_text("<h1>bye</h1>\n")
+    elif change == "dockerfile":
+        (context / "Dockerfile").write_text((context / "Dockerfile").read_text() + "EXPOSE 5000\n")
+    elif change == "mode":
+        (context / "src" / "index.html").chmod(0o755)
+    else:
+        (context / "src" / "about.html").write_text("")
+    assert fingerprint(context) != before
+
+
+def test_build_inputs_change_the_fingerprint(context):
+    base = fingerprint(context)
+    assert fingerprint(context, build_args={"VERSION": "2"}) != base
+    assert fingerprint(context, platform="linux/arm64") != fingerprint(context, platform="linux/amd64")
+    assert fingerprint(context, target="runtime") != base
+
+
+def test_plan_skips_recorded_fingerprints(context, tmp_path):
+    cache = ImageCache(tmp_path / "cache" / "dev.json")
+    plan = plan_image("web-api", context, context / "Dockerfile", cache)
+    assert not plan.skip and plan.previous_uri is None
+
+    cache.record("web-api", plan.fingerprint, f"{REPOSITORY}:abc")
+    # read back from disk, as the next run would
+    cache = ImageCache(tmp_path / "cache" / "dev.json")
+    plan = plan_image("web-api", context, context / "Dockerfile", cache)
+    assert plan.skip and plan.cached_uri == f"{REPOSITORY}:abc"
+
+    (context / "src" / "index.html").write_text("<h1>bye</h1>\n")
+    plan = plan_image("web-api", context, context / "Dockerfile", cache)
+    assert not plan.skip and plan.previous_uri == f"{REPOSITORY}:abc"
+
+
+def test_plan_without_context_always_builds(tmp_path):
+    plan = plan_image("web-api", tmp_path / "missing", tmp_path / "missing" / "Dockerfile", None)
+    assert not plan.skip and plan.fingerprint is None
+
+
+def test_image_reference():
+    assert image_reference(f"{REPOSITORY}:abc") == {"repository_name": "web-api-repo", "image_tag": "abc"}
+    assert image_reference(f"{REPOSITORY}@sha256:00ff") == {"repository_name": "web-api-repo",
+                                                             "image_digest": "sha256:00ff"}
+
+
+def test_pushed_image_exists_asks_ecr():
+    asked = []
+
+    def invoke(**kwargs):
+        asked.append(kwargs)
+        raise Exception("ImageNotFoundException")
+
+    assert not pushed_image_exists(f"{REPOSITORY}:abc", invoke=invoke)
+    assert asked == [{"repository_name": "web-api-repo", "image_tag": "abc"}]
+    assert pushed_image_exists(f"{REPOSITORY}:abc", invoke=lambda **kwargs: object())
+
+
+def test_pushed_image_size_in_mib():
+    image = type("Image", (), {"image_size_in_bytes": 52_428_800})
+    assert pushed_image_size(f"{REPOSITORY}@sha256:00ff", invoke=lambda **kwargs: image) == 50.0
+
+
+def test_image_sizes_are_opt_in():
+    mocks, _ = evaluate()
+    assert "image-sizes" not in mocks.outputs
+    mocks, _ = evaluate(config={"pulumi-python:images": {"report_sizes": True}})
+    assert mocks.outputs["image-sizes"] == {"web-api": 120.0, "web-ui": 120.0}
+
+
+def test_in_repository():
+    assert in_repository(f"{REPOSITORY}:abc", REPOSITORY) == f"{REPOSITORY}:abc"
+    with pytest.raises(ValueError, match="not in"):
+        in_repository(f"{REPOSITORY}-old:abc", REPOSITORY)
+
+
+class MissingImageMocks(ProgramMocks):
+    """ECR has lost the cached image."""
+
+    def call(self, args):
+        if args.token == "aws:ecr/getImage:getImage" and args.args.get("imageTag") == "cached":
+            # what the provider reports for an image that isn't there
+            return {}, [("imageTag", "ImageNotFoundException")]
+        return super().call(args)
+
+
+def evaluate_with_cached_api_image(dev_services, tmp_path, mocks=None):
+    api = dev_services[0]
+    api["context"], api["dockerfile"] = str(FIXTURE), str(FIXTURE / "Dockerfile")
+    api.pop("build_target", None)
+    cache = ImageCache(tmp_path / "dev.json")
+    plan = plan_image("web-api", FIXTURE, FIXTURE / "Dockerfile", None, platform="linux/arm64")
+    cache.record("web-api", plan.fingerprint, f"{REPOSITORY}:cached")
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services,
+                                "pulumi-python:images": {"cache_dir": str(tmp_path)}}, mocks=mocks)
+    return mocks
+
+
+def test_unchanged_image_is_reused(dev_services, tmp_path):
+    mocks = evaluate_with_cached_api_image(dev_services, tmp_path)
+    assert "web-api-image" not in mocks.of_type("awsx:ecr:Image")
+    definitions = json.loads(mocks.find("aws:ecs/taskDefinition:TaskDefinition", "web_api-app-task")["containerDefinitions"])
+    assert definitions[0]["image"] == f"{REPOSITORY}:cached"
+
+
+def test_image_missing_from_ecr_is_rebuilt(dev_services, tmp_path):
+    mocks = evaluate_with_cached_api_image(dev_services, tmp_path, mocks=MissingImageMocks())
+    image = mocks.find("awsx:ecr:Image", "web-api-image")
+    # the repository's images are the cache source, whatever the local cache says
+    assert image["cacheFrom"][0] == REPOSITORY
@@ -0,0 +1,82 @@
+"""The shared ALB's listener rules and target group settings"""
+
+import pytest
+
+from load_balancing import CATCH_ALL_PRIORITY, rule_conditions, rule_priorities, target_group_settings
+from service import ServiceSpec
+from tools.mocks import evaluate
+
+RULE = "aws:lb/listenerRule:ListenerRule"
+LOAD_BALANCER = "aws:lb/loadBalancer:LoadBalancer"
+
+
+@pytest.fixture
+def shared():
+    mocks, _ = evaluate(config={"pulumi-python:load_balancing": {"mode": "shared"}})
+    return mocks
+
+
+def spec(name, **routing):
+    return ServiceSpec(name=name, dockerfile="Dockerfile", context=".", routing=routing)
+
+
+def test_one_internet_facing_alb(shared):
+    load_balancers = shared.of_type(LOAD_BALANCER)
+    assert list(load_balancers) == ["web-alb"]
+    assert load_balancers["web-alb"]["internal"] is False
+
+
+def test_unmatched_requests_get_a_404(shared):
+    [action] = shared.find("aws:lb/listener:Listener", "web-alb-listener")["defaultActions"]
+    assert action["type"] == "fixed-response"
+    assert action["fixedResponse"]["statusCode"] == "404"
+
+
+def test_listener_rules(shared):
+    rules = shared.of_type(RULE)
+    assert sorted(rules) == ["web-api-rule", "web-ui-rule"]
+    api, ui = rules["web-api-rule"], rules["web-ui-rule"]
+    for name, rule in (("web-api", api), ("web-ui", ui)):
+        assert rule["listenerArn"] == "arn:aws:mock:us-east-2::web-alb-listener"
+        assert rule["actions"] == [{"type": "forward", "targetGroupArn": f"arn:aws:mock:us-east-2::{name}-tg"}]
+    assert api["conditions"] == [{"pathPattern": {"values": ["/WeatherForecast*"]}}]
+    # web-ui has no routing block: the catch-all, evaluated last
+    assert ui["conditions"] == [{"pathPattern": {"values": ["/*"]}}]
+    assert api["priority"] < ui["priority"] == CATCH_ALL_PRIORITY - 2
+
+
+def test_services_admit_the_shared_alb(shared):
+    for name in ("web-api", "web-ui"):
+        [rule] = shared.find("aws:ec2/securityGroup:SecurityGroup", f"{name}-app-sg")["ingress"]
+        assert rule["securityGroups"] == ["web-alb-sg-id"]
+
+
+def test_both_urls_point_at_the_shared_alb(shared):
+    assert shared.outputs["api-lb-url"] == shared.outputs["web-lb-url"] == "http://web-alb.us-east-2.elb.amazonaws.com"
+
+
+def test_rule_priorities():
+    specs = [spec("api", path_patterns=["/api/*"]), spec("ui"), spec("admin", host_headers=["admin.*"], priority=5)]
+    assert rule_priorities(specs) == {"api": 100, "ui": CATCH_ALL_PRIORITY - 2, "admin": 5}
+    with pytest.raises(ValueError, match="unique"):
+        rule_priorities([spec("api", path_patterns=["/a"], priority=7), spec("ui", path_patterns=["/b"], priority=7)])
+
+
+def test_rule_conditions():
+    [path, host] = rule_conditions("api", {"path_patterns": ["/api/*"], "host_headers": ["api.example.com"]})
+    assert path.path_pattern.values == ["/api/*"] and host.host_header.values == ["api.example.com"]
+    with pytest.raises(ValueError, match="at most 5"):
+        rule_conditions("api", {"path_patterns": [f"/{i}" for i in range(6)]})
+
+
+def test_target_group_settings():
+    merged = target_group_settings("api", {"health_check": {"interval": 10}}, {"deregistration_delay": 30})
+    assert merged["deregistration_delay"] == 30
+    assert merged["health_check"] == {"interval": 10, "timeout": None, "healthy_threshold": None,
+                                      "unhealthy_threshold": None, "matcher": "200"}
+    with pytest.raises(ValueError, match="algorithm"):
+        target_group_settings("api", {"algorithm": "random"})
+    with pytest.raises(ValueError, match="slow_start"):
+        target_group_settings("api", {"algorithm": "least_outstanding_requests", "slow_start": 60})
+    with pytest.raises(ValueError, match="timeout"):
+        target_group_settings("api", {"health_check": {"interval": 5, "timeout": 5}})
@@ -0,0 +1,80 @@
+"""The offline parts of tools/loadtest.py: profiles, percentiles, the compose
+project and the recommendations"""
+
+import argparse
+import json
+
+import pytest
+
+from service import ServiceSpec
+from tools.loadtest import (PROXY, Stage, compose_project, host_port, nginx_config, parse_stats, percentile,
+                            recommendation, size_recommendation)
+
+API = ServiceSpec(name="web-api", dockerfile="api/Dockerfile", context=".", listener_port=5000,
+                  task={"cpu": 256, "memory": 512}, container={"cpu": 256, "memory": 512},
+                  scaling={"min_capacity": 2, "max_capacity": 4, "cpu_target": 60},
+                  alarms={"response_time_p99": 0.5})
+UI = ServiceSpec(name="web-ui", dockerfile="ui/Dockerfile", context=".", public=True, listener_port=80,
+                 desired_count=3, environment={"ApiAddress": "http://{web-api}/WeatherForecast"})
+
+
+def stage(throughput, p99, errors=0, cpu=None, memory=None):
+    return {"duration": 60, "concurrency": 10, "requests": 100, "errors": errors, "throughput": throughput,
+            "p50": p99 / 2, "p95": p99, "p99": p99, "cpu": cpu, "memory": memory}
+
+
+def test_parse_profile():
+    assert Stage.parse_profile("30s@5, 60s@20") == [Stage(30, 5), Stage(60, 20)]
+    with pytest.raises(argparse.ArgumentTypeError, match="'60@20' is not"):
+        Stage.parse_profile("30s@5,60@20")
+
+
+def test_percentile():
+    values = [i / 100 for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (0.5, 0.99, 1.0)
+    assert percentile([0.2], 99) == 0.2
+    assert percentile([], 50) is None
+
+
+def test_compose_project():
+    project = compose_project([API, UI])
+    api, ui, proxy = project["services"]["web-api"], project["services"]["web-ui"], project["services"][PROXY]
+    # links resolve to the stand-in ALB, as they do to the real one
+    assert ui["environment"] == {"ApiAddress": f"http://{PROXY}:5000/WeatherForecast"}
+    assert (api["cpus"], api["mem_limit"], api["deploy"]["replicas"]) == (0.25, "512m", 2)
+    assert ui["deploy"]["replicas"] == 3
+    assert proxy["ports"] == ["127.0.0.1:5000:5000", "127.0.0.1:8080:80"]
+    assert proxy["depends_on"] == ["web-api", "web-ui"]
+
+
+def test_host_ports_below_1024_move_up():
+    assert (host_port(80), host_port(443), host_port(5000)) == (8080, 8443, 5000)
+
+
+def test_nginx_config():
+    config = nginx_config([API, UI])
+    assert "upstream web_api {\n        server web-api:5000;" in config
+    assert "listen 80;" in config and "proxy_pass http://web_ui;" in config
+    assert config.count("keepalive 32;") == 2
+
+
+def test_parse_stats():
+    lines = [json.dumps({"CPUPerc": "50.00%", "MemUsage": "256MiB / 512MiB"}),
+             json.dumps({"CPUPerc": "12.5%", "MemUsage": "1.5GiB / 2GiB"}), ""]
+    assert parse_stats(lines) == [(512.0, 256.0), (128.0, 1536.0)]
+
+
+def test_requests_per_target_from_the_busiest_passing_stage():
+    results = [stage(10, 0.1), stage(40, 0.3), stage(80, 0.9), stage(60, 0.2, errors=3)]
+    # 40 req/s over 2 tasks, per minute, at 70%
+    assert recommendation(API, results) == int(40 / 2 * 60 * 0.7)
+    assert recommendation(API, [stage(80, 0.9)]) is None
+
+
+def test_task_size_from_peak_usage():
+    results = [stage(10, 0.1, cpu=100, memory=200), stage(40, 0.3, cpu=300, memory=900),
+               stage(80, 0.9, cpu=1000, memory=3000)]
+    # 300 / 0.7 cpu units and 900 / 0.7 MiB, the failing stage doesn't count
+    assert size_recommendation(API, results) == (512, 2048)
+    assert size_recommendation(API, [stage(10, 0.1, cpu=10, memory=100)]) == (256, 512)
+    assert size_recommendation(API, [stage(10, 0.1)]) is None
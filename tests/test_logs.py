@@ -0,0 +1,115 @@
+"""Log configuration and the FireLens sidecar in the rendered container definitions"""
+
+import json
+
+import pytest
+
+from containers import render_container_definitions
+from logs import (LOG_ROUTER_NAME, app_log_configuration, awslogs_configuration, log_router_definition,
+                  logging_settings)
+from tools.mocks import evaluate
+
+TASK = {"cpu": 256, "memory": 512}
+CONTAINER = {"cpu": 256, "memory": 448}
+
+
+def settings(**overrides):
+    return logging_settings("web-ui", overrides, TASK, CONTAINER)
+
+
+def test_awslogs_is_non_blocking_by_default():
+    assert awslogs_configuration("web-ui-log-group", "us-east-2", "web", settings()).to_dict() == {
+        "logDriver": "awslogs",
+        "options": {
+            "awslogs-group": "web-ui-log-group",
+            "awslogs-region": "us-east-2",
+            "awslogs-stream-prefix": "web",
+            "mode": "non-blocking",
+            "max-buffer-size": "25m",
+        },
+    }
+
+
+def test_blocking_mode_has_no_buffer():
+    options = app_log_configuration("group", "us-east-2", settings(mode="blocking")).options
+    assert options["mode"] == "blocking" and "max-buffer-size" not in options
+
+
+def test_no_log_router_without_firelens():
+    assert log_router_definition("group", "us-east-2", settings()) is None
+
+
+def test_firelens_routes_the_app_through_the_sidecar():
+    firelens = settings(firelens=True, stream_prefix="ui", max_buffer_size="10m")
+    app = app_log_configuration("web-ui-log-group", "us-east-2", firelens).to_dict()
+    assert app == {
+        "logDriver": "awsfirelens",
+        "options": {
+            "Name": "cloudwatch_logs",
+            "region": "us-east-2",
+            "log_group_name": "web-ui-log-group",
+            "log_stream_prefix": "ui/",
+            "auto_create_group": "false",
+            "mode": "non-blocking",
+            "max-buffer-size": "10m",
+        },
+    }
+    [router] = json.loads(render_container_definitions([log_router_definition("web-ui-log-group", "us-east-2",
+                                                                              firelens)]))
+    assert router["name"] == LOG_ROUTER_NAME
+    assert router["image"] == "public.ecr.aws/aws-observability/aws-for-fluent-bit:stable"
+    assert router["memoryReservation"] == 50 and "memory" not in router
+    assert router["firelensConfiguration"] == {"type": "fluentbit", "options": {"enable-ecs-log-metadata": "true"}}
+    # the router's own output goes straight to the group
+    assert router["logConfiguration"]["logDriver"] == "awslogs"
+    assert router["logConfiguration"]["options"]["awslogs-stream-prefix"] == "firelens"
+
+
+def test_firelens_block_overrides_the_defaults():
+    firelens = settings(firelens={"memory_reservation": 64})["firelens"]
+    assert firelens["memory_reservation"] == 64 and firelens["image"].startswith("public.ecr.aws/")
+
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"retention_days": 10}, "retention_days"),
+    ({"mode": "async"}, "mode"),
+    ({"max_buffer_size": "25 MB"}, "max_buffer_size"),
+    ({"firelens": {"memory_reservation": 100}}, "does not fit"),
+])
+def test_invalid_logging(overrides, message):
+    with pytest.raises(ValueError, match=message):
+        settings(**overrides)
+
+
+def test_task_definition_with_firelens(dev_services):
+    ui = dev_services[1]
+    ui["container"] = {"cpu": 256, "memory": 448}
+    ui["logging"] = {"firelens": True, "retention_days": 7}
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services})
+
+    assert mocks.find("aws:cloudwatch/logGroup:LogGroup", "web-ui-log-group")["retentionInDays"] == 7
+    task_definition = mocks.find("aws:ecs/taskDefinition:TaskDefinition", "web_ui-app-task")
+    app, router = json.loads(task_definition["containerDefinitions"])
+    assert (app["name"], router["name"]) == ("web-ui-container", LOG_ROUTER_NAME)
+    assert app["logConfiguration"]["logDriver"] == "awsfirelens"
+    assert app["logConfiguration"]["options"]["log_group_name"] == "web-ui-log-group"
+    assert app["dependsOn"] == [{"containerName": LOG_ROUTER_NAME, "condition": "START"}]
+    assert not router.get("portMappings")
+    # Fluent Bit ships the logs with a task role of its own, not the execution role
+    assert task_definition["taskRoleArn"] == "arn:aws:mock:us-east-2::web-ui-log-router-role"
+    policy = mocks.find("aws:iam/rolePolicy:RolePolicy", "web-ui-log-router-policy")
+    assert policy["role"] == "web-ui-log-router-role-id"
+    [statement] = policy["policy"]["Statement"]
+    assert statement["Action"] == ["logs:CreateLogStream", "logs:PutLogEvents", "logs:DescribeLogStreams"]
+    group = "arn:aws:mock:us-east-2::web-ui-log-group"
+    assert statement["Resource"] == [group, f"{group}:*"]
+
+
+def test_default_task_definition_logs_to_its_group():
+    mocks, _ = evaluate()
+    [app] = json.loads(mocks.find("aws:ecs/taskDefinition:TaskDefinition", "web_api-app-task")["containerDefinitions"])
+    assert app["logConfiguration"]["options"]["awslogs-group"] == "web-api-log-group"
+    assert app["logConfiguration"]["options"]["mode"] == "non-blocking"
+    assert mocks.find("aws:cloudwatch/logGroup:LogGroup", "web-api-log-group")["retentionInDays"] == 30
+    assert "taskRoleArn" not in mocks.find("aws:ecs/taskDefinition:TaskDefinition", "web_api-app-task")
+    assert not mocks.of_type("aws:iam/rolePolicy:RolePolicy")
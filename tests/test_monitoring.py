@@ -0,0 +1,99 @@
+"""Alarm and dashboard dimensions, evaluated under mocks"""
+
+import json
+
+import pytest
+
+from monitoring import alarm_settings
+from tools.mocks import evaluate
+
+ALARM = "aws:cloudwatch/metricAlarm:MetricAlarm"
+DASHBOARD = "aws:cloudwatch/dashboard:Dashboard"
+TOPIC = "arn:aws:sns:us-east-2:000000000000:on-call"
+
+
+def suffixes(lb, tg):
+    return {"LoadBalancer": f"app/{lb}/0000", "TargetGroup": f"targetgroup/{tg}/0000"}
+
+
+@pytest.fixture(scope="module")
+def dev():
+    mocks, _ = evaluate(config={"pulumi-python:monitoring": {"alarm_actions": [TOPIC]}})
+    return mocks
+
+
+def alarms_of(mocks, name):
+    return {alarm_name[len(name) + 1:-len("-alarm")]: alarm for alarm_name, alarm in mocks.of_type(ALARM).items()
+            if alarm_name.startswith(f"{name}-")}
+
+
+def widget_dimensions(body):
+    """Every metric's dimensions in a dashboard body, as dicts."""
+    dimensions = []
+    for widget in json.loads(body)["widgets"]:
+        for metric in widget["properties"]["metrics"]:
+            values = [value for value in metric[2:] if not isinstance(value, dict)]
+            dimensions.append((metric[1], dict(zip(values[::2], values[1::2]))))
+    return dimensions
+
+
+@pytest.mark.parametrize("name", ["web-api", "web-ui"])
+def test_alarms_watch_their_own_load_balancer_and_target_group(dev, name):
+    alarms = alarms_of(dev, name)
+    own = suffixes(f"{name}-lb", f"{name}-tg")
+    for key in ("response-time-p99", "target-5xx", "unhealthy-hosts"):
+        assert alarms[key]["dimensions"] == own, key
+    assert alarms["cpu"]["dimensions"] == {"ClusterName": "web-cluster", "ServiceName": f"{name}-svc"}
+    assert alarms["memory"]["namespace"] == "AWS/ECS"
+
+
+def test_thresholds_and_statistics(dev):
+    alarms = alarms_of(dev, "web-api")
+    assert sorted(alarms) == ["cpu", "memory", "requests-per-target", "response-time-p90", "response-time-p99",
+                              "target-5xx", "unhealthy-hosts"]
+    p90 = alarms["response-time-p90"]
+    assert (p90["extendedStatistic"], p90["threshold"]) == ("p90", 0.5) and "statistic" not in p90
+    assert (alarms["target-5xx"]["statistic"], alarms["target-5xx"]["threshold"]) == ("Sum", 10)
+    # RequestCountPerTarget is only published per target group
+    assert alarms["requests-per-target"]["dimensions"] == {"TargetGroup": "targetgroup/web-api-tg/0000"}
+    # web-ui leaves p90 and requests per target unset
+    assert "response-time-p90" not in alarms_of(dev, "web-ui")
+
+
+def test_alarms_notify_the_alarm_actions(dev):
+    for alarm in dev.of_type(ALARM).values():
+        assert alarm["alarmActions"] == alarm["okActions"] == [TOPIC]
+        assert alarm["treatMissingData"] == "notBreaching"
+
+
+@pytest.mark.parametrize("name", ["web-api", "web-ui"])
+def test_dashboard_dimensions(dev, name):
+    dashboard = dev.find(DASHBOARD, f"{name}-dashboard")
+    assert dashboard["dashboardName"] == f"dev-{name}"
+    own = suffixes(f"{name}-lb", f"{name}-tg")
+    for metric, dimensions in widget_dimensions(dashboard["dashboardBody"]):
+        if metric == "RequestCountPerTarget":
+            assert dimensions == {"TargetGroup": own["TargetGroup"]}
+        elif metric in ("CPUUtilization", "MemoryUtilization", "RunningTaskCount"):
+            assert dimensions == {"ClusterName": "web-cluster", "ServiceName": f"{name}-svc"}
+        else:
+            assert dimensions == own, metric
+
+
+def test_shared_alb_dimensions(dev_services):
+    for service in dev_services:
+        service.pop("cdn", None)
+    mocks, _ = evaluate(config={"pulumi-python:load_balancing": {"mode": "shared"},
+                                "pulumi-python:services": dev_services})
+    for name in ("web-api", "web-ui"):
+        # one load balancer, each service's own target group
+        assert alarms_of(mocks, name)["target-5xx"]["dimensions"] == suffixes("web-alb", f"{name}-tg")
+        body = mocks.find(DASHBOARD, f"{name}-dashboard")["dashboardBody"]
+        assert ("HealthyHostCount", suffixes("web-alb", f"{name}-tg")) in widget_dimensions(body)
+
+
+def test_invalid_alarms():
+    with pytest.raises(ValueError, match="unknown keys"):
+        alarm_settings("web-api", {"latency": 1})
+    with pytest.raises(ValueError, match="multiple of 60"):
+        alarm_settings("web-api", {"period": 90})
@@ -0,0 +1,55 @@
+"""Pre-warm settings and the shifted scale-up schedules"""
+
+import pytest
+
+from prewarm import prewarm_settings, prewarmed_scaling, shift_schedule
+
+
+@pytest.mark.parametrize("schedule, minutes, shifted", [
+    ("at(2026-11-02T07:00:00)", 20, "at(2026-11-02T06:40:00)"),
+    # an at() schedule can move into the day before
+    ("at(2026-11-02T00:10:00)", 30, "at(2026-11-01T23:40:00)"),
+    ("cron(0 7 ? * MON-FRI *)", 20, "cron(40 6 ? * MON-FRI *)"),
+    ("cron(30 12 * * ? *)", 90, "cron(0 11 * * ? *)"),
+    ("cron(0 7 ? * MON-FRI *)", 0, "cron(0 7 ? * MON-FRI *)"),
+])
+def test_shift_schedule(schedule, minutes, shifted):
+    assert shift_schedule(schedule, minutes) == shifted
+
+
+def test_shift_past_midnight_is_rejected():
+    with pytest.raises(ValueError, match="to the day before"):
+        shift_schedule("cron(10 0 ? * MON-FRI *)", 20)
+
+
+@pytest.mark.parametrize("schedule", ["cron(*/5 7 * * ? *)", "cron(0 7-9 * * ? *)", "rate(5 minutes)"])
+def test_schedules_without_a_fixed_time_are_rejected(schedule):
+    with pytest.raises(ValueError, match="fixed minute and hour"):
+        shift_schedule(schedule, 10)
+
+
+def test_only_scale_ups_move():
+    scaling = {"min_capacity": 2, "scheduled": [
+        {"name": "peak", "schedule": "cron(0 7 ? * MON-FRI *)", "min_capacity": 4},
+        {"name": "off-peak", "schedule": "cron(0 20 ? * MON-FRI *)", "min_capacity": 2},
+    ]}
+    shifted = prewarmed_scaling("web-api", scaling, prewarm_settings("web-api", {"lead_minutes": 15}))
+    assert [action["schedule"] for action in shifted["scheduled"]] == ["cron(45 6 ? * MON-FRI *)",
+                                                                       "cron(0 20 ? * MON-FRI *)"]
+    assert prewarmed_scaling("web-api", scaling, prewarm_settings("web-api", None)) is scaling
+
+
+def test_errors_name_the_service():
+    scaling = {"min_capacity": 1, "scheduled": [{"schedule": "cron(*/5 7 * * ? *)", "min_capacity": 3}]}
+    with pytest.raises(ValueError, match=r"services.web-api.prewarm: can only pre-warm"):
+        prewarmed_scaling("web-api", scaling, prewarm_settings("web-api", {"lead_minutes": 5}))
+
+
+@pytest.mark.parametrize("settings, message", [
+    ({"lead": 5}, "unknown keys"),
+    ({"slow_start": 10}, "between 30 and 900"),
+    ({"lead_minutes": -1}, "can't be negative"),
+])
+def test_invalid_prewarm(settings, message):
+    with pytest.raises(ValueError, match=message):
+        prewarm_settings("web-api", settings)
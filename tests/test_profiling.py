@@ -0,0 +1,46 @@
+"""What the profiler records, evaluated under mocks"""
+
+import json
+
+import profiling
+from tools.mocks import evaluate
+
+
+def test_invokes_are_timed(monkeypatch, tmp_path):
+    profiler = profiling.Profiler(str(tmp_path / "profile.json"))
+    monkeypatch.setattr(profiling, "profiler", profiler)
+    evaluate(config={"pulumi-python:images": {"report_sizes": True}})
+    invokes = sorted(event["name"] for event in profiler.events if event["cat"] == "invoke")
+    # the zones (evaluate starts with an empty cache), the prefix list for web-ui's
+    # CloudFront lockdown and one image size per service
+    assert invokes == ["aws:ec2/getManagedPrefixList", "aws:ecr/getImage", "aws:ecr/getImage",
+                       "aws:index/getAvailabilityZones"]
+    applies = {event["name"] for event in profiler.events if event["cat"] == "apply"}
+    assert {"web-api:image-size", "web-ui:image-size"} <= applies
+
+
+def test_registrations_and_trace(monkeypatch, tmp_path, capsys):
+    path = tmp_path / "profile.json"
+    monkeypatch.setenv(profiling.ENV_VAR, str(path))
+    monkeypatch.setenv(profiling.TOP_ENV_VAR, "3")
+    monkeypatch.setattr(profiling, "profiler", None)
+    # the program installs the profiler, its trace is written below rather than at exit
+    monkeypatch.setattr(profiling.atexit, "register", lambda fn: None)
+    mocks, _ = evaluate()
+    profiler = profiling.profiler
+
+    registrations = [event for event in profiler.events if event["cat"] == "register"]
+    assert sorted(event["name"] for event in registrations) == \
+        sorted(f"{resource['type']}::{resource['name']}" for resource in mocks.resources)
+    # a span only closes once the engine has handed back the URN
+    assert all(event["dur"] > 0 for event in registrations)
+
+    profiler.write()
+    trace = json.loads(path.read_text())
+    assert trace["displayTimeUnit"] == "ms"
+    assert len(trace["traceEvents"]) == len(profiler.events)
+    assert {event["ph"] for event in trace["traceEvents"]} == {"X"}
+    summary = trace["otherData"]
+    assert summary["categories"]["register"]["count"] == len(mocks.resources)
+    assert len(summary["slowest"]) == 3
+    assert "top 3:" in capsys.readouterr().err
@@ -0,0 +1,87 @@
+"""Target-tracking policies and scheduled actions, evaluated under mocks"""
+
+import pytest
+
+from scaling import scaling_settings
+from tools.mocks import evaluate
+
+POLICY = "aws:appautoscaling/policy:Policy"
+TARGET = "aws:appautoscaling/target:Target"
+SCHEDULED = "aws:appautoscaling/scheduledAction:ScheduledAction"
+
+
+@pytest.fixture(scope="module")
+def dev():
+    mocks, _ = evaluate()
+    return mocks
+
+
+def metric(policy):
+    configuration = policy["targetTrackingScalingPolicyConfiguration"]
+    return configuration["predefinedMetricSpecification"], configuration["targetValue"]
+
+
+def test_scalable_targets(dev):
+    targets = dev.of_type(TARGET)
+    assert targets["web-api-svc-scaling-target"]["resourceId"] == "service/web-cluster/web-api-svc"
+    assert (targets["web-api-svc-scaling-target"]["minCapacity"], targets["web-api-svc-scaling-target"]["maxCapacity"]) == (2, 8)
+    assert (targets["web-ui-svc-scaling-target"]["minCapacity"], targets["web-ui-svc-scaling-target"]["maxCapacity"]) == (2, 6)
+
+
+def test_target_tracking_policies(dev):
+    policies = dev.of_type(POLICY)
+    assert sorted(policies) == ["web-api-svc-cpu-scaling", "web-api-svc-memory-scaling", "web-api-svc-requests-scaling",
+                                "web-ui-svc-cpu-scaling", "web-ui-svc-requests-scaling"]
+    for policy in policies.values():
+        assert policy["policyType"] == "TargetTrackingScaling"
+        assert policy["scalableDimension"] == "ecs:service:DesiredCount"
+    assert metric(policies["web-api-svc-cpu-scaling"]) == ({"predefinedMetricType": "ECSServiceAverageCPUUtilization"}, 60)
+    assert metric(policies["web-api-svc-memory-scaling"]) == ({"predefinedMetricType": "ECSServiceAverageMemoryUtilization"}, 75)
+
+
+def test_request_policy_labels_its_own_load_balancer_and_target_group(dev):
+    policies = dev.of_type(POLICY)
+    assert metric(policies["web-api-svc-requests-scaling"]) == ({
+        "predefinedMetricType": "ALBRequestCountPerTarget",
+        "resourceLabel": "app/web-api-lb/0000/targetgroup/web-api-tg/0000",
+    }, 800)
+    assert metric(policies["web-ui-svc-requests-scaling"])[0]["resourceLabel"] == \
+        "app/web-ui-lb/0000/targetgroup/web-ui-tg/0000"
+
+
+def test_scheduled_actions(dev):
+    actions = dev.of_type(SCHEDULED)
+    peak = actions["web-api-svc-weekday-peak"]
+    # moved 20 minutes earlier by prewarm.lead_minutes
+    assert peak["schedule"] == "cron(40 6 ? * MON-FRI *)"
+    assert peak["timezone"] == "America/Chicago"
+    assert peak["scalableTargetAction"] == {"minCapacity": 4, "maxCapacity": 8}
+    assert actions["web-api-svc-weekday-off-peak"]["schedule"] == "cron(0 20 ? * MON-FRI *)"
+    assert actions["web-ui-svc-weekday-peak"]["scalableTargetAction"] == {"minCapacity": 3, "maxCapacity": 6}
+
+
+def test_service_without_scaling_keeps_desired_count(dev_services):
+    for service in dev_services:
+        service.pop("scaling")
+        service.pop("prewarm")
+        service["desired_count"] = 3
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services})
+    assert not mocks.of_type(TARGET) and not mocks.of_type(POLICY) and not mocks.of_type(SCHEDULED)
+    assert mocks.find("aws:ecs/service:Service", "web-ui-svc")["desiredCount"] == 3
+
+
+def test_unset_targets_are_skipped(dev_services):
+    dev_services[0]["scaling"] = {"min_capacity": 1, "max_capacity": 2, "cpu_target": None}
+    mocks, _ = evaluate(config={"pulumi-python:services": dev_services})
+    assert not [name for name in mocks.of_type(POLICY) if name.startswith("web-api")]
+
+
+def test_min_above_max_is_rejected():
+    with pytest.raises(ValueError, match="min_capacity"):
+        scaling_settings("web-api", {"min_capacity": 5, "max_capacity": 4})
+
+
+def test_unknown_keys_are_rejected():
+    # a typo must not silently leave the default target in place
+    with pytest.raises(ValueError, match=r"unknown keys \['cpu_traget'\]"):
+        scaling_settings("web-api", {"cpu_traget": 40})
@@ -0,0 +1,58 @@
+"""Service specs from stack config and their `{service}` links"""
+
+import pytest
+
+from service import ServiceSpec, load_service_specs
+from tools.mocks import evaluate
+
+
+class Config:
+    def __init__(self, services):
+        self.services = services
+
+    def require_object(self, key):
+        assert key == "services"
+        return self.services
+
+
+def raw(name, **overrides):
+    return {"name": name, "dockerfile": "Dockerfile", "context": ".", **overrides}
+
+
+def test_specs_in_order():
+    specs = load_service_specs(Config([raw("web-api"),
+                                       raw("web-ui", public=True, environment={"ApiAddress": "http://{web-api}/"})]))
+    assert [spec.name for spec in specs] == ["web-api", "web-ui"]
+    assert specs[1].links() == {"web-api"}
+    # the listener follows the container port unless the service is public
+    assert (specs[0].listener_port, specs[1].listener_port) == (5000, 80)
+
+
+def test_unknown_keys_are_rejected():
+    with pytest.raises(ValueError, match=r"services.web-api: unknown keys \['health_path'\]"):
+        ServiceSpec.from_config(raw("web-api", health_path="/"))
+    with pytest.raises(ValueError, match=r"services.\?: unknown keys"):
+        ServiceSpec.from_config({"dockerfile": "Dockerfile", "context": ".", "image": "nginx"})
+
+
+def test_duplicate_names_are_rejected():
+    with pytest.raises(ValueError, match="duplicate service name 'web-api'"):
+        load_service_specs(Config([raw("web-api"), raw("web-api")]))
+
+
+@pytest.mark.parametrize("services", [
+    # linked before it is declared
+    [raw("web-ui", environment={"ApiAddress": "http://{web-api}/"}), raw("web-api")],
+    # linked to itself
+    [raw("web-api", environment={"Self": "{web-api}"})],
+    # linked to nothing
+    [raw("web-ui", environment={"ApiAddress": "http://{web-apl}/"})],
+])
+def test_links_must_point_backwards(services):
+    with pytest.raises(ValueError, match="must be declared earlier in the list"):
+        load_service_specs(Config(services))
+
+
+def test_stack_with_a_forward_link_fails(dev_services):
+    with pytest.raises(ValueError, match=r"services.web-ui: environment references \['web-api'\]"):
+        evaluate(config={"pulumi-python:services": list(reversed(dev_services))})
@@ -0,0 +1,68 @@
+"""Service Connect namespace, client aliases and link rewrites, evaluated under mocks"""
+
+import json
+
+import pytest
+
+from tools.mocks import evaluate
+from tools.snapshot import evaluate_graph
+
+SERVICE = "aws:ecs/service:Service"
+TASK = "aws:ecs/taskDefinition:TaskDefinition"
+
+
+@pytest.fixture(scope="module")
+def connected():
+    mocks, _ = evaluate(config={"pulumi-python:service_connect": {"enabled": True}})
+    return mocks
+
+
+def container(mocks, task):
+    return json.loads(mocks.find(TASK, task)["containerDefinitions"])[0]
+
+
+def test_namespace(connected):
+    namespaces = connected.of_type("aws:servicediscovery/httpNamespace:HttpNamespace")
+    assert list(namespaces) == ["service-connect-namespace"]
+    assert namespaces["service-connect-namespace"]["name"] == "web.internal"
+
+
+def test_private_service_is_published_without_a_load_balancer(connected):
+    assert list(connected.of_type("aws:lb/loadBalancer:LoadBalancer")) == ["web-ui-lb"]
+    assert "web-api-tg" not in connected.of_type("aws:lb/targetGroup:TargetGroup")
+    config = connected.find(SERVICE, "web-api-svc")["serviceConnectConfiguration"]
+    assert config["enabled"] and config["namespace"] == "arn:aws:mock:us-east-2::service-connect-namespace"
+    assert config["services"] == [{"portName": "http", "discoveryName": "web-api",
+                                   "clientAlias": [{"dnsName": "web-api", "port": 5000}]}]
+    assert container(connected, "web_api-app-task")["portMappings"][0]["name"] == "http"
+    ingress = connected.find("aws:ec2/securityGroup:SecurityGroup", "web-api-app-sg")["ingress"]
+    assert [rule["cidrBlocks"] for rule in ingress] == [["10.3.0.0/16"]]
+    assert connected.outputs["api-lb-url"] == "http://web-api:5000"
+
+
+def test_public_service_is_a_client_only(connected):
+    service = connected.find(SERVICE, "web-ui-svc")
+    assert "services" not in service["serviceConnectConfiguration"]
+    assert service["loadBalancers"][0]["targetGroupArn"] == "arn:aws:mock:us-east-2::web-ui-tg"
+
+
+def test_links_resolve_to_the_client_alias(connected):
+    environment = container(connected, "web_ui-app-task")["environment"]
+    assert environment == [{"name": "ApiAddress", "value": "http://web-api:5000/WeatherForecast"}]
+
+
+def test_published_service_drops_its_load_balancer_policy_and_alarms(connected):
+    policies = connected.of_type("aws:appautoscaling/policy:Policy")
+    assert "web-api-svc-requests-scaling" not in policies
+    assert {"web-api-svc-cpu-scaling", "web-ui-svc-requests-scaling"} <= set(policies)
+    alarms = [name for name in connected.of_type("aws:cloudwatch/metricAlarm:MetricAlarm")
+              if name.startswith("web-api-")]
+    assert sorted(alarms) == ["web-api-cpu-alarm", "web-api-memory-alarm"]
+    assert "healthCheckGracePeriodSeconds" not in connected.find(SERVICE, "web-api-svc")
+
+
+def test_clients_deploy_after_the_published_service():
+    graph, _ = evaluate_graph(config={"pulumi-python:service_connect": {"enabled": True}})
+    # the UI's environment links to web-api, so its task definition (and its service) wait for it
+    assert f"{SERVICE}::web-api-svc" in graph[f"{TASK}::web_ui-app-task"]["dependencies"]
+    assert f"{TASK}::web_ui-app-task" in graph[f"{SERVICE}::web-ui-svc"]["dependencies"]
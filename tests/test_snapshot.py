@@ -0,0 +1,31 @@
+"""The resource graph of every stack against its golden file in `snapshots/`"""
+
+import json
+
+import pytest
+
+from tools.mocks import PROGRAM_DIR
+from tools.snapshot import SNAPSHOT_DIR, evaluate_graph, render
+
+STACKS = sorted(path.name[len("Pulumi."):-len(".yaml")] for path in PROGRAM_DIR.glob("Pulumi.*.yaml"))
+
+
+@pytest.mark.parametrize("stack", STACKS)
+def test_graph_matches_golden_file(stack):
+    path = SNAPSHOT_DIR / f"{stack}.json"
+    assert path.exists(), f"no golden file for {stack}, run python -m tools.snapshot --stack {stack} --update"
+    graph, _ = evaluate_graph(stack)
+    # compare parsed, so pytest shows which resources differ
+    assert json.loads(render(graph)) == json.loads(path.read_text())
+
+
+def test_graph_ignores_local_image_cache(tmp_path, monkeypatch):
+    """A `.image-cache` left by a real deployment must not change the graph."""
+    cache = tmp_path / ".image-cache"
+    cache.mkdir()
+    uri = "000000000000.dkr.ecr.us-east-2.amazonaws.com/web-api-repo:cached"
+    (cache / "dev.json").write_text(json.dumps({"web-api": {"fingerprint": "0" * 64, "image_uri": uri}}))
+    monkeypatch.chdir(tmp_path)
+    graph, _ = evaluate_graph("dev")
+    assert uri not in json.dumps(graph)
+    assert json.loads(render(graph)) == json.loads((SNAPSHOT_DIR / "dev.json").read_text())
@@ -0,0 +1,118 @@
+"""Properties of `plan_subnets`, checked exhaustively over small VPCs"""
+
+import ipaddress
+import itertools
+import json
+import math
+
+import pytest
+
+from subnets import plan_subnets, prefix_for_tasks, tier_prefix
+from tools.mocks import load_stack_config
+
+VPC_PREFIXES = range(16, 25)
+AZ_COUNTS = range(1, 7)
+RESERVED_AZS = (None, 1, 2, 4, 6)
+PUBLIC_PREFIXES = range(20, 29, 2)
+PRIVATE_PREFIXES = range(18, 29, 2)
+ISOLATED_PREFIXES = (None, 24, 28)
+# What the dev stack used before the planner, still live until it migrates
+LEGACY_DEV_SUBNETS = ("10.3.1.64/26", "10.3.1.128/26", "10.3.2.64/26", "10.3.2.128/26")
+
+
+def tiers_for(public, private, isolated):
+    tiers = {"public": {"prefix": public}, "private": {"prefix": private}}
+    if isolated:
+        tiers["isolated"] = {"prefix": isolated}
+    return tiers
+
+
+def fits(vpc, az_count, tiers, reserved_azs):
+    """Whether the tier blocks fit: laid out largest first, power-of-two
+    blocks pack without gaps, so it's a matter of total size."""
+    slots = max(az_count, reserved_azs or 0)
+    slot_bits = math.ceil(math.log2(slots)) if slots > 1 else 0
+    blocks = [sizing["prefix"] - slot_bits for sizing in tiers.values()]
+    return (all(block >= vpc.prefixlen for block in blocks)
+            and sum(1 << (32 - block) for block in blocks) <= vpc.num_addresses)
+
+
+@pytest.mark.parametrize("vpc_prefix", VPC_PREFIXES)
+def test_layouts(vpc_prefix):
+    vpc = ipaddress.ip_network(f"10.0.0.0/{vpc_prefix}")
+    for public, private, isolated, reserved_azs in itertools.product(PUBLIC_PREFIXES, PRIVATE_PREFIXES,
+                                                                     ISOLATED_PREFIXES, RESERVED_AZS):
+        tiers = tiers_for(public, private, isolated)
+        previous = None
+        for az_count in AZ_COUNTS:
+            case = (vpc, az_count, tiers, reserved_azs)
+            if not fits(*case):
+                with pytest.raises(ValueError):
+                    plan_subnets(str(vpc), az_count, tiers, reserved_azs=reserved_azs)
+                previous = None
+                continue
+            plan = plan_subnets(str(vpc), az_count, tiers, reserved_azs=reserved_azs)
+            subnets = [ipaddress.ip_network(cidr) for cidrs in plan.values() for cidr in cidrs]
+
+            assert list(plan) == [tier for tier in ("public", "private", "isolated") if tier in tiers], case
+            for tier, cidrs in plan.items():
+                assert len(cidrs) == az_count, case
+                assert all(ipaddress.ip_network(cidr).prefixlen == tiers[tier]["prefix"] for cidr in cidrs), case
+            assert all(subnet.subnet_of(vpc) for subnet in subnets), case
+            assert not any(a.overlaps(b) for a, b in itertools.combinations(subnets, 2)), case
+            # up to `reserved_azs`, another zone only adds subnets
+            if previous and az_count <= (reserved_azs or 1):
+                assert all(plan[tier][:az_count - 1] == previous[tier] for tier in plan), case
+            previous = plan
+
+
+@pytest.mark.parametrize("start", ["10.3.3.0", "10.3.16.0", "10.3.100.7"])
+def test_start_leaves_lower_addresses_alone(start):
+    plan = plan_subnets("10.3.0.0/16", 4, tiers_for(23, 22, 24), start=start)
+    subnets = [ipaddress.ip_network(cidr) for cidrs in plan.values() for cidr in cidrs]
+    assert all(subnet.network_address >= ipaddress.ip_address(start) for subnet in subnets)
+    assert not any(a.overlaps(b) for a, b in itertools.combinations(subnets, 2))
+
+
+def test_start_outside_the_vpc_is_rejected():
+    with pytest.raises(ValueError, match="outside"):
+        plan_subnets("10.3.0.0/16", 2, tiers_for(24, 24, None), start="10.4.0.0")
+
+
+def test_start_too_high_does_not_fit():
+    with pytest.raises(ValueError, match="do not fit"):
+        plan_subnets("10.3.0.0/16", 2, tiers_for(20, 20, None), start="10.3.224.0")
+
+
+def test_dev_layout_avoids_the_legacy_subnets():
+    settings = json.loads(load_stack_config("dev")["pulumi-python:subnets"])
+    for az_count in range(1, settings["reserved_azs"] + 1):
+        plan = plan_subnets(settings["vpc_cidr"], az_count, settings["tiers"],
+                            reserved_azs=settings["reserved_azs"], start=settings.get("start"))
+        for cidr in (cidr for cidrs in plan.values() for cidr in cidrs):
+            for legacy in LEGACY_DEV_SUBNETS:
+                assert not ipaddress.ip_network(cidr).overlaps(ipaddress.ip_network(legacy)), (cidr, legacy)
+
+
+def test_prefix_for_tasks():
+    # 250 tasks, twice that during a deploy, plus the 5 addresses AWS keeps
+    assert prefix_for_tasks(250) == 23
+    assert prefix_for_tasks(500) == 22
+    assert prefix_for_tasks(1) == 28
+    with pytest.raises(ValueError):
+        prefix_for_tasks(0)
+
+
+def test_tier_sizing_is_prefix_or_tasks():
+    assert tier_prefix("public", {"tasks_per_az": 100, "surge": 1.0}) == 25
+    with pytest.raises(ValueError, match="either"):
+        tier_prefix("public", {"prefix": 24, "tasks_per_az": 10})
+    with pytest.raises(ValueError, match="outside"):
+        tier_prefix("public", {"prefix": 29})
+
+
+def test_tiers_are_checked():
+    with pytest.raises(ValueError, match="required"):
+        plan_subnets("10.3.0.0/16", 2, {"public": {"prefix": 24}})
+    with pytest.raises(ValueError, match="unknown tiers"):
+        plan_subnets("10.3.0.0/16", 2, {**tiers_for(24, 24, None), "dmz": {"prefix": 24}})
@@ -0,0 +1,91 @@
+"""Zone resolution with a stubbed `get_availability_zones` invoke"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from zones import cache_path, resolve_availability_zones, write_cache
+
+REGION = "us-east-2"
+ZONES = ["us-east-2a", "us-east-2b", "us-east-2c"]
+
+
+class StubInvoke:
+    def __init__(self, names=ZONES):
+        self.names = names
+        self.calls = []
+
+    def __call__(self, state):
+        self.calls.append(state)
+        return SimpleNamespace(names=list(self.names))
+
+
+def resolve(tmp_path, invoke, **kwargs):
+    kwargs = {"state": "available", "count": 2, **kwargs}
+    return resolve_availability_zones(REGION, cache_dir=tmp_path, invoke=invoke, **kwargs)
+
+
+def test_pinned_zones_never_invoke(tmp_path):
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke, pinned=["us-east-2c", "us-east-2a"]) == ["us-east-2c", "us-east-2a"]
+    assert invoke.calls == []
+    assert not list(tmp_path.iterdir())
+
+
+def test_lookup_fills_the_cache(tmp_path):
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke) == ZONES[:2]
+    assert invoke.calls == ["available"]
+    assert cache_path(tmp_path, REGION, "available").exists()
+
+
+def test_cache_hit_skips_the_invoke(tmp_path):
+    write_cache(cache_path(tmp_path, REGION, "available"), ZONES)
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke, count=3) == ZONES
+    assert invoke.calls == []
+
+
+def test_cache_is_per_state(tmp_path):
+    write_cache(cache_path(tmp_path, REGION, "available"), ZONES)
+    invoke = StubInvoke(["us-east-2a", "us-east-2b"])
+    assert resolve(tmp_path, invoke, state="opt-in-not-required") == ["us-east-2a", "us-east-2b"]
+    assert invoke.calls == ["opt-in-not-required"]
+
+
+def test_expired_cache_is_refreshed(tmp_path):
+    path = cache_path(tmp_path, REGION, "available")
+    write_cache(path, ["us-east-2x", "us-east-2y"], now=time.time() - 7200)
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke, cache_ttl=3600) == ZONES[:2]
+    assert invoke.calls == ["available"]
+    # and the next run reads the fresh entry
+    assert resolve(tmp_path, StubInvoke([]), cache_ttl=3600) == ZONES[:2]
+
+
+def test_zero_ttl_disables_the_cache(tmp_path):
+    write_cache(cache_path(tmp_path, REGION, "available"), ["us-east-2x", "us-east-2y"])
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke, cache_ttl=0) == ZONES[:2]
+    assert resolve(tmp_path, invoke, cache_ttl=0) == ZONES[:2]
+    assert invoke.calls == ["available", "available"]
+
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    cache_path(tmp_path, REGION, "available").write_text("{not json")
+    invoke = StubInvoke()
+    assert resolve(tmp_path, invoke) == ZONES[:2]
+    assert invoke.calls == ["available"]
+
+
+def test_count_above_available_zones(tmp_path):
+    with pytest.raises(ValueError, match="count is 4 but only 3 zones"):
+        resolve(tmp_path, StubInvoke(), count=4)
+    with pytest.raises(ValueError, match="count is 3 but only 2 zones"):
+        resolve(tmp_path, StubInvoke(), count=3, pinned=["us-east-2a", "us-east-2b"])
+
+
+def test_count_must_be_positive(tmp_path):
+    with pytest.raises(ValueError, match="at least 1"):
+        resolve(tmp_path, StubInvoke(), count=0)
@@ -0,0 +1,60 @@
+"""Benchmark program evaluation as the number of services grows
+
+    python -m tools.bench_services --counts 2 10 25 50 100
+
+Each run evaluates `__main__.py` under mocks in a fresh interpreter with the
+`services` list replaced by N copies of a template service, and reports the
+evaluation wall-time and the number of registered resources.
+"""
+
+import argparse
+import statistics
+
+from tools.mocks import evaluate, in_fresh_interpreter
+
+TEMPLATE = {
+    "dockerfile": "../infra-team-test/infra-api/Dockerfile",
+    "context": "../infra-team-test",
+    "health_check_path": "/WeatherForecast",
+    "environment": {"ASPNETCORE_ENVIRONMENT": "Development"},
+    "scaling": {"min_capacity": 2, "max_capacity": 4, "cpu_target": 60},
+}
+
+
+def service_specs(count):
+    specs = []
+    for i in range(count):
+        spec = {**TEMPLATE, "name": f"svc-{i:03d}"}
+        # make every other service public and link it to its predecessor
+        if i % 2:
+            spec["public"] = True
+            spec["environment"] = {"ApiAddress": f"http://{{svc-{i - 1:03d}}}/"}
+        specs.append(spec)
+    return specs
+
+
+def run_once(count, stack):
+    mocks, elapsed = evaluate(stack=stack, config={"pulumi-python:services": service_specs(count)})
+    return elapsed, len(mocks.resources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[2, 5, 10, 25, 50, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stack", default="dev")
+    args = parser.parse_args()
+
+    print(f"{'services':>8} {'resources':>9} {'median s':>9} {'min s':>7} {'ms/resource':>11}")
+    for count in args.counts:
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, resources = in_fresh_interpreter(run_once, count, args.stack)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        print(f"{count:>8} {resources:>9} {median:>9.3f} {min(timings):>7.3f} "
+              f"{1000 * median / resources:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Preview or update several stacks/regions at once with the Automation API
+
+    python -m tools.deploy preview dev staging prod-eu --workers 2
+    python -m tools.deploy up dev prod-eu:eu-west-1 --config-from dev
+    python -m tools.deploy preview dev --backend file://./.pulumi-state
+    python -m tools.deploy preview dev staging:us-west-2 --config-from dev --offline
+
+A target is `stack` or `stack:region`. `--config-from` creates a missing
+`Pulumi.<stack>.yaml` as a copy of another stack's file, with `aws:region`
+set to the target's region when it has one; everything that is regional
+(subnets, endpoints, log options) follows from it. A stack whose file
+already exists keeps its region, and a target naming another one is
+refused rather than rewriting the tracked file. Up to `--workers`
+stacks run at the same time, their engine output is streamed prefixed with
+the stack name, and a summary with timings is printed at the end.
+
+`--offline` evaluates each target under the mocks in `tools/mocks.py`
+instead, no credentials or Pulumi CLI needed, to check the targets before
+fanning out for real. It writes no files: a stack `--config-from` would
+create is evaluated with the config the copy would hold.
+"""
+
+import argparse
+import functools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+import yaml
+
+from tools.mocks import PROGRAM_DIR, evaluate, in_fresh_interpreter, load_stack_config
+
+OPERATIONS = ("preview", "up")
+
+
+@dataclass
+class Target:
+    stack: str
+    region: Optional[str] = None
+
+    @classmethod
+    def parse(cls, value):
+        stack, _, region = value.partition(":")
+        return cls(stack=stack, region=region or None)
+
+    def __str__(self):
+        return f"{self.stack}:{self.region}" if self.region else self.stack
+
+
+@dataclass
+class Result:
+    target: Target
+    ok: bool
+    seconds: float
+    summary: str
+
+
+# one writer at a time, so lines from different stacks don't interleave
+_output_lock = threading.Lock()
+
+
+def stream(target):
+    def write(line):
+        with _output_lock:
+            for part in line.rstrip("\n").splitlines() or [""]:
+                print(f"[{target.stack}] {part}", flush=True)
+    return write
+
+
+def stack_config_path(stack, program_dir=PROGRAM_DIR):
+    return os.path.join(program_dir, f"Pulumi.{stack}.yaml")
+
+
+def copy_stack_config(stack, source, program_dir=PROGRAM_DIR, region=None):
+    """Create `Pulumi.<stack>.yaml` from `source`'s file, in `region` when
+    given, unless it exists."""
+    path = stack_config_path(stack, program_dir)
+    if os.path.exists(path):
+        return False
+    with open(stack_config_path(source, program_dir)) as f:
+        config = yaml.safe_load(f) or {}
+    if region:
+        config["config"] = {**(config.get("config") or {}), "aws:region": region}
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return True
+
+
+def new_stack_config(target, source, program_dir=PROGRAM_DIR):
+    """The config `copy_stack_config` writes for `target`, as the flat map
+    `evaluate` takes."""
+    config = load_stack_config(source, program_dir)
+    if target.region:
+        config["aws:region"] = target.region
+    return config
+
+
+def prepare_targets(targets, config_from=None, program_dir=PROGRAM_DIR, create=True):
+    """Check every target against its stack file, then, with `create`, create
+    the missing files from `config_from`'s. Returns the stacks missing a file."""
+    missing = []
+    for target in targets:
+        if not os.path.exists(stack_config_path(target.stack, program_dir)):
+            if not config_from:
+                raise ValueError(f"no Pulumi.{target.stack}.yaml, pass --config-from to create it")
+            missing.append(target)
+            continue
+        region = load_stack_config(target.stack, program_dir).get("aws:region")
+        if target.region and target.region != region:
+            raise ValueError(f"Pulumi.{target.stack}.yaml deploys to {region}, not {target.region}: "
+                             "a region only applies to stacks --config-from creates")
+    for target in missing if create else ():
+        copy_stack_config(target.stack, config_from, program_dir, region=target.region)
+    return [target.stack for target in missing]
+
+
+def change_summary(changes):
+    return ", ".join(f"{count} {op}" for op, count in sorted((changes or {}).items()) if op != "same") \
+        or "no changes"
+
+
+def run_target(target, operation, backend=None, program_dir=PROGRAM_DIR):
+    """Select or create the target's stack and run `operation`."""
+    from pulumi import automation as auto
+
+    write = stream(target)
+    env_vars = {"PULUMI_BACKEND_URL": backend} if backend else None
+    start = time.perf_counter()
+    try:
+        stack = auto.create_or_select_stack(stack_name=target.stack, work_dir=str(program_dir),
+                                            opts=auto.LocalWorkspaceOptions(env_vars=env_vars))
+        if operation == "preview":
+            result = stack.preview(on_output=write)
+            summary = change_summary(result.change_summary)
+        else:
+            result = stack.up(on_output=write)
+            summary = change_summary(result.summary.resource_changes)
+    except auto.errors.CommandError as e:
+        write(str(e))
+        return Result(target, False, time.perf_counter() - start, "failed, see the output above")
+    return Result(target, True, time.perf_counter() - start, summary)
+
+
+def evaluate_target(target, program_dir=PROGRAM_DIR, config_from=None):
+    config = None
+    if config_from and not os.path.exists(stack_config_path(target.stack, program_dir)):
+        config = new_stack_config(target, config_from, program_dir)
+    mocks, elapsed = evaluate(stack=target.stack, config=config, program_dir=program_dir)
+    return len(mocks.resources), elapsed
+
+
+def run_target_offline(target, operation, backend=None, program_dir=PROGRAM_DIR, config_from=None):
+    """Evaluate the target under mocks in its own interpreter, the Pulumi
+    runtime keeps global state."""
+    write = stream(target)
+    start = time.perf_counter()
+    try:
+        resources, _ = in_fresh_interpreter(evaluate_target, target, program_dir, config_from)
+    except Exception as e:
+        write(f"{type(e).__name__}: {e}")
+        return Result(target, False, time.perf_counter() - start, "failed, see the output above")
+    write(f"evaluated {resources} resources offline")
+    return Result(target, True, time.perf_counter() - start, f"{resources} resources")
+
+
+def run_all(targets, operation, workers, runner=run_target, backend=None):
+    """Run `operation` on every target, at most `workers` at a time. Returns
+    the results in target order and the total wall-time."""
+    start = time.perf_counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(runner, target, operation, backend): target for target in targets}
+        for future in as_completed(futures):
+            result = future.result()
+            results[str(result.target)] = result
+            stream(result.target)(f"{'done' if result.ok else 'FAILED'} in {result.seconds:.1f}s: {result.summary}")
+    return [results[str(target)] for target in targets], time.perf_counter() - start
+
+
+def render_summary(results, elapsed, operation):
+    rows = [(str(r.target), "ok" if r.ok else "FAILED", f"{r.seconds:.1f}s", r.summary) for r in results]
+    widths = [max(len(row[i]) for row in rows + [("target", "result", "time", operation)]) for i in range(3)]
+    lines = [f"{'target':<{widths[0]}}  {'result':<{widths[1]}}  {'time':>{widths[2]}}  {operation}"]
+    lines += [f"{a:<{widths[0]}}  {b:<{widths[1]}}  {c:>{widths[2]}}  {d}" for a, b, c, d in rows]
+    sequential = sum(r.seconds for r in results)
+    lines.append(f"{len(results)} stacks in {elapsed:.1f}s ({sequential:.1f}s one after another)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("operation", choices=OPERATIONS)
+    parser.add_argument("targets", nargs="+", type=Target.parse, metavar="stack[:region]")
+    parser.add_argument("--workers", type=int, default=4, help="stacks running at the same time")
+    parser.add_argument("--config-from", metavar="STACK", help="create missing stack config files from this stack's")
+    parser.add_argument("--backend", help="state backend URL, e.g. file://./.pulumi-state")
+    parser.add_argument("--offline", action="store_true", help="evaluate under mocks instead")
+    args = parser.parse_args()
+
+    stacks = [target.stack for target in args.targets]
+    if len(set(stacks)) != len(stacks):
+        parser.error("every target needs its own stack")
+    try:
+        missing = prepare_targets(args.targets, args.config_from, create=not args.offline)
+    except ValueError as e:
+        parser.error(str(e))
+    for stack in missing:
+        if args.offline:
+            print(f"{stack}: evaluating a copy of Pulumi.{args.config_from}.yaml", file=sys.stderr)
+        else:
+            print(f"created Pulumi.{stack}.yaml from Pulumi.{args.config_from}.yaml", file=sys.stderr)
+
+    runner = functools.partial(run_target_offline, config_from=args.config_from) if args.offline else run_target
+    results, elapsed = run_all(args.targets, args.operation, max(1, args.workers), runner=runner,
+                               backend=args.backend)
+    print(render_summary(results, elapsed, "offline" if args.offline else args.operation))
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
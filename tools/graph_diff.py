@@ -0,0 +1,222 @@
+"""Markdown report of how a change moves the resource graph, evaluated offline
+
+    python -m tools.graph_diff --base origin/main                  # every Pulumi.<stack>.yaml
+    python -m tools.graph_diff --base origin/main --stack dev --output diff.md
+
+The program at `--base` (exported with `git archive`) and the working tree
+are both evaluated under the mocks in `tools/mocks.py`, and their graphs (see
+`tools/snapshot.py`) and stack outputs compared. The report lists what would
+be created, updated, replaced or deleted, grouped into services, task
+definitions and network, and which inputs force a replacement.
+
+A stack is skipped without evaluating anything when no program file, its
+stack config nor the requirements changed since `--base`, and left out of
+the report when its graph and outputs come out the same.
+
+Replacements are judged from a table of the inputs the AWS provider can't
+update in place; a replaced resource's dependents are not followed.
+"""
+
+import argparse
+import fnmatch
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from tools.mocks import PROGRAM_DIR, ProgramMocks, evaluate, in_fresh_interpreter, stack_region
+from tools.snapshot import GraphMonitor, build_graph
+
+# Inputs whose change makes the provider replace the resource, "*" for any input
+REPLACE_ON = {
+    "aws:ec2/vpc:Vpc": ("cidrBlock", "instanceTenancy"),
+    "aws:ec2/subnet:Subnet": ("cidrBlock", "availabilityZone", "vpcId"),
+    "aws:ec2/securityGroup:SecurityGroup": ("name", "description", "vpcId"),
+    "aws:ec2/natGateway:NatGateway": ("allocationId", "subnetId", "connectivityType"),
+    "aws:ec2/routeTableAssociation:RouteTableAssociation": ("subnetId",),
+    "aws:ec2/vpcEndpoint:VpcEndpoint": ("vpcId", "serviceName", "vpcEndpointType"),
+    "aws:lb/loadBalancer:LoadBalancer": ("name", "internal", "loadBalancerType"),
+    "aws:lb/targetGroup:TargetGroup": ("name", "port", "protocol", "targetType", "vpcId"),
+    "aws:lb/listenerRule:ListenerRule": ("listenerArn",),
+    "aws:ecs/cluster:Cluster": ("name",),
+    "aws:ecs/service:Service": ("name", "cluster", "launchType", "schedulingStrategy"),
+    # task definitions are immutable, every edit registers a new revision
+    "aws:ecs/taskDefinition:TaskDefinition": ("*",),
+    "aws:cloudwatch/logGroup:LogGroup": ("name",),
+    "aws:cloudwatch/dashboard:Dashboard": ("dashboardName",),
+    "aws:iam/role:Role": ("name",),
+    "aws:iam/policy:Policy": ("name", "description"),
+    "aws:appautoscaling/target:Target": ("resourceId", "scalableDimension", "serviceNamespace"),
+    "aws:appautoscaling/policy:Policy": ("name", "resourceId", "scalableDimension", "serviceNamespace"),
+    "aws:servicediscovery/httpNamespace:HttpNamespace": ("name",),
+    "awsx:ecr:Image": ("*",),
+}
+NETWORK_TYPES = ("aws:ec2/", "aws:lb/", "aws:servicediscovery/", "aws:cloudfront/")
+SERVICE_COMPONENT = "pulumi-python:ecs:FargateWebService"
+# What the program reads; anything else changing can't move the graph
+PROGRAM_FILES = ("*.py", "Pulumi.yaml", "requirements.txt")
+SYMBOLS = {"create": "+", "update": "~", "replace": "+-", "delete": "-"}
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=PROGRAM_DIR, check=True, capture_output=True).stdout
+
+
+def changed_files(base):
+    """Files differing between `base` and the working tree."""
+    return git("diff", "--name-only", base, "--").decode().split()
+
+
+def affects_stack(stack, files):
+    return any(fnmatch.fnmatch(path, pattern) for path in files
+               for pattern in PROGRAM_FILES + (f"Pulumi.{stack}.yaml",))
+
+
+def export_tree(ref, directory):
+    """Write the tree at `ref` into `directory`."""
+    with tarfile.open(fileobj=BytesIO(git("archive", "--format=tar", ref))) as archive:
+        archive.extractall(directory)
+
+
+def evaluate_stack(stack, program_dir):
+    """(graph, outputs) of the program in `program_dir`."""
+    mocks = ProgramMocks(region=stack_region(stack, program_dir=program_dir))
+    monitor = GraphMonitor(mocks)
+    evaluate(stack=stack, mocks=mocks, monitor=monitor, program_dir=program_dir)
+    return build_graph(monitor.registrations), mocks.outputs
+
+
+def evaluate_isolated(stack, program_dir):
+    """`evaluate_stack` in a fresh interpreter, the Pulumi runtime keeps global state."""
+    return in_fresh_interpreter(evaluate_stack, stack, Path(program_dir))
+
+
+def changed_inputs(old, new):
+    keys = set(old["inputs"]) | set(new["inputs"])
+    changed = sorted(key for key in keys if old["inputs"].get(key) != new["inputs"].get(key))
+    if old["parent"] != new["parent"]:
+        changed.append("(parent)")
+    return changed
+
+
+def forces_replacement(resource_type, inputs):
+    replace_on = REPLACE_ON.get(resource_type, ())
+    # a new parent is an alias away from the same resource, not an input
+    return [key for key in inputs if key != "(parent)" and ("*" in replace_on or key in replace_on)]
+
+
+def diff_graphs(base, head):
+    """`[(action, key, type, changed inputs, inputs forcing replacement)]`."""
+    changes = []
+    for key in sorted(set(base) | set(head)):
+        resource_type = key.split("::")[0]
+        if key not in base:
+            changes.append(("create", key, resource_type, [], []))
+        elif key not in head:
+            changes.append(("delete", key, resource_type, [], []))
+        else:
+            inputs = changed_inputs(base[key], head[key])
+            if not inputs:
+                continue
+            replacing = forces_replacement(resource_type, inputs)
+            changes.append(("replace" if replacing else "update", key, resource_type, inputs, replacing))
+    return changes
+
+
+def area(key, resource_type, graph):
+    """Which part of the report a resource goes in."""
+    parent = graph.get(key, {}).get("parent") or ""
+    if resource_type == "aws:ecs/taskDefinition:TaskDefinition":
+        return "Task definitions"
+    if resource_type == SERVICE_COMPONENT or parent.startswith(SERVICE_COMPONENT):
+        service = key if resource_type == SERVICE_COMPONENT else parent
+        return f"Service `{service.split('::')[1]}`"
+    if resource_type.startswith(NETWORK_TYPES):
+        return "Network"
+    return "Other"
+
+
+def short_type(resource_type):
+    """`aws:ecs/service:Service` -> `ecs:Service`"""
+    package, _, rest = resource_type.partition(":")
+    module, _, name = rest.partition(":")
+    return f"{module.split('/')[0]}:{name}" if package == "aws" else resource_type
+
+
+def render_report(stack, changes, base_graph, head_graph, base_outputs, head_outputs):
+    counts = {action: sum(1 for change in changes if change[0] == action) for action in SYMBOLS}
+    lines = [f"### `{stack}`", "",
+             ", ".join(f"{count} to {action}" for action, count in counts.items() if count) or "no resource changes",
+             ""]
+    sections = {}
+    for action, key, resource_type, inputs, replacing in changes:
+        graph = base_graph if action == "delete" else head_graph
+        detail = ", ".join(f"**{name}**" if name in replacing else name for name in inputs)
+        sections.setdefault(area(key, resource_type, graph), []).append(
+            f"| `{SYMBOLS[action]}` | {key.split('::')[1]} | {short_type(resource_type)} | {detail} |")
+    order = sorted(sections, key=lambda name: (not name.startswith("Service"), name != "Task definitions",
+                                               name != "Network", name))
+    for name in order:
+        lines += [f"**{name}**", "", "| | resource | type | changed inputs |", "|---|---|---|---|",
+                  *sections[name], ""]
+    if any(change[0] == "replace" for change in changes):
+        lines += ["Inputs in **bold** force a replacement.", ""]
+
+    output_changes = [(name, base_outputs.get(name), head_outputs.get(name))
+                      for name in sorted(set(base_outputs) | set(head_outputs))
+                      if base_outputs.get(name) != head_outputs.get(name)]
+    if output_changes:
+        lines += ["**Stack outputs**", "", "| output | base | change |", "|---|---|---|"]
+        lines += [f"| {name} | {old or ''} | {new or '(removed)'} |" for name, old, new in output_changes]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def stacks_in(program_dir):
+    return sorted(path.name[len("Pulumi."):-len(".yaml")] for path in Path(program_dir).glob("Pulumi.*.yaml"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", required=True, help="git ref to compare against, e.g. origin/main")
+    parser.add_argument("--stack", action="append", help="stack to compare, repeatable (default: all)")
+    parser.add_argument("--output", help="write the markdown here instead of stdout")
+    args = parser.parse_args()
+
+    files = changed_files(args.base)
+    reports, skipped = [], []
+    with tempfile.TemporaryDirectory(prefix="graph-diff-base-") as base_dir:
+        exported = False
+        for stack in args.stack or stacks_in(PROGRAM_DIR):
+            if not affects_stack(stack, files):
+                skipped.append(stack)
+                continue
+            if not exported:
+                export_tree(args.base, base_dir)
+                exported = True
+            if not (Path(base_dir) / f"Pulumi.{stack}.yaml").exists():
+                base_graph, base_outputs = {}, {}
+            else:
+                base_graph, base_outputs = evaluate_isolated(stack, base_dir)
+            head_graph, head_outputs = evaluate_isolated(stack, PROGRAM_DIR)
+            changes = diff_graphs(base_graph, head_graph)
+            if not changes and base_outputs == head_outputs:
+                skipped.append(stack)
+                continue
+            reports.append(render_report(stack, changes, base_graph, head_graph, base_outputs, head_outputs))
+
+    report = "\n".join(["## Resource graph changes", "", *reports] if reports else
+                       ["## Resource graph changes", "", "No stack changes."])
+    if skipped:
+        report += "\n" + f"Unchanged: {', '.join(f'`{stack}`' for stack in skipped)}\n"
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""Load-test a local stand-in of the deployed services
+
+    python -m tools.loadtest render                       # write .loadtest/docker-compose.yml
+    python -m tools.loadtest run --profile 30s@5,60s@20,60s@50
+    python -m tools.loadtest run --target web-ui=/ --output results.json --keep
+
+Builds a docker-compose project from the stack's `services` specs: every
+service from its Dockerfile and context, with its task's cpu and memory as
+container limits and its desired count (or `scaling.min_capacity`) as
+replicas, and an nginx `alb` container standing in for the load balancers:
+one server per service on its listener port, balancing over the replicas
+with keep-alive upstreams. `{service}` links in the environment resolve to
+the stand-in ALB, as they resolve to the real ALB in AWS.
+
+`run` brings the project up, waits for each target's health path through
+the proxy, then drives each stage of the profile (`duration@concurrency`,
+closed loop: every worker sends its next request when the last one
+returned) and reports throughput, errors, p50/p95/p99 latency and the peak
+cpu and memory of the busiest container (from `docker stats`). It ends with
+what to carry back into the stack config: the `requests_per_target` each
+service would hold within its p99 alarm threshold, for `scaling`, and the
+smallest Fargate task size that fits its peak usage, for `task`.
+
+Images are built for the host: an ARM64 task on an x86 machine would run
+emulated and say nothing about its real latency.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import re
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import yaml
+
+from tools.mocks import PROGRAM_DIR, load_stack_config
+
+if str(PROGRAM_DIR) not in sys.path:
+    sys.path.insert(0, str(PROGRAM_DIR))
+
+from containers import FARGATE_MEMORY, task_settings  # noqa: E402
+from monitoring import alarm_settings  # noqa: E402
+from scaling import scaling_settings  # noqa: E402
+from service import LINK_PATTERN, ServiceSpec  # noqa: E402
+
+WORK_DIR = PROGRAM_DIR / ".loadtest"
+PROXY = "alb"
+PROXY_IMAGE = "nginx:1.25-alpine"
+STAGE = re.compile(r"^(\d+)s@(\d+)$")
+MEMORY = re.compile(r"^([\d.]+)\s*([KMG]i?B|B)")
+MEBIBYTES = {"B": 2 ** -20, "KiB": 2 ** -10, "KB": 2 ** -10, "MiB": 1, "MB": 1, "GiB": 2 ** 10, "GB": 2 ** 10}
+# seconds between docker stats samples during a stage
+SAMPLE_INTERVAL = 5
+# Share of the measured capacity to target, the rest is headroom for scale-out
+TARGET_UTILIZATION = 0.7
+
+
+def load_specs(stack):
+    raw = json.loads(load_stack_config(stack).get("pulumi-python:services", "[]"))
+    return [ServiceSpec.from_config(service) for service in raw]
+
+
+def host_port(listener_port):
+    """Where a listener is published on localhost, ports below 1024 moved up."""
+    return listener_port if listener_port >= 1024 else 8000 + listener_port
+
+
+def replicas(spec):
+    scaling = scaling_settings(spec.name, spec.scaling)
+    return scaling["min_capacity"] if scaling else spec.desired_count
+
+
+def nginx_config(specs):
+    blocks = []
+    for spec in specs:
+        upstream = spec.name.replace("-", "_")
+        blocks.append(f"""
+upstream {upstream} {{
+    server {spec.name}:{spec.container_port};
+    keepalive 32;
+}}
+server {{
+    listen {spec.listener_port};
+    location / {{
+        proxy_pass http://{upstream};
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host $host;
+    }}
+}}""")
+    return "events {}\nhttp {\n    access_log off;" + "".join(blocks).replace("\n", "\n    ") + "\n}\n"
+
+
+def compose_project(specs):
+    """The docker-compose document for `specs`."""
+    addresses = {spec.name: f"{PROXY}:{spec.listener_port}" for spec in specs}
+    services = {}
+    for spec in specs:
+        task, _ = task_settings(spec.name, spec.task, spec.container)
+        environment = {key: LINK_PATTERN.sub(lambda match: addresses[match.group(1)], str(value))
+                       for key, value in spec.environment.items()}
+        services[spec.name] = {
+            "build": {
+                "context": str((PROGRAM_DIR / spec.context).resolve()),
+                "dockerfile": str((PROGRAM_DIR / spec.dockerfile).resolve()),
+                "args": spec.build_args,
+                **({"target": spec.build_target} if spec.build_target else {}),
+            },
+            "environment": environment,
+            "cpus": task["cpu"] / 1024,
+            "mem_limit": f"{task['memory']}m",
+            "deploy": {"replicas": replicas(spec)},
+        }
+    services[PROXY] = {
+        "image": PROXY_IMAGE,
+        "volumes": ["./nginx.conf:/etc/nginx/nginx.conf:ro"],
+        "ports": [f"127.0.0.1:{host_port(spec.listener_port)}:{spec.listener_port}" for spec in specs],
+        "depends_on": [spec.name for spec in specs],
+    }
+    return {"name": "pulumi-python-loadtest", "services": services}
+
+
+def render(specs, work_dir=WORK_DIR):
+    work_dir.mkdir(exist_ok=True)
+    (work_dir / "nginx.conf").write_text(nginx_config(specs))
+    path = work_dir / "docker-compose.yml"
+    path.write_text(yaml.safe_dump(compose_project(specs), sort_keys=False))
+    return path
+
+
+def compose(path, *args):
+    subprocess.run(["docker", "compose", "-f", str(path), *args], check=True)
+
+
+@dataclass
+class Stage:
+    duration: int
+    concurrency: int
+
+    @classmethod
+    def parse_profile(cls, value):
+        stages = []
+        for part in value.split(","):
+            match = STAGE.match(part.strip())
+            if not match:
+                raise argparse.ArgumentTypeError(f"stage '{part}' is not <seconds>s@<concurrency>")
+            stages.append(cls(duration=int(match.group(1)), concurrency=int(match.group(2))))
+        return stages
+
+
+def parse_stats(lines):
+    """`(cpu units, memory MiB)` per container from `docker stats --format
+    '{{json .}}'` lines. 100% CPU is one host core, 1024 Fargate cpu units."""
+    usage = []
+    for line in lines:
+        if not line.strip():
+            continue
+        stats = json.loads(line)
+        cpu = float(stats["CPUPerc"].rstrip("%")) / 100 * 1024
+        match = MEMORY.match(stats["MemUsage"].strip())
+        memory = float(match.group(1)) * MEBIBYTES[match.group(2)] if match else 0.0
+        usage.append((cpu, memory))
+    return usage
+
+
+def container_usage(path, service):
+    ids = subprocess.run(["docker", "compose", "-f", str(path), "ps", "-q", service],
+                         check=True, capture_output=True, text=True).stdout.split()
+    if not ids:
+        return []
+    output = subprocess.run(["docker", "stats", "--no-stream", "--format", "{{json .}}", *ids],
+                            check=True, capture_output=True, text=True).stdout
+    return parse_stats(output.splitlines())
+
+
+class UsageSampler:
+    """Peak cpu and memory of any one of a service's containers while the
+    block runs, sampled every `SAMPLE_INTERVAL` seconds."""
+
+    def __init__(self, path, service):
+        self.path, self.service = path, service
+        self.cpu = self.memory = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            try:
+                for cpu, memory in container_usage(self.path, self.service):
+                    self.cpu, self.memory = max(self.cpu or 0, cpu), max(self.memory or 0, memory)
+            except (OSError, subprocess.CalledProcessError):
+                pass
+            if self._stop.wait(SAMPLE_INTERVAL):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def peak(self):
+        return {"cpu": self.cpu, "memory": self.memory}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def wait_healthy(port, path, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", path)
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(2)
+    raise TimeoutError(f"127.0.0.1:{port}{path} not healthy after {timeout}s")
+
+
+def drive(port, path, stage):
+    """Closed-loop load on `path` for one stage, returns the stage's result."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + stage.duration
+
+    def worker():
+        nonlocal errors
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 500
+            except OSError:
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            if ok:
+                mine.append(time.perf_counter() - start)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(stage.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "duration": stage.duration,
+        "concurrency": stage.concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def passing_stages(spec, results):
+    """The stages whose p99 and errors stay within the service's alarm thresholds."""
+    alarms = alarm_settings(spec.name, spec.alarms)
+    return [result for result in results
+            if not result["errors"] and (alarms["response_time_p99"] is None
+                                         or result["p99"] <= alarms["response_time_p99"])]
+
+
+def recommendation(spec, results):
+    """`requests_per_target` for the busiest stage whose p99 and errors stay
+    within the service's alarm thresholds, or None."""
+    passing = passing_stages(spec, results)
+    if not passing:
+        return None
+    best = max(passing, key=lambda result: result["throughput"])
+    # ALBRequestCountPerTarget is counted per target per minute
+    return int(best["throughput"] / replicas(spec) * 60 * TARGET_UTILIZATION)
+
+
+def size_recommendation(spec, results):
+    """The smallest Fargate `(cpu, memory)` whose share at `TARGET_UTILIZATION`
+    covers the peak usage of the stages within the alarm thresholds, or None
+    without usage samples."""
+    sampled = [result for result in passing_stages(spec, results) if result.get("cpu") is not None]
+    if not sampled:
+        return None
+    cpu = max(result["cpu"] for result in sampled) / TARGET_UTILIZATION
+    memory = max(result["memory"] for result in sampled) / TARGET_UTILIZATION
+    return next(((task_cpu, task_memory) for task_cpu, sizes in sorted(FARGATE_MEMORY.items()) if task_cpu >= cpu
+                 for task_memory in sizes if task_memory >= memory), None)
+
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def format_usage(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def report(name, results):
+    lines = [f"{name}: {'secs':>5} {'conc':>5} {'req/s':>8} {'errors':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+             f"{'cpu':>5} {'mem MiB':>7}"]
+    for r in results:
+        lines.append(f"{'':{len(name)}}  {r['duration']:>5} {r['concurrency']:>5} {r['throughput']:>8.1f} "
+                     f"{r['errors']:>7} {format_ms(r['p50']):>7} {format_ms(r['p95']):>7} {format_ms(r['p99']):>7} "
+                     f"{format_usage(r.get('cpu')):>5} {format_usage(r.get('memory')):>7}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("render", "run", "down"))
+    parser.add_argument("--stack", default="dev")
+    parser.add_argument("--profile", type=Stage.parse_profile, default=Stage.parse_profile("30s@5,60s@20,60s@50"),
+                        help="comma-separated <seconds>s@<concurrency> stages")
+    parser.add_argument("--target", action="append", default=[], metavar="SERVICE=PATH",
+                        help="service and path to load, repeatable (default: every service's health check path)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--keep", action="store_true", help="leave the project running after the run")
+    args = parser.parse_args()
+
+    specs = load_specs(args.stack)
+    path = render(specs)
+    if args.command == "render":
+        print(f"wrote {path.relative_to(PROGRAM_DIR)}", file=sys.stderr)
+        return 0
+    if args.command == "down":
+        compose(path, "down", "--remove-orphans")
+        return 0
+
+    by_name = {spec.name: spec for spec in specs}
+    targets = dict(target.split("=", 1) for target in args.target) or \
+        {spec.name: spec.health_check_path for spec in specs}
+    unknown = set(targets) - set(by_name)
+    if unknown:
+        parser.error(f"unknown services {sorted(unknown)}")
+
+    compose(path, "up", "--detach", "--build", "--wait")
+    results = {}
+    try:
+        for name, target_path in targets.items():
+            port = host_port(by_name[name].listener_port)
+            wait_healthy(port, by_name[name].health_check_path)
+            results[name] = []
+            for stage in args.profile:
+                with UsageSampler(path, name) as sampler:
+                    result = drive(port, target_path, stage)
+                results[name].append({**result, **sampler.peak()})
+            print(report(name, results[name]), flush=True)
+    finally:
+        if not args.keep:
+            compose(path, "down", "--remove-orphans")
+
+    print("\nsuggested scaling.requests_per_target (70% of what held the p99 alarm threshold):")
+    for name, service_results in results.items():
+        value = recommendation(by_name[name], service_results)
+        print(f"  {name}: {value if value is not None else 'no stage within the p99 threshold'}")
+    print("\nsuggested task size (peak cpu and memory of those stages at 70%):")
+    for name, service_results in results.items():
+        size = size_recommendation(by_name[name], service_results)
+        print(f"  {name}: " + (f"cpu {size[0]}, memory {size[1]}" if size else "no usage samples within the threshold"))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Evaluate the Pulumi program offline with `pulumi.runtime.set_mocks`
+
+Nothing here talks to AWS or the Pulumi service: resource registrations are
+answered by `ProgramMocks`, which echoes the inputs back as outputs and fills
+in the few computed attributes the program reads (ids, ARNs, DNS names, the
+pushed image URI), and `get_availability_zones`, `get_managed_prefix_list` and
+`ecr.get_image` return fixed values.
+"""
+
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pulumi
+import yaml
+
+PROGRAM_DIR = Path(__file__).resolve().parent.parent
+PROJECT = "pulumi-python"
+DEFAULT_REGION = "us-east-2"
+
+# Inputs the providers take as objects but report back as JSON strings
+JSON_PROPERTIES = ("assumeRolePolicy", "policy")
+
+
+class ProgramMocks(pulumi.runtime.Mocks):
+    def __init__(self, region=DEFAULT_REGION, zone_count=3):
+        self.region = region
+        self.zones = [f"{region}{chr(ord('a') + i)}" for i in range(zone_count)]
+        self.resources = []
+        self.calls = []
+        # stack outputs, filled in by `evaluate`
+        self.outputs = {}
+
+    def new_resource(self, args):
+        self.resources.append({
+            "type": args.typ,
+            "name": args.name,
+            "custom": args.custom,
+            "inputs": args.inputs,
+        })
+        state = dict(args.inputs)
+        for key in JSON_PROPERTIES:
+            if isinstance(state.get(key), dict):
+                state[key] = json.dumps(state[key])
+        state.setdefault("name", args.name)
+        state.setdefault("arn", f"arn:aws:mock:{self.region}::{args.name}")
+        if args.typ == "awsx:ecr:Repository":
+            state["url"] = f"000000000000.dkr.ecr.{self.region}.amazonaws.com/{args.name}"
+        elif args.typ == "awsx:ecr:Image":
+            state["imageUri"] = f"000000000000.dkr.ecr.{self.region}.amazonaws.com/{args.name}:latest"
+        elif args.typ == "aws:lb/loadBalancer:LoadBalancer":
+            state["dnsName"] = f"{args.name}.{self.region}.elb.amazonaws.com"
+            state["arnSuffix"] = f"app/{args.name}/0000"
+        elif args.typ == "aws:lb/targetGroup:TargetGroup":
+            state["arnSuffix"] = f"targetgroup/{args.name}/0000"
+        elif args.typ == "aws:cloudfront/distribution:Distribution":
+            state["domainName"] = f"{args.name}.cloudfront.net"
+        return f"{args.name}-id", state
+
+    def of_type(self, typ):
+        """`{name: inputs}` of the registered resources of type `typ`."""
+        return {resource["name"]: resource["inputs"] for resource in self.resources if resource["type"] == typ}
+
+    def find(self, typ, name):
+        """Inputs of resource `name` of type `typ`, KeyError if it wasn't registered."""
+        return self.of_type(typ)[name]
+
+    def call(self, args):
+        self.calls.append({"token": args.token, "args": args.args})
+        if args.token == "aws:index/getAvailabilityZones:getAvailabilityZones":
+            return {
+                "id": self.region,
+                "names": self.zones,
+                "zoneIds": [f"{self.region}-az{i + 1}" for i in range(len(self.zones))],
+            }
+        if args.token == "aws:index/getRegion:getRegion":
+            return {"id": self.region, "name": self.region}
+        if args.token == "aws:ecr/getImage:getImage":
+            return {**args.args, "id": args.args["repositoryName"], "imageSizeInBytes": 120 * 2 ** 20}
+        if args.token == "aws:ec2/getManagedPrefixList:getManagedPrefixList":
+            return {"id": "pl-00000000", "name": args.args.get("name"), "entries": []}
+        return {}
+
+
+def load_stack_config(stack, program_dir=PROGRAM_DIR):
+    """Read `Pulumi.<stack>.yaml` into the flat string map the runtime expects."""
+    path = Path(program_dir) / f"Pulumi.{stack}.yaml"
+    raw = {}
+    if path.exists():
+        raw = (yaml.safe_load(path.read_text()) or {}).get("config") or {}
+    return {key: value if isinstance(value, str) else json.dumps(value) for key, value in raw.items()}
+
+
+def stack_region(stack, config=None, program_dir=PROGRAM_DIR):
+    """The region `evaluate` mocks for `stack`, with `config` overrides applied."""
+    return {**load_stack_config(stack, program_dir), **(config or {})}.get("aws:region", DEFAULT_REGION)
+
+
+def in_fresh_interpreter(function, *args):
+    """Call `function(*args)` in a new interpreter and return its result. The
+    Pulumi runtime and the program's modules are process-wide, so evaluations
+    of different trees or configs must not share one."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def evaluate(stack="dev", config=None, mocks=None, monitor=None, program_dir=PROGRAM_DIR, preview=False):
+    """Run `__main__.py` under mocks and wait for every registration to settle.
+
+    `config` entries override the stack file, with structured values given as
+    plain Python objects. `monitor` replaces the default `MockMonitor`, e.g.
+    to see what the engine is sent. Returns the mocks (holding the registered
+    resources and the stack outputs) and the wall-time of the evaluation in
+    seconds.
+    """
+    # keep mocked zones and image fingerprints out of the caches real deployments read
+    os.environ["AZS_CACHE_DIR"] = tempfile.mkdtemp(prefix="az-cache-")
+    stack_config = load_stack_config(stack, program_dir)
+    images = json.loads(stack_config.get(f"{PROJECT}:images", "{}"))
+    stack_config[f"{PROJECT}:images"] = json.dumps({**images, "cache_dir": tempfile.mkdtemp(prefix="image-cache-")})
+    for key, value in (config or {}).items():
+        stack_config[key] = value if isinstance(value, str) else json.dumps(value)
+    mocks = mocks or ProgramMocks(region=stack_config.get("aws:region", DEFAULT_REGION))
+    pulumi.runtime.set_all_config(stack_config)
+    pulumi.runtime.set_mocks(mocks, project=PROJECT, stack=stack, preview=preview, monitor=monitor)
+
+    if str(program_dir) not in sys.path:
+        sys.path.insert(0, str(program_dir))
+
+    @pulumi.runtime.test
+    def run():
+        runpy.run_path(os.path.join(program_dir, "__main__.py"), run_name="__pulumi__")
+        # returning the exports makes the test runner wait for them
+        exports = pulumi.runtime.settings.get_root_resource().outputs
+        return pulumi.Output.all(**exports).apply(mocks.outputs.update)
+
+    start = time.perf_counter()
+    run()
+    return mocks, time.perf_counter() - start
@@ -0,0 +1,124 @@
+"""Golden snapshot of the resource graph, evaluated offline
+
+    python -m tools.snapshot                # compare with snapshots/<stack>.json
+    python -m tools.snapshot --update       # rewrite the golden file
+
+Evaluates `__main__.py` under the mocks in `tools/mocks.py`, so it needs no AWS
+credentials and runs in about a second. The graph records every resource's
+type, name, parent, the resources it depends on and its inputs. Any change to
+what the program declares shows up as a diff against the golden file, which
+is checked in next to the stack config it was built from.
+"""
+
+import argparse
+import difflib
+import json
+import sys
+
+from pulumi.runtime import rpc
+from pulumi.runtime.mocks import MockMonitor
+
+from tools.mocks import PROGRAM_DIR, ProgramMocks, evaluate, stack_region
+
+SNAPSHOT_DIR = PROGRAM_DIR / "snapshots"
+# Inputs holding JSON documents, parsed so diffs are per field
+JSON_INPUTS = ("containerDefinitions", "policy", "assumeRolePolicy", "dashboardBody")
+
+
+class GraphMonitor(MockMonitor):
+    """MockMonitor that also keeps what the engine would see: the parent and
+    dependencies of each registration."""
+
+    def __init__(self, mocks):
+        super().__init__(mocks)
+        self.registrations = {}
+
+    def RegisterResource(self, request):
+        response = super().RegisterResource(request)
+        if request.type != "pulumi:pulumi:Stack":
+            self.registrations[response.urn] = {
+                "type": request.type,
+                "name": request.name,
+                "parent": request.parent,
+                "dependencies": list(request.dependencies),
+                "inputs": rpc.deserialize_properties(request.object),
+            }
+        return response
+
+
+def normalize(value):
+    """Integral floats back to ints (the wire format only has doubles),
+    dicts sorted."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: normalize(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def resource_key(registration):
+    return f"{registration['type']}::{registration['name']}"
+
+
+def build_graph(registrations):
+    """`{type::name: {parent, dependencies, inputs}}` from GraphMonitor registrations."""
+    keys = {urn: resource_key(registration) for urn, registration in registrations.items()}
+    graph = {}
+    for urn, registration in registrations.items():
+        inputs = dict(registration["inputs"])
+        for key in JSON_INPUTS:
+            if isinstance(inputs.get(key), str):
+                inputs[key] = json.loads(inputs[key])
+        graph[keys[urn]] = {
+            "parent": keys.get(registration["parent"]),
+            "dependencies": sorted({keys[dep] for dep in registration["dependencies"] if dep in keys}),
+            "inputs": normalize(inputs),
+        }
+    return dict(sorted(graph.items()))
+
+
+def evaluate_graph(stack="dev", config=None, program_dir=PROGRAM_DIR):
+    """Evaluate the program offline and return (graph, seconds)."""
+    mocks = ProgramMocks(region=stack_region(stack, config, program_dir))
+    monitor = GraphMonitor(mocks)
+    _, elapsed = evaluate(stack=stack, config=config, mocks=mocks, monitor=monitor, program_dir=program_dir)
+    return build_graph(monitor.registrations), elapsed
+
+
+def render(graph):
+    return json.dumps(graph, indent=2) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stack", default="dev")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden file")
+    args = parser.parse_args()
+
+    graph, elapsed = evaluate_graph(args.stack)
+    path = SNAPSHOT_DIR / f"{args.stack}.json"
+    print(f"evaluated {len(graph)} resources offline in {elapsed * 1000:.0f} ms", file=sys.stderr)
+
+    current = render(graph)
+    if args.update:
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(current)
+        print(f"wrote {path.relative_to(PROGRAM_DIR)}", file=sys.stderr)
+        return 0
+    if not path.exists():
+        print(f"no golden file at {path.relative_to(PROGRAM_DIR)}, run with --update", file=sys.stderr)
+        return 1
+    golden = path.read_text()
+    if golden == current:
+        print("resource graph matches the golden file", file=sys.stderr)
+        return 0
+    sys.stdout.writelines(difflib.unified_diff(golden.splitlines(True), current.splitlines(True),
+                                               f"{path.name} (golden)", f"{path.name} (program)"))
+    print("resource graph changed, review the diff and run with --update if intended", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
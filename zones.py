@@ -0,0 +1,74 @@
+"""Availability-zone lookup that avoids the `get_availability_zones` invoke when it can
+
+Zones come from, in order:
+1. `pinned` in the `availability_zones` stack config, which never calls AWS and
+   keeps previews reproducible;
+2. an on-disk cache keyed by region and zone state, younger than `cache_ttl`
+   seconds (`AZS_CACHE_DIR`, default `.az-cache`);
+3. the `get_availability_zones` invoke, whose result refreshes the cache.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from pulumi_aws import get_availability_zones
+
+import profiling
+
+CACHE_DIR_ENV_VAR = "AZS_CACHE_DIR"
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+
+def cache_path(cache_dir, region, state):
+    return Path(cache_dir) / f"azs-{region}-{state}.json"
+
+
+def read_cache(path, ttl, now=None):
+    """Cached zone names, or None when missing, unreadable or older than `ttl`."""
+    if ttl <= 0 or not path.exists():
+        return None
+    try:
+        entry = json.loads(path.read_text())
+    except ValueError:
+        return None
+    now = time.time() if now is None else now
+    if now - entry.get("fetched_at", 0) > ttl:
+        return None
+    return entry.get("names")
+
+
+def write_cache(path, names, now=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"fetched_at": time.time() if now is None else now, "names": names}))
+    tmp.replace(path)
+
+
+def resolve_availability_zones(region, state, count, pinned=None, cache_ttl=DEFAULT_CACHE_TTL,
+                               cache_dir=None, invoke=None):
+    """Return the first `count` zone names of `region` in `state`.
+
+    `invoke` defaults to `get_availability_zones` and is only called when the
+    zones are neither pinned nor cached.
+    """
+    if count < 1:
+        raise ValueError(f"availability_zones.count must be at least 1, got {count}")
+
+    if pinned:
+        names = list(pinned)
+    else:
+        path = cache_path(cache_dir or os.environ.get(CACHE_DIR_ENV_VAR, ".az-cache"), region, state)
+        names = read_cache(path, cache_ttl)
+        if names is None:
+            with profiling.span("invoke", "aws:index/getAvailabilityZones"):
+                names = list((invoke or get_availability_zones)(state=state).names)
+            if cache_ttl > 0:
+                write_cache(path, names)
+
+    if len(names) < count:
+        raise ValueError(
+            f"availability_zones.count is {count} but only {len(names)} zones are available "
+            f"in {region}: {names}")
+    return names[:count]